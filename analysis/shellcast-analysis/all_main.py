@@ -0,0 +1,142 @@
+"""
+Project: ShellCast NC, SC and FL in one run
+Downloads and decodes PQPF once and runs the state analyses concurrently.
+"""
+
+import argparse
+import os
+import sys
+from functools import partial
+from pathlib import Path
+
+shellcast_analysis_dir = str(Path().absolute().parents[1])
+script_dir = str(Path(Path().absolute(), "src"))
+sys.path.append(script_dir)
+
+import setup_logging  # noqa: E402
+
+STATE = "ALL"
+
+setup_logging.create_log_files(STATE)
+setup_logging.setup_logger(STATE)
+
+import logging  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+
+import telemetry  # noqa: E402
+import utils  # noqa: E402
+from constants import PQPF_JOBS  # noqa: E402
+from fl_pqpf.fl_pqpf import FLPQPF  # noqa: E402
+from fl_pqpf.tp_xmrg import TPXMRG  # noqa: E402
+from management import DirectoryConfig, NotificationConfig  # noqa: E402
+from multi_state import SharedPQPF, run_states  # noqa: E402
+from nc_pqpf.nc_pqpf import NCPQPF  # noqa: E402
+from notifications import DevEmailNotificationFL, EmailNotification  # noqa: E402
+from sc_pqpf.sc_pqpf import SCPQPF  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+PROCESSORS = {"NC": NCPQPF, "SC": SCPQPF, "FL": FLPQPF}
+
+
+def notify(state, dir_config):
+    notification_config = NotificationConfig(state)
+    if notification_config.notifications_enabled:
+        try:
+            email_notify_inst = EmailNotification(
+                dir_config, notification_config, state, prob_only_today=state == "FL"
+            )
+            dir_config.pipeline.stage(
+                "notify", email_notify_inst.send, deps=["aggregate", "persist"]
+            )
+        except Exception as e:
+            logger.error(f"{state} --- failed to send email notification: {str(e)}")
+    else:
+        logger.info(f"Notifications are disabled for {state} in configuration")
+
+    if state == "FL" and notification_config.dev_send_email:
+        try:
+            dir_config.pipeline.stage(
+                "notify.dev",
+                DevEmailNotificationFL(dir_config, notification_config).send,
+                deps=["aggregate"],
+            )
+        except Exception as e:
+            logger.error(f"Failed to send developer email notification: {str(e)}")
+
+
+def run_state(state, pqpf, dir_config, cubes):
+    logger.info(f"{'-' * 10} {state} {'-' * 10}")
+    utils.db_connection_test(pqpf.connect_str)
+    if state == "FL":
+        pqpf.prepare()
+    pqpf.process(cubes)
+    dir_config.artifacts.join()
+    notify(state, dir_config)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NC, SC and FL ShellCast analysis")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=PQPF_JOBS,
+        help="Worker processes for PQPF forecast hours (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--states",
+        nargs="+",
+        choices=list(PROCESSORS),
+        default=list(PROCESSORS),
+        help="States to run (default: all)",
+    )
+    args = parser.parse_args()
+    telemetry.start_run(
+        STATE, os.path.join(setup_logging.LOGS_DIR, STATE.lower(), "reports")
+    )
+
+    logger.info(f"{'=' * 50}")
+    logger.info(f"\tStart ShellCast Analysis ({', '.join(args.states)})")
+    logger.info(f"{'=' * 50}")
+    # DB connection information in analysis_settings.ini
+    db = "gcp.mysql"
+
+    dir_configs = {
+        state: DirectoryConfig(state, db, jobs=args.jobs) for state in args.states
+    }
+    processors = {state: PROCESSORS[state](dir_configs[state]) for state in args.states}
+
+    with ThreadPoolExecutor(max_workers=1) as tp_pool:
+        # FL total precipitation does not depend on PQPF; run it alongside
+        tp_future = None
+        if "FL" in args.states:
+            tp_future = tp_pool.submit(TPXMRG("FL", 7).main)
+
+        shared = SharedPQPF(
+            processors[args.states[0]].procs, args.states, jobs=args.jobs
+        )
+        to_db_bool, cubes = shared.ingest()
+        if tp_future is not None:
+            try:
+                tp_future.result()
+            except (Exception, SystemExit) as e:
+                logger.error(f"FL total precipitation failed, FL skipped: {e!r}")
+                processors.pop("FL")
+
+    if to_db_bool:
+        tasks = {
+            state: partial(
+                run_state, state, processors[state], dir_configs[state], cubes
+            )
+            for state in processors
+        }
+        results = run_states(tasks)
+        for state, ok in results.items():
+            logger.info(f"{state} --- {'done' if ok else 'FAILED'}")
+    else:
+        logger.info(
+            f"Raw GRB files date is not today. {'!' * 5} DATA NOT SAVED IN DATABASE {'!' * 5}"
+        )
+
+    # ---------------------
+    logger.info(f"{'=' * 50}")
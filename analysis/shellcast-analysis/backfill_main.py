@@ -0,0 +1,112 @@
+"""
+Project: ShellCast historical backfill
+Reprocesses a range of past days from archived PQPF/XMRG inputs in parallel worker
+processes (see src/backfill.py).
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+from pathlib import Path
+
+shellcast_analysis_dir = str(Path().absolute().parents[1])
+script_dir = str(Path(Path().absolute(), "src"))
+sys.path.append(script_dir)
+
+import setup_logging  # noqa: E402
+
+STATE = "BACKFILL"
+
+setup_logging.create_log_files(STATE)
+setup_logging.setup_logger(STATE)
+
+import logging  # noqa: E402
+
+import backfill  # noqa: E402
+import telemetry  # noqa: E402
+import utils  # noqa: E402
+from constants import BACKFILL_WORKERS  # noqa: E402
+from management import DirectoryConfig  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ShellCast historical backfill")
+    parser.add_argument("start", type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+    parser.add_argument(
+        "end", type=date.fromisoformat, help="Last day, included (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--archive",
+        required=True,
+        help="Archive directory with pqpf/ and xmrg/ GRB files",
+    )
+    parser.add_argument(
+        "--states",
+        nargs="+",
+        choices=list(backfill.PROCESSORS),
+        default=list(backfill.PROCESSORS),
+        help="States to run (default: all)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BACKFILL_WORKERS,
+        help="Days processed in parallel (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not save to the database"
+    )
+    args = parser.parse_args()
+    telemetry.start_run(
+        STATE, os.path.join(setup_logging.LOGS_DIR, STATE.lower(), "reports")
+    )
+
+    days = backfill.date_range(args.start, args.end)
+    logger.info(f"{'=' * 50}")
+    logger.info(
+        f"\tBackfill {args.start} - {args.end} ({len(days)} days, "
+        f"{', '.join(args.states)})"
+    )
+    logger.info(f"{'=' * 50}")
+    # DB connection information in analysis_settings.ini
+    db = "gcp.mysql"
+    if not args.no_save:
+        for state in args.states:
+            utils.db_connection_test(DirectoryConfig(state, db).connect_str)
+
+    run_day = partial(
+        backfill.run_day,
+        states=args.states,
+        archive_dir=args.archive,
+        db=db,
+        save=not args.no_save,
+    )
+    results = {}
+    # The first day runs alone: it builds the shared caches (grid indices,
+    # coverage weights, layer caches, XMRG warp index) the other days reuse
+    if days:
+        results[days[0]] = run_day(days[0])
+    if len(days) > 1:
+        with ProcessPoolExecutor(
+            max_workers=max(1, args.workers),
+            initializer=setup_logging.setup_logger,
+            initargs=(STATE,),
+        ) as pool:
+            futures = {day: pool.submit(run_day, day) for day in days[1:]}
+            for day, future in futures.items():
+                try:
+                    results[day] = future.result()
+                except (Exception, SystemExit) as e:
+                    logger.error(f"{day} failed: {e!r}")
+                    results[day] = {state: False for state in args.states}
+
+    for day, states in results.items():
+        failed = [state for state, ok in states.items() if not ok]
+        logger.info(f"{day} --- {'FAILED ' + ', '.join(failed) if failed else 'done'}")
+
+    # ---------------------
+    logger.info(f"{'=' * 50}")
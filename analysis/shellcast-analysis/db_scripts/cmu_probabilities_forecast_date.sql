@@ -0,0 +1,48 @@
+-- Adds the (unit, forecast_date) key used by the bulk loader (src/db_load.py).
+-- Run once against each state database. utils.save_df_to_db() falls back to
+-- DeleteCmuProbsToday() + INSERT while the column is missing.
+--
+-- forecast_date is written by the analysis with every row; the DATE(created)
+-- filters of the stored procedures and the web apps keep working.
+
+-- NC: one row per cmu_name and day
+USE shellcast_nc;
+SET SQL_SAFE_UPDATES = 0;
+ALTER TABLE cmu_probabilities ADD COLUMN forecast_date date NULL AFTER prob_3d_perc;
+UPDATE cmu_probabilities SET forecast_date = DATE(created);
+-- Keep the latest row of a unit and day
+DELETE p1 FROM cmu_probabilities p1
+JOIN cmu_probabilities p2
+  ON p1.cmu_name = p2.cmu_name AND p1.forecast_date = p2.forecast_date AND p1.id < p2.id;
+ALTER TABLE cmu_probabilities
+  MODIFY forecast_date date NOT NULL DEFAULT (CURRENT_DATE),
+  ADD UNIQUE KEY uq_unit_forecast_date (cmu_name, forecast_date);
+SET SQL_SAFE_UPDATES = 1;
+
+-- SC: one row per lease_id and day
+USE shellcast_sc;
+SET SQL_SAFE_UPDATES = 0;
+ALTER TABLE cmu_probabilities ADD COLUMN forecast_date date NULL AFTER prob_3d_perc;
+UPDATE cmu_probabilities SET forecast_date = DATE(created);
+-- Keep the latest row of a unit and day
+DELETE p1 FROM cmu_probabilities p1
+JOIN cmu_probabilities p2
+  ON p1.lease_id = p2.lease_id AND p1.forecast_date = p2.forecast_date AND p1.id < p2.id;
+ALTER TABLE cmu_probabilities
+  MODIFY forecast_date date NOT NULL DEFAULT (CURRENT_DATE),
+  ADD UNIQUE KEY uq_unit_forecast_date (lease_id, forecast_date);
+SET SQL_SAFE_UPDATES = 1;
+
+-- FL: one row per cmu_id and day
+USE shellcast_fl;
+SET SQL_SAFE_UPDATES = 0;
+ALTER TABLE cmu_probabilities ADD COLUMN forecast_date date NULL AFTER prob_1d_perc;
+UPDATE cmu_probabilities SET forecast_date = DATE(created);
+-- Keep the latest row of a unit and day
+DELETE p1 FROM cmu_probabilities p1
+JOIN cmu_probabilities p2
+  ON p1.cmu_id = p2.cmu_id AND p1.forecast_date = p2.forecast_date AND p1.id < p2.id;
+ALTER TABLE cmu_probabilities
+  MODIFY forecast_date date NOT NULL DEFAULT (CURRENT_DATE),
+  ADD UNIQUE KEY uq_unit_forecast_date (cmu_id, forecast_date);
+SET SQL_SAFE_UPDATES = 1;
@@ -88,8 +88,10 @@ CREATE TABLE cmu_probabilities (
   id int AUTO_INCREMENT PRIMARY KEY,
   cmu_id varchar(10) NOT NULL,
   prob_1d_perc tinyint NULL,
+  forecast_date date NOT NULL DEFAULT (CURRENT_DATE),
   created datetime DEFAULT NOW(),
-  FOREIGN KEY (cmu_id) REFERENCES cmus(id)
+  FOREIGN KEY (cmu_id) REFERENCES cmus(id),
+  UNIQUE KEY uq_unit_forecast_date (cmu_id, forecast_date)
 );
 
 -- Stored procedures
@@ -79,7 +79,9 @@ CREATE TABLE cmu_probabilities (
   prob_1d_perc tinyint NULL,
   prob_2d_perc tinyint NULL,
   prob_3d_perc tinyint NULL,
-  created datetime DEFAULT NOW()
+  forecast_date date NOT NULL DEFAULT (CURRENT_DATE),
+  created datetime DEFAULT NOW(),
+  UNIQUE KEY uq_unit_forecast_date (cmu_name, forecast_date)
 );
 
 
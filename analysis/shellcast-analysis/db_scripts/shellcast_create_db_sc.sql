@@ -81,8 +81,10 @@ CREATE TABLE cmu_probabilities (
   prob_1d_perc tinyint NULL,
   prob_2d_perc tinyint NULL,
   prob_3d_perc tinyint NULL,
-  created datetime DEFAULT NOW()
-  FOREIGN KEY (lease_id) REFERENCES leases(lease_id)
+  forecast_date date NOT NULL DEFAULT (CURRENT_DATE),
+  created datetime DEFAULT NOW(),
+  FOREIGN KEY (lease_id) REFERENCES leases(lease_id),
+  UNIQUE KEY uq_unit_forecast_date (lease_id, forecast_date)
 );
 
 
@@ -3,6 +3,8 @@ Project: ShellCast Florida
 Date: November 2023-2024
 """
 
+import argparse
+import os
 import sys
 from pathlib import Path
 
@@ -19,6 +21,8 @@ setup_logging.setup_logger(STATE)
 
 import logging  # noqa: E402
 
+import telemetry  # noqa: E402
+from constants import PQPF_JOBS  # noqa: E402
 from fl_pqpf.fl_pqpf import FLPQPF  # noqa: E402
 from fl_pqpf.tp_xmrg import TPXMRG  # noqa: E402
 from management import DirectoryConfig, NotificationConfig  # noqa: E402
@@ -27,6 +31,18 @@ from notifications import DevEmailNotificationFL, EmailNotification  # noqa: E40
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FL ShellCast analysis")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=PQPF_JOBS,
+        help="Worker processes for PQPF forecast hours (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    telemetry.start_run(
+        STATE, os.path.join(setup_logging.LOGS_DIR, STATE.lower(), "reports")
+    )
+
     logger.info(f"{'=' * 50}")
     logger.info("\tStart FL ShellCast Analysis")
     logger.info(f"{'=' * 50}")
@@ -38,11 +54,13 @@ if __name__ == "__main__":
     tpxmrg.main()
 
     # --- Directory configurations ---
-    dir_config = DirectoryConfig(STATE, db)
+    dir_config = DirectoryConfig(STATE, db, jobs=args.jobs)
 
     # # --- PQPF analysis ---
     pqpf = FLPQPF(dir_config)
     pqpf.main()
+    # CSV outputs are written in the background; wait before they are read
+    dir_config.artifacts.join()
 
     # --- Email notification ---
     notification_config = NotificationConfig(STATE)
@@ -53,7 +71,9 @@ if __name__ == "__main__":
             email_notify_inst = EmailNotification(
                 dir_config, notification_config, STATE, prob_only_today=True
             )
-            email_notify_inst.send()
+            dir_config.pipeline.stage(
+                "notify", email_notify_inst.send, deps=["aggregate", "persist"]
+            )
         except Exception as e:
             logger.error(f"Failed to send email notification: {str(e)}")
     else:
@@ -65,7 +85,9 @@ if __name__ == "__main__":
             dev_email_notify_inst = DevEmailNotificationFL(
                 dir_config, notification_config
             )
-            dev_email_notify_inst.send()
+            dir_config.pipeline.stage(
+                "notify.dev", dev_email_notify_inst.send, deps=["aggregate"]
+            )
 
         except Exception as e:
             logger.error(f"Failed to send developer email notification: {str(e)}")
@@ -1,5 +1,5 @@
 #!/bin/sh
-# Build cnvgrib (NCEPLIBS-grib_util) for Florida xmrg_proc.sh.
+# Build cnvgrib (NCEPLIBS-grib_util). Not needed by the Florida pipeline, which reads XMRG GRIB1 with GDAL.
 # Prefer: ./setup-florida-dev.sh --cnvgrib  (Homebrew deps + gfortran)
 #
 # Installs NOAA libraries under nceplibs/dependencies, then grib_util → nceplibs/bin/cnvgrib.
@@ -3,6 +3,8 @@ Project: ShellCast South Carolina
 Date: November 2022 - 2023
 """
 
+import argparse
+import os
 import sys
 from pathlib import Path
 
@@ -19,6 +21,8 @@ setup_logging.setup_logger(STATE)
 
 import logging  # noqa: E402
 
+import telemetry  # noqa: E402
+from constants import PQPF_JOBS  # noqa: E402
 from management import DirectoryConfig, NotificationConfig  # noqa: E402
 from notifications import EmailNotification
 from sc_pqpf.sc_pqpf import SCPQPF  # noqa: E402
@@ -26,6 +30,18 @@ from sc_pqpf.sc_pqpf import SCPQPF  # noqa: E402
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SC ShellCast analysis")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=PQPF_JOBS,
+        help="Worker processes for PQPF forecast hours (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    telemetry.start_run(
+        STATE, os.path.join(setup_logging.LOGS_DIR, STATE.lower(), "reports")
+    )
+
     logger.info(f"{'=' * 50}")
     logger.info("\tStart SC ShellCast Analysis")
     logger.info(f"{'=' * 50}")
@@ -33,11 +49,13 @@ if __name__ == "__main__":
     db = "gcp.mysql"
 
     # --- Directory configurations ---
-    dir_config = DirectoryConfig(STATE, db)
+    dir_config = DirectoryConfig(STATE, db, jobs=args.jobs)
 
     # --- PQPF analysis ---
     pqpf = SCPQPF(dir_config)
     pqpf.main()
+    # CSV outputs are written in the background; wait before they are read
+    dir_config.artifacts.join()
 
     # --- Email notification ---
     notification_config = NotificationConfig(STATE)
@@ -46,7 +64,9 @@ if __name__ == "__main__":
             email_notify_inst = EmailNotification(
                 dir_config, notification_config, STATE
             )
-            email_notify_inst.send()
+            dir_config.pipeline.stage(
+                "notify", email_notify_inst.send, deps=["aggregate", "persist"]
+            )
         except Exception as e:
             logger.error(f"Failed to send email notification: {str(e)}")
     else:
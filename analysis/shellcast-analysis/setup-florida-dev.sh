@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
-# Florida analysis dev setup — wgrib2 (required for NC/SC/FL PQPF crop + FL xmrg_proc.sh)
-# and optional Homebrew / cnvgrib helpers for xmrg_proc.sh.
+# Florida analysis dev setup — wgrib2 (required for NC/SC/FL PQPF crop)
+# and optional Homebrew / cnvgrib helpers (legacy; FL XMRG is now read in Python with GDAL).
 #
 # Run from anywhere:
 #   ./analysis/shellcast-analysis/setup-florida-dev.sh
@@ -62,8 +62,7 @@ After wgrib2 install, verify:
   ${INSTALL_PREFIX}/bin/wgrib2
   wgrib2 -version   # if ${INSTALL_PREFIX}/bin is on PATH
 
-Cron note: xmrg_proc.sh expects wgrib2 on PATH (/usr/local/bin is prepended).
-           pqpf_procs.py on macOS calls /usr/local/bin/wgrib2 explicitly.
+Cron note: pqpf_procs.py on macOS calls /usr/local/bin/wgrib2 explicitly.
 EOF
 }
 
@@ -187,7 +186,7 @@ install_cnvgrib_brew_deps() {
 
 install_brew_tools() {
   command -v brew >/dev/null 2>&1 || die "Homebrew required for --brew-tools / --all"
-  log "Installing CDO and GDAL (Florida xmrg_proc.sh)"
+  log "Installing CDO and GDAL"
   brew install cdo gdal
   install_cnvgrib_brew_deps
 }
@@ -0,0 +1,85 @@
+"""
+CSV artifacts of a state run.
+
+The processors pass DataFrames from sampling to the database write in memory. The
+CSV files (lease and CMU probabilities) are audit artifacts only: they are written
+by a background thread, off the path to the database, and a run waits for them
+with :meth:`CSVArtifacts.join` before anything that reads them (e.g. the FL
+developer email that attaches them).
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+def write_csv(df, fpath, **kwargs):
+    """
+    Write a DataFrame to CSV through a temporary file, so a reader never sees a
+    partially written file.
+
+    Args:
+        df (pd.DataFrame): Data
+        fpath (str): CSV file path
+        **kwargs: DataFrame.to_csv arguments (default index=False)
+
+    Returns (str): CSV file path
+    """
+    kwargs.setdefault("index", False)
+    tmp_path = f"{fpath}.tmp"
+    with telemetry.record(f"write_csv.{os.path.basename(fpath)}"):
+        df.to_csv(tmp_path, **kwargs)
+    os.replace(tmp_path, fpath)
+    return fpath
+
+
+class CSVArtifacts:
+    def __init__(self, enabled=True):
+        """
+        Background CSV writer.
+
+        Args:
+            enabled (bool): False skips the CSV artifacts entirely
+        """
+        self.enabled = enabled
+        self._executor = None
+        self._futures = {}
+
+    def write(self, df, fpath, **kwargs):
+        """
+        Queue a CSV write. The DataFrame is copied, so the caller may keep
+        modifying it.
+
+        Args:
+            df (pd.DataFrame): Data
+            fpath (str): CSV file path
+            **kwargs: DataFrame.to_csv arguments (default index=False)
+        """
+        if not self.enabled:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv")
+        self._futures[fpath] = self._executor.submit(
+            write_csv, df.copy(), fpath, **kwargs
+        )
+
+    def join(self):
+        """
+        Wait for the queued writes. A failed write is logged and does not fail the
+        run: the data is already in the database.
+
+        Returns (List[str]): Written CSV file paths
+        """
+        written = []
+        for fpath, future in self._futures.items():
+            try:
+                written.append(future.result())
+                logger.info(f"{os.path.basename(fpath)} --- created")
+            except Exception as e:
+                logger.error(f"{os.path.basename(fpath)} --- not written: {e!r}")
+        self._futures = {}
+        return written
@@ -0,0 +1,108 @@
+"""
+Historical backfill: reprocess past days from archived inputs.
+
+Each day of a date range is rerun like a daily all-states run, but the PQPF and
+XMRG GRB files are read from a local archive instead of NOAA's FTP sites and every
+date comes from the day being reprocessed instead of today. A day's outputs and
+stage checkpoints go to ``data/pqpf/backfill/<state>/<date>/`` and its database
+rows are keyed by that forecast date, so days run independently in worker
+processes.
+
+Archive layout:
+    <archive>/pqpf/pqpf_p24i_conus_<YYYYMMDD>06f030.grb, ... (raw PQPF GRB files)
+    <archive>/xmrg/xmrg<MMDDYYYYHH>z.grb, ... (decompressed hourly XMRG files)
+"""
+
+import logging
+import os
+from datetime import timedelta
+
+import constants as ct
+from fl_pqpf.fl_pqpf import FLPQPF
+from fl_pqpf.tp_xmrg import TPXMRG
+from management import DirectoryConfig
+from multi_state import SharedPQPF
+from nc_pqpf.nc_pqpf import NCPQPF
+from sc_pqpf.sc_pqpf import SCPQPF
+
+logger = logging.getLogger(__name__)
+
+PROCESSORS = {"NC": NCPQPF, "SC": SCPQPF, "FL": FLPQPF}
+BACKFILL_DIR = os.path.join(ct.PQPF_DATA_DIR, "backfill")
+# Day sums shared by the overlapping XMRG windows of the backfilled days
+TP_STORE_DIR = os.path.join(ct.TP_DATA_DIR, "fl", "backfill", "daily")
+
+
+def date_range(start, end):
+    """
+    Args:
+        start (datetime.date): First day
+        end (datetime.date): Last day (included)
+
+    Returns (List[datetime.date]):
+    """
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+def work_root(state, day):
+    """
+    Returns (str): Outputs, intermediate and run directory root of a state's day
+    """
+    return os.path.join(BACKFILL_DIR, state.lower(), day.isoformat())
+
+
+def run_day(day, states, archive_dir, db, save=True):
+    """
+    Reprocess one past day for several states (process pool worker).
+
+    Args:
+        day (datetime.date): Forecast date
+        states (List[str]): State abbreviations
+        archive_dir (str): Archive directory (see module docstring)
+        db (str): Database configuration section name
+        save (bool): Save the probabilities to the database when the state's
+            configuration does
+
+    Returns (dict): {state: True when the state finished}
+    """
+    logger.info(f"{'-' * 10} {day.isoformat()} {'-' * 10}")
+    dir_configs = {
+        state: DirectoryConfig(
+            state, db, jobs=1, run_date=day, work_root=work_root(state, day)
+        )
+        for state in states
+    }
+    processors = {state: PROCESSORS[state](dir_configs[state]) for state in states}
+    results = {state: False for state in states}
+    procs = processors[states[0]].procs
+    for pqpf in processors.values():
+        pqpf.save = pqpf.save and save
+
+    if "FL" in processors:
+        try:
+            TPXMRG(
+                "FL",
+                7,
+                run_date=day,
+                archive_dir=os.path.join(archive_dir, "xmrg"),
+                outputs_dir=dir_configs["FL"].tp_outputs_dir,
+                store_dir=TP_STORE_DIR,
+            ).main()
+        except (Exception, SystemExit) as e:  # error_process exits via SystemExit
+            logger.error(f"{day} FL total precipitation failed, FL skipped: {e!r}")
+            processors.pop("FL")
+
+    shared = SharedPQPF(procs, states, jobs=1)
+    cubes = shared.decode_archive(os.path.join(archive_dir, "pqpf"), day)
+    if not cubes:
+        logger.error(f"{day} --- no archived PQPF GRB files")
+        return results
+
+    for state, pqpf in processors.items():
+        try:
+            pqpf.process(cubes)
+            dir_configs[state].artifacts.join()
+            results[state] = True
+        except (Exception, SystemExit) as e:
+            logger.error(f"{day} {state} failed: {e!r}")
+    return results
@@ -19,6 +19,26 @@ PQPF_FTP_URL = "ftp.wpc.ncep.noaa.gov"
 PQPF_FTP_CWD = "pqpf/conus/pqpf_24hr/"
 TG_FTP_URL = "tgftp.nws.noaa.gov"
 TG_FTP_CWD = "data/rfc/serfc/misc/"
+FTP_MAX_WORKERS = 4
+FTP_RETRIES = 3
+# Download only the PQPF GRIB messages of the thresholds a run decodes
+GRB_BYTE_RANGES = True
+# Downloaded GRB files waiting for a subset-and-decode worker
+INGEST_QUEUE_SIZE = 1
+# Keep the intermediate GRB files in the subsets directories instead of RAM (debug)
+SPILL_INTERMEDIATES = False
+
+# [ Database ]
+# Rows per multi-row INSERT and transaction when saving probabilities
+DB_CHUNK_SIZE = 5000
+
+# [ Total precipitation (XMRG) ]
+TP_DST_SRS = "EPSG:4326"
+TP_AOI_BOUNDS = (-88, 24, -80, 31)  # FL (min lon, min lat, max lon, max lat)
+MM_TO_INCH = 0.03937
+# tp_{N}h as the trailing N hours before 7:00 AM instead of the oldest N hours of
+# the 6-day window (xmrg_proc.sh's timcumsum); changes the published FL probabilities
+TP_TRAILING_WINDOW = False
 
 # [ Regex Patterns]
 TODAY = datetime.today().strftime("%Y%m%d")
@@ -37,8 +57,14 @@ VALID_HOURS = ["f030", "f054", "f078"]
 PQPF_THRESHOLDS = [0.25, 0.5, 1, 1.5, 2.0, 2.5, 3, 4, 6, 8, 16]
 Z_RUN = "06"
 TO_HOUR = -6
+PQPF_JOBS = len(VALID_HOURS)  # Default worker processes, one per forecast hour
+BACKFILL_WORKERS = 4  # Days reprocessed in parallel by backfill_main.py
+# Append each day's PQPF cubes (and FL TP accumulations) to the state archive
+ARCHIVE_CUBES = True
 GRB_RES_X = 2539.703
 GRB_RES_Y = 2539.702
+# SC zonal means are taken on the PQPF grid upsampled by this factor (~25 m)
+SC_RESAMPLE_FACTOR = 100
 
 # VALID_HOURS = ['f024', 'f048', 'f072']
 # Z_RUN = '12'
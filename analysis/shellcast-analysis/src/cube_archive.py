@@ -0,0 +1,386 @@
+"""
+Archive of the daily PQPF cubes and FL TP accumulations.
+
+Only today's GRB files are kept in ``data/pqpf/raw``, so each run appends the
+probability cubes it decoded (and FL its tp_{hours}h accumulations) to the state's
+``archive`` directory, one directory per variable (e.g. ``pqpf_24h``, ``tp``) and
+one entry per forecast date:
+
+    <variable>/<YYYY-MM-DD>.tiles   each band cut into 64 x 64 float32 tiles,
+                                    zlib-compressed one by one
+    <variable>/<YYYY-MM-DD>.json    grid, band labels and tile byte offsets
+
+The file names are the date index. A time series of some leases or a CMU reads
+only the tiles under their cells from each day, so a year of history costs a few
+hundred small reads instead of decoding a year of full grids. Cubes decoded for
+several states (the union bounding box) are cropped to the state's own bounding
+box first.
+"""
+
+import json
+import logging
+import os
+import warnings
+import zlib
+from datetime import date
+
+import grid_index
+import numpy as np
+import pandas as pd
+from affine import Affine
+from pyproj import Transformer
+
+logger = logging.getLogger(__name__)
+
+TILE = 64
+TILES_SUFFIX = ".tiles"
+META_SUFFIX = ".json"
+
+
+def tile_counts(shape, tile=TILE):
+    """
+    Args:
+        shape (tuple[int, int]): Grid (height, width)
+        tile (int): Tile size in cells
+
+    Returns (tuple[int, int]): Tiles along y and x
+    """
+    return -(-shape[0] // tile), -(-shape[1] // tile)
+
+
+def encode_tiles(data, tile=TILE):
+    """
+    Cut bands into tiles and compress each one.
+
+    Args:
+        data (np.ndarray): Bands (band x y x x)
+        tile (int): Tile size in cells
+
+    Returns (tuple[bytes, List[int]]): Compressed tiles (band, tile row, tile
+        column order) and their byte offsets, with the end offset last
+    """
+    ny, nx = tile_counts(data.shape[1:], tile)
+    chunks, offsets = [], [0]
+    for band in data:
+        for ty in range(ny):
+            for tx in range(nx):
+                block = band[ty * tile : (ty + 1) * tile, tx * tile : (tx + 1) * tile]
+                chunk = zlib.compress(np.ascontiguousarray(block, "<f4").tobytes())
+                chunks.append(chunk)
+                offsets.append(offsets[-1] + len(chunk))
+    return b"".join(chunks), offsets
+
+
+def crop_window(transform, shape, crs, bounds):
+    """
+    Window of the grid cells covering a lon/lat box.
+
+    Args:
+        transform (affine.Affine): Grid affine transform
+        shape (tuple[int, int]): Grid (height, width)
+        crs (str): Grid CRS
+        bounds (tuple): Lon/lat box (west, south, east, north)
+
+    Returns (tuple[slice, slice]): Row and column slices, clipped to the grid
+    """
+    to_grid = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    # Densified edges: the box is curved on a projected grid
+    xmin, ymin, xmax, ymax = to_grid.transform_bounds(*bounds, densify_pts=21)
+    cols, rows = ~transform * (
+        np.array([xmin, xmax, xmin, xmax]),
+        np.array([ymin, ymin, ymax, ymax]),
+    )
+    row0 = min(max(int(np.floor(rows.min())), 0), shape[0])
+    col0 = min(max(int(np.floor(cols.min())), 0), shape[1])
+    row1 = max(min(int(np.ceil(rows.max())), shape[0]), row0)
+    col1 = max(min(int(np.ceil(cols.max())), shape[1]), col0)
+    return slice(row0, row1), slice(col0, col1)
+
+
+def band_position(bands, label):
+    """
+    Args:
+        bands (List[float]): Band labels (thresholds in inches, accumulation hours)
+        label (float): Band label to find
+
+    Returns (int): Position of the band, None when the day does not have it
+    """
+    matches = np.flatnonzero(np.isclose(np.asarray(bands, dtype="float64"), label))
+    return int(matches[0]) if len(matches) else None
+
+
+class CubeArchive:
+    def __init__(self, archive_dir):
+        """
+        Daily tiled archive of gridded variables.
+
+        Args:
+            archive_dir (str): Archive directory
+        """
+        self.archive_dir = archive_dir
+
+    def _paths(self, variable, day):
+        fpath = os.path.join(self.archive_dir, variable, str(day))
+        return f"{fpath}{TILES_SUFFIX}", f"{fpath}{META_SUFFIX}"
+
+    def append(self, day, variable, data, bands, transform, crs, nodata=None):
+        """
+        Store the bands of a variable for one day, replacing an earlier entry.
+
+        Args:
+            day (datetime.date or str): Forecast date (YYYY-MM-DD)
+            variable (str): Variable name (e.g. 'pqpf_24h')
+            data (np.ndarray): Bands (band x y x x) or one 2D band
+            bands (List[float]): Band labels
+            transform (affine.Affine): Grid affine transform
+            crs (str): Grid CRS
+            nodata (float): Nodata value, stored as NaN
+        """
+        data = np.asarray(data, dtype="float32")
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        if nodata is not None:
+            data = np.where(data == np.float32(nodata), np.nan, data)
+        tiles, offsets = encode_tiles(data)
+        tiles_path, meta_path = self._paths(variable, day)
+        os.makedirs(os.path.dirname(tiles_path), exist_ok=True)
+        meta = {
+            "bands": [float(band) for band in bands],
+            "transform": list(transform.to_gdal()),
+            "shape": list(data.shape[1:]),
+            "crs": crs,
+            "tile": TILE,
+            "offsets": offsets,
+        }
+        # Written through temporary files; the metadata last marks the entry as
+        # complete
+        tmp_path = f"{tiles_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as wf:
+            wf.write(tiles)
+        os.replace(tmp_path, tiles_path)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(meta, wf)
+        os.replace(tmp_path, meta_path)
+        logger.info(f"{variable} {day} --- archived ({len(offsets) - 1} tiles)")
+
+    def append_cubes(self, day, cubes, bounds=None):
+        """
+        Store a day's PQPF cubes as the pqpf_<hour label> variables.
+
+        Args:
+            day (datetime.date or str): Forecast date (YYYY-MM-DD)
+            cubes (dict): {hour label: PQPFCube}
+            bounds (tuple): Lon/lat box (west, south, east, north) to crop the cubes
+                to, the whole grid when None
+        """
+        for hour, cube in sorted(cubes.items()):
+            data, transform = cube.data, cube.transform
+            if bounds is not None:
+                rows, cols = crop_window(transform, cube.shape, cube.crs, bounds)
+                data = data[:, rows, cols]
+                transform = transform * Affine.translation(cols.start, rows.start)
+            self.append(
+                day,
+                f"pqpf_{hour}",
+                data,
+                cube.thresholds,
+                transform,
+                cube.crs,
+                cube.nodata,
+            )
+
+    def variables(self):
+        """Returns (List[str]): Archived variables"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.archive_dir)
+            if os.path.isdir(os.path.join(self.archive_dir, name))
+        )
+
+    def days(self, variable, start=None, end=None):
+        """
+        Archived dates of a variable.
+
+        Args:
+            variable (str): Variable name
+            start (datetime.date): First date, included
+            end (datetime.date): Last date, included
+
+        Returns (List[datetime.date]): Sorted dates
+        """
+        var_dir = os.path.join(self.archive_dir, variable)
+        if not os.path.isdir(var_dir):
+            return []
+        days = []
+        for fname in os.listdir(var_dir):
+            if fname.endswith(META_SUFFIX):
+                day = date.fromisoformat(fname[: -len(META_SUFFIX)])
+                if (start is None or day >= start) and (end is None or day <= end):
+                    days.append(day)
+        return sorted(days)
+
+    def meta(self, variable, day):
+        """Returns (dict): Grid, band labels and tile offsets of a day's entry"""
+        with open(self._paths(variable, day)[1], "r") as rf:
+            return json.load(rf)
+
+    def _read_tiles(self, variable, day, meta, band, keys):
+        """Decompress the tiles {(tile row, tile column)} of one band."""
+        height, width = meta["shape"]
+        tile = meta["tile"]
+        ny, nx = tile_counts((height, width), tile)
+        offsets = meta["offsets"]
+        tiles = {}
+        with open(self._paths(variable, day)[0], "rb") as rf:
+            for ty, tx in sorted(keys):
+                k = (band * ny + ty) * nx + tx
+                rf.seek(offsets[k])
+                buf = zlib.decompress(rf.read(offsets[k + 1] - offsets[k]))
+                shape = (min(tile, height - ty * tile), min(tile, width - tx * tile))
+                tiles[(ty, tx)] = np.frombuffer(buf, dtype="<f4").reshape(shape)
+        return tiles
+
+    def read_band(self, variable, day, label):
+        """
+        Full grid of one archived band.
+
+        Args:
+            variable (str): Variable name
+            day (datetime.date or str): Forecast date
+            label (float): Band label
+
+        Returns (np.ndarray): Band (float32, NaN for nodata)
+        """
+        meta = self.meta(variable, day)
+        band = band_position(meta["bands"], label)
+        if band is None:
+            raise KeyError(f"{variable} {day} has no band {label}")
+        height, width = meta["shape"]
+        tile = meta["tile"]
+        ny, nx = tile_counts((height, width), tile)
+        keys = [(ty, tx) for ty in range(ny) for tx in range(nx)]
+        out = np.empty((height, width), dtype="float32")
+        tiles = self._read_tiles(variable, day, meta, band, keys)
+        for (ty, tx), block in tiles.items():
+            out[
+                ty * tile : ty * tile + block.shape[0],
+                tx * tile : tx * tile + block.shape[1],
+            ] = block
+        return out
+
+    def sample(self, variable, label, cells, start=None, end=None):
+        """
+        Time series of one band at some cells, reading only the tiles under them.
+
+        Args:
+            variable (str): Variable name
+            label (float): Band label (threshold in inches, accumulation hours)
+            cells (callable): cells(transform, shape, crs) -> GridIndex of the
+                cells on a day's grid (e.g. a LeaseGridIndex load)
+            start (datetime.date): First date, included
+            end (datetime.date): Last date, included
+
+        Returns (tuple[List[datetime.date], np.ndarray]): Dates and values (date x
+            cell), NaN outside the grid and on days without the band
+        """
+        days = self.days(variable, start, end)
+        indices = {}
+        rows_out = []
+        for day in days:
+            meta = self.meta(variable, day)
+            grid = (tuple(meta["transform"]), tuple(meta["shape"]), meta["crs"])
+            if grid not in indices:
+                transform = Affine.from_gdal(*meta["transform"])
+                indices[grid] = cells(transform, tuple(meta["shape"]), meta["crs"])
+            index = indices[grid]
+            values = np.full(len(index.rows), np.nan, dtype="float64")
+            band = band_position(meta["bands"], label)
+            if band is not None and index.inside.any():
+                positions = np.flatnonzero(index.inside)
+                rows, cols = index.rows[positions], index.cols[positions]
+                tile = meta["tile"]
+                ty, tx = rows // tile, cols // tile
+                keys = set(zip(ty.tolist(), tx.tolist()))
+                tiles = self._read_tiles(variable, day, meta, band, keys)
+                for key, block in tiles.items():
+                    sel = (ty == key[0]) & (tx == key[1])
+                    values[positions[sel]] = block[rows[sel] % tile, cols[sel] % tile]
+            rows_out.append(values)
+        return days, np.vstack(rows_out) if rows_out else np.empty((0, 0))
+
+
+def lease_series(archive, lease_index, variable, label, leases, start=None, end=None):
+    """
+    Archived time series at some leases.
+
+    Args:
+        archive (CubeArchive): Archive
+        lease_index (grid_index.LeaseGridIndex): Lease index of the state
+        variable (str): Variable name (e.g. 'pqpf_24h', 'tp')
+        label (float): Band label (threshold in inches, accumulation hours)
+        leases (List[int]): Lease positions (shapefile row numbers)
+        start (datetime.date): First date, included
+        end (datetime.date): Last date, included
+
+    Returns (pd.DataFrame): Values by date (index) and lease position (columns)
+    """
+    positions = np.asarray(leases)
+
+    def cells(transform, shape, crs):
+        index = lease_index.load(transform, shape, crs=crs)
+        return grid_index.GridIndex(
+            index.rows[positions], index.cols[positions], index.inside[positions]
+        )
+
+    days, values = archive.sample(variable, label, cells, start, end)
+    return pd.DataFrame(
+        values.reshape(len(days), len(positions)),
+        index=pd.DatetimeIndex(days, name="date"),
+        columns=list(leases),
+    )
+
+
+def cmu_series(archive, lease_index, variable, label, cmus, start=None, end=None):
+    """
+    Archived time series of the mean over the leases of some CMUs.
+
+    Args:
+        archive (CubeArchive): Archive
+        lease_index (grid_index.LeaseGridIndex): Lease index grouped by CMU
+            (``group_col`` set)
+        variable (str): Variable name (e.g. 'pqpf_24h', 'tp')
+        label (float): Band label (threshold in inches, accumulation hours)
+        cmus (List[str]): CMU names
+        start (datetime.date): First date, included
+        end (datetime.date): Last date, included
+
+    Returns (pd.DataFrame): Mean values by date (index) and CMU (columns)
+    """
+    members = {}
+
+    def cells(transform, shape, crs):
+        index = lease_index.load(transform, shape, crs=crs)
+        if not members:
+            for cmu in cmus:
+                code = index.groups.index(cmu) if cmu in index.groups else -2
+                members[cmu] = np.flatnonzero(index.codes == code)
+        positions = np.concatenate([members[cmu] for cmu in cmus]).astype("int64")
+        return grid_index.GridIndex(
+            index.rows[positions], index.cols[positions], index.inside[positions]
+        )
+
+    days, values = archive.sample(variable, label, cells, start, end)
+    df = pd.DataFrame(index=pd.DatetimeIndex(days, name="date"))
+    start_col = 0
+    for cmu in cmus:
+        count = len(members.get(cmu, []))
+        block = values[:, start_col : start_col + count]
+        with warnings.catch_warnings():
+            # CMUs outside a day's grid: all-NaN mean
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            df[cmu] = np.nanmean(block, axis=1) if count else np.nan
+        start_col += count
+    return df
@@ -0,0 +1,131 @@
+"""
+Bulk loading of daily CMU probabilities.
+
+Each day's probabilities are upserted into ``cmu_probabilities`` with chunked
+multi-row ``INSERT ... ON DUPLICATE KEY UPDATE`` statements against the unique
+(unit, forecast_date) key added by ``db_scripts/cmu_probabilities_forecast_date.sql``.
+Rows of today that were not part of the load (e.g. a removed lease) are deleted at
+the end. The web apps always see a complete day: the previous run's values until
+a chunk commits, never an empty table between a delete and an insert.
+"""
+
+import logging
+from datetime import datetime
+
+import sqlalchemy as sa
+
+logger = logging.getLogger(__name__)
+
+TABLE = "cmu_probabilities"
+# Unit column per state: NC cmu_name, SC lease_id, FL cmu_id
+UNIT_COLUMNS = ("cmu_name", "lease_id", "cmu_id")
+FORECAST_DATE = "forecast_date"
+CREATED = "created"
+
+
+def unit_column(columns):
+    """
+    Unit column of a probability table.
+
+    Args:
+        columns (List[str]): DataFrame columns
+
+    Returns (str):
+    """
+    for column in UNIT_COLUMNS:
+        if column in columns:
+            return column
+    raise ValueError(f"No unit column ({', '.join(UNIT_COLUMNS)}) in {list(columns)}")
+
+
+def has_forecast_date(conn):
+    """True when cmu_probabilities has the forecast_date upsert key."""
+    columns = sa.inspect(conn).get_columns(TABLE)
+    return any(column["name"] == FORECAST_DATE for column in columns)
+
+
+def server_now(conn):
+    """
+    Current database server time (the same clock as the CURDATE() of the stored
+    procedures).
+
+    Returns (datetime):
+    """
+    now = conn.execute(sa.select(sa.func.now())).scalar()
+    if isinstance(now, str):  # SQLite
+        now = datetime.fromisoformat(now)
+    return now.replace(microsecond=0)
+
+
+def upsert_sql(dialect, columns, unit_col):
+    """
+    Upsert statement of one row, executed with a list of rows. PyMySQL rewrites
+    such an executemany into multi-row INSERTs (up to its max statement size).
+
+    Args:
+        dialect (str): SQLAlchemy dialect name ('mysql' or 'sqlite')
+        columns (List[str]): Inserted columns
+        unit_col (str): Unit column
+
+    Returns (str): SQL with named parameters
+    """
+    keys = (unit_col, FORECAST_DATE)
+    update_cols = [col for col in columns if col not in keys]
+    insert = (
+        f"INSERT INTO {TABLE} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(f':{col}' for col in columns)})"
+    )
+    if dialect == "sqlite":
+        updates = ", ".join(f"{col} = excluded.{col}" for col in update_cols)
+        return f"{insert} ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    updates = ", ".join(f"{col} = VALUES({col})" for col in update_cols)
+    return f"{insert} ON DUPLICATE KEY UPDATE {updates}"
+
+
+def upsert_probabilities(engine, df, created=None, chunk_size=5000):
+    """
+    Upsert a day's probabilities and delete that day's rows not in ``df``.
+
+    Args:
+        engine (sa.engine.Engine): Database engine
+        df (pd.DataFrame): Unit column and probability columns (one row per unit)
+        created (datetime): Run time; its date is the forecast date. Defaults to
+            the database server's current time.
+        chunk_size (int): Rows per INSERT statement and transaction
+
+    Returns (dict): Affected row counts {'upserted': ..., 'deleted': ...}. MySQL
+        counts an inserted row as 1 and an updated row as 2.
+    """
+    unit_col = unit_column(df.columns)
+    with engine.connect() as conn:
+        if created is None:
+            created = server_now(conn)
+    forecast_date = created.date()
+    columns = list(df.columns) + [FORECAST_DATE, CREATED]
+    stmt = sa.text(upsert_sql(engine.dialect.name, columns, unit_col))
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+
+    upserted = 0
+    for start in range(0, len(records), chunk_size):
+        rows = [
+            {**row, FORECAST_DATE: forecast_date, CREATED: created}
+            for row in records[start : start + chunk_size]
+        ]
+        with engine.begin() as conn:
+            result = conn.execute(stmt, rows)
+            upserted += max(result.rowcount, 0)
+
+    with engine.begin() as conn:
+        result = conn.execute(
+            sa.text(
+                f"DELETE FROM {TABLE} "
+                f"WHERE {FORECAST_DATE} = :forecast_date AND {CREATED} <> :created"
+            ),
+            {"forecast_date": forecast_date, "created": created},
+        )
+        deleted = max(result.rowcount, 0)
+    logger.info(
+        f"{len(records)} rows for {forecast_date}: {upserted} affected, "
+        f"{deleted} stale rows deleted"
+    )
+    return {"upserted": upserted, "deleted": deleted}
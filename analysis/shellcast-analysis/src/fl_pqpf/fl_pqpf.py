@@ -1,21 +1,26 @@
-import csv
 import logging.config
-import math
 import os
 import sys
 import warnings
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 import constants as ct
 import geopandas as gpd
+import grid_index
+import layer_cache
 import numpy as np
 import pandas as pd
-import rasterio
+import pipeline
+import pqpf_cube
+import telemetry
 import utils
+from cube_archive import CubeArchive
+from fl_pqpf import process_ab, season
+from fl_pqpf.tp_accum import read_accumulation_tiffs
 from pqpf_procs import PQPFProcs
 from shapely.errors import ShapelyDeprecationWarning
-from shapely.geometry import Point
 
 warnings.filterwarnings("ignore", category=ShapelyDeprecationWarning)
 
@@ -29,42 +34,6 @@ PQPF_PROC = "pqpf_proc_val"  # PQPF probability
 PQPF_CAT = "prob_1d_perc"
 
 
-def fl_qppf_threshold_generator(tp_accum):
-    if tp_accum == 0:
-        return 0
-    elif 0 < tp_accum <= 0.2:
-        return 0.2
-    elif 0.2 < tp_accum <= 0.5:
-        return 0.5
-    elif 0.5 < tp_accum <= 1:
-        return 1
-    elif 1 < tp_accum <= 1.5:
-        return 1.5
-    elif 1.5 < tp_accum <= 2:
-        return 2.0
-    elif 2 < tp_accum <= 2.5:
-        return 2.5
-    elif 2.5 < tp_accum <= 3:
-        return 3
-    elif 3 < tp_accum <= 4:
-        return 4
-    elif 4 < tp_accum <= 5:
-        return 5
-    elif 5 < tp_accum <= 6:
-        return 6
-    elif 6 < tp_accum <= 8:
-        return 8
-    elif 8 < tp_accum:
-        return 16
-
-
-def pqpf_threshold_stringify(num):
-    # if not Decimal(str(num)).as_integer_ratio()[1] == 1:
-    if float(num):
-        str_pqpf_threshold = str(num).replace(".", "p")
-        return str_pqpf_threshold
-
-
 class FLPQPF:
     def __init__(self, config_dirs):
         self.state = "FL"
@@ -72,11 +41,11 @@ class FLPQPF:
         self.fl_config = self.config[self.state]
         self.connect_str = config_dirs.connect_str
         self.grb_raw_dir = config_dirs.grb_raw_dir
-        self.tiffs_dir = config_dirs.tiffs_dir
         self.lease_shp = config_dirs.lease_shp
         self.intermediate_dir = config_dirs.intermediate_dir
         self.outputs_dir = config_dirs.outputs_dir
         self.date_today = config_dirs.date_today
+        self.created = config_dirs.created
 
         # ----- Total precipitation 1 hour accumulation directories -----
         logger.info(f"TP_DATA_DIR: {ct.TP_DATA_DIR}")
@@ -84,28 +53,20 @@ class FLPQPF:
         logger.info(f"tp_data_dir: {self.tp_data_dir}")
         self.tp_raw_dir = os.path.join(ct.TP_DATA_DIR, "raw")
         logger.info(f"tp_raw_dir: {self.tp_raw_dir}")
-        self.tp_intermediate_dir = utils.create_directory(
-            os.path.join(ct.TP_DATA_DIR, self.state.lower(), "intermediate"),
-            delete=True,
-        )
-        logger.info(f"tp_intermediate_dir: {self.tp_intermediate_dir}")
-        self.convert_to_grib2_dir = utils.create_directory(
-            os.path.join(self.tp_intermediate_dir, "cnvgrib2"), delete=True
-        )
-        logger.info(f"convert_to_grib2_dir: {self.convert_to_grib2_dir}")
-        self.tp_procs_dir = utils.create_directory(
-            os.path.join(self.tp_intermediate_dir, "procs"), delete=True
-        )
-        logger.info(f"tp_procs_dir: {self.tp_procs_dir}")
-        self.tp_outputs_dir = utils.create_directory(
-            os.path.join(ct.TP_DATA_DIR, self.state.lower(), "outputs")
-        )
+        self.tp_outputs_dir = utils.create_directory(config_dirs.tp_outputs_dir)
         logger.info(f"tp_outputs_dir: {self.tp_outputs_dir}")
 
+        self.lease_index = grid_index.LeaseGridIndex(
+            self.lease_shp, self.fl_config["LEASE_SHP_COL_CMU_NAME"]
+        )
+
         self.procs = PQPFProcs(config_dirs)
+        self.pipeline = config_dirs.pipeline
+        self.artifacts = config_dirs.artifacts
         # Use config value if save parameter is None, otherwise use the provided value
         self.save = self.config[f"{self.state}.SaveToDB"].getboolean("SAVE_TO_DB")
 
+    @telemetry.timed()
     def tp_accum_ras_values_to_pts(self):
         """
         Steps:
@@ -113,100 +74,77 @@ class FLPQPF:
         2. Calculate SHA rainfall thresholds minus Step 1.
         3. Get a PQPF threshold based on Step 2.
 
-        Returns:
+        Each lease's closure days select one layer of the accumulation stack, so
+        the accumulations of all leases are gathered in one indexed read.
+
+        Returns (gpd.GeoDataFrame): Leases ordered by closure days with the
+            TP_ACCUM, TP_CALC and PQPF_TH columns
         """
         logger.info("[Process A]")
-        gdf = gpd.read_file(self.lease_shp)
+        gdf = layer_cache.read_layer(self.lease_shp)
         gdf["days"] = gdf["days"].astype("int")  # Convert to int
         gdf["rain_in"] = gdf["rain_in"].astype("float")  # Convert to float
-        # df = pd.read_csv(os.path.join(os.path.dirname(self.lease_shp), 'fl_individual_leases_and_auz_pts.csv'))
-        uni_days = sorted(gdf["days"].unique())  # List[int]
-        tp_tiffs = utils.list_files(
-            self.tp_outputs_dir, "tif"
-        )  # [path to tp_24h.tif, path to tp_48h.tif, ...]
-
-        result_gdf = gpd.GeoDataFrame()
-        for day in uni_days:
-            gdf_q = gdf.query(f"days == {day}").copy()
-            coords = [(Point(i).x, Point(i).y) for i in gdf_q.geometry]
-
-            if day == 1:  # Day 1 means we need only pqpf forecasting value
-                gdf_q[TP_ACCUM] = 0
-            if 1 < day < 8:
-                # Subtract one for pqpf forecasting value to obtain later
-                hours = (day - 1) * 24
-                logger.info(f"{day} - {hours}")
-                for tp_tiff in tp_tiffs:
-                    if tp_tiff.endswith(f"_{hours}h.tif"):
-                        tp_tiff_fname = os.path.basename(tp_tiff)
-                        src = rasterio.open(tp_tiff)
-                        gdf_q[TP_ACCUM] = [x[0] for x in src.sample(coords)]
-                        logger.info(f"{tp_tiff_fname} --- raster values to points")
-
-            result_gdf = pd.concat([result_gdf, gdf_q])
-        # result_gdf[TP_CALC] = round(result_gdf[self.fl_config['LEASE_SHP_COL_RAIN_IN']].astype('float') - result_gdf[
-        #     TP_ACCUM], 1)
-        result_gdf[TP_CALC] = (
-            result_gdf[self.fl_config["LEASE_SHP_COL_RAIN_IN"]].astype("float")
-            - result_gdf[TP_ACCUM]
+        days = gdf["days"].to_numpy()
+
+        # [24, 48, ...] hours and the matching tp_{hours}h.tif bands
+        hours, stack, transform = read_accumulation_tiffs(self.tp_outputs_dir)
+        rows = cols = inside = None
+        if stack is not None:
+            index = self.lease_index.load(transform, stack.shape[1:], gdf=gdf)
+            rows, cols, inside = index.rows, index.cols, index.inside
+            logger.info(f"tp_{', '.join(str(h) for h in hours)}h --- layers")
+        gdf[TP_ACCUM] = process_ab.tp_accumulation(
+            days, hours, stack, rows, cols, inside
+        )
+        logger.info("TP accumulation raster values to points --- done")
+        gdf[TP_CALC] = (
+            gdf[self.fl_config["LEASE_SHP_COL_RAIN_IN"]].astype("float") - gdf[TP_ACCUM]
         )
         logger.info("[rain_in - raster value at point] --- calculated")
-        result_gdf[PQPF_TH] = result_gdf[TP_CALC].apply(fl_qppf_threshold_generator)
+        gdf[PQPF_TH] = process_ab.pqpf_thresholds(gdf[TP_CALC])
         logger.info("PQPF threshold --- assigned")
         logger.info(utils.done_str)
-        return result_gdf
+        # Leases grouped by closure days (index: shapefile row positions)
+        return gdf.iloc[np.argsort(days, kind="stable")]
 
-    def pqpf_ras_values_to_pts(self, df):
+    @telemetry.timed()
+    def pqpf_ras_values_to_pts(self, df, cube):
         """
         Steps:
         1. Set PQPF value to 1 where Process A's TP_CALC is negative.
         2. Get the rest of PQPF values of Process A's PQPF_TH
         Args:
             df (DataFrame): DataFrame from Process A
+            cube (PQPFCube): Today's PQPF cube with all thresholds (native grid)
 
         Returns:
-            DataFrame:
+            DataFrame: Leases with a PQPF value (negative TP_CALC first, then by
+                PQPF threshold), None when there are none
 
         """
         logger.info("[Process B]")
-        # gdf = gpd.read_file(self.lease_shp)
-        # result_gdf = gpd.GeoDataFrame()
-        thresholds = sorted(list(df[PQPF_TH].drop_duplicates()))
-        # thresholds = sorted(list(df[PQPF_TH].unique()))
-        pqpf_tiffs = utils.list_files(self.tiffs_dir, "tif")
-        df_to_concat = []
-
-        # Step 1
-        df.loc[df[TP_CALC] < 0, PQPF_PROC] = 1
-        dfq = df.query(f"{TP_CALC} < 0").copy()
-        if len(dfq.index) > 0:
-            df_to_concat.append(dfq)
-        logger.info(f"{len(dfq.index)} has negative value --- set to 1")
-
-        # Step 2
-        for threshold in thresholds:
-            if not math.isnan(threshold):
-                str_num = pqpf_threshold_stringify(threshold)
-                for pqpf_tiff in pqpf_tiffs:
-                    if pqpf_tiff.endswith(f"{str_num}.tif"):
-                        src = rasterio.open(pqpf_tiff)
-                        gdf_q = df.query(f"{PQPF_TH} == {threshold}").copy()
-                        coords = [(Point(i).x, Point(i).y) for i in gdf_q.geometry]
-                        gdf_q[PQPF_PROC] = [x[0] for x in src.sample(coords)]
-                        if len(gdf_q.index) > 0:
-                            df_to_concat.append(gdf_q)
-                            logger.info(
-                                f"{len(gdf_q.index)} rows from {os.path.basename(pqpf_tiff)}({threshold})"
-                            )
-                        # result_gdf = pd.concat([result_gdf, gdf_q])
-        if len(df_to_concat) > 0:
-            result_gdf = gpd.GeoDataFrame(pd.concat(df_to_concat, ignore_index=True))
-            # result_gdf.loc[result_gdf[TP_CALC] < 0, PQPF_PROC] = 1
+        # Leases projected once into the native PQPF grid CRS (cached index)
+        index = self.lease_index.load(cube.transform, cube.shape, crs=cube.crs)
+        positions = df.index.to_numpy()
+        values, order = process_ab.pqpf_probabilities(
+            df[TP_CALC],
+            df[PQPF_TH],
+            cube,
+            index.rows[positions],
+            index.cols[positions],
+            index.inside[positions],
+        )
+        negative = int((df[TP_CALC] < 0).sum())
+        logger.info(f"{negative} has negative value --- set to 1")
+        logger.info(f"{len(order) - negative} rows from {cube.name}")
+        if len(order) > 0:
+            result_gdf = df.iloc[order].assign(**{PQPF_PROC: values[order]})
             logger.info(utils.done_str)
-            return result_gdf
+            return gpd.GeoDataFrame(result_gdf.reset_index(drop=True))
 
     @staticmethod
-    def pqpf_probability_into_category(df, out_csv_path):
+    @telemetry.timed()
+    def pqpf_probability_into_category(df):
         """
         >= 0.9     Very High	5
         >= 0.75	High	    4
@@ -214,28 +152,39 @@ class FLPQPF:
         >= 0.25    Low	        2
         < 0.25	    Very Low    1
 
+        Args:
+            df (DataFrame): Leases with PQPF probabilities from Process B
+
+        Returns (DataFrame): Leases with their probability category (no geometry)
         """
         logger.info("[Categorize PQPF value group by lease]")
-        del df["geometry"]
+        df = pd.DataFrame(df.drop(columns="geometry"))
         condition_lst = utils.set_conditions_list(df[PQPF_PROC])
         df[PQPF_CAT] = np.select(condition_lst, ct.CATEGORY_LABELS)
         df[PQPF_CAT] = df[PQPF_CAT].round(0).astype(int)
-        df.to_csv(out_csv_path, index=False)
-        logger.info(f"{os.path.basename(out_csv_path)} --- created")
         logger.info(utils.done_str)
+        return df
 
-    def cmu_mean(self, df, csv_out_fpath):
+    @telemetry.timed()
+    def cmu_mean(self, df):
+        """
+        Categorize the mean PQPF probability of each CMU.
+
+        Args:
+            df (DataFrame): Leases with PQPF probabilities from Process B
+
+        Returns (DataFrame): cmu_id, prob_1d_perc and season columns
+        """
         logger.info("[Categorize PQPF value group by CMU]")
         df = df.rename(columns={self.fl_config["LEASE_SHP_COL_CMU_NAME"]: "cmu_id"})
-        s_arr = df.groupby(["cmu_id"])[PQPF_PROC].mean()
+        s_arr = df.groupby(["cmu_id"], observed=True)[PQPF_PROC].mean()
         new_df = pd.DataFrame(s_arr).reset_index()
         condition_lst = utils.set_conditions_list(new_df[PQPF_PROC])
         new_df[PQPF_CAT] = np.select(condition_lst, ct.CATEGORY_LABELS)
         new_df[PQPF_CAT] = new_df[PQPF_CAT].round(0).astype(int)
         new_df = new_df.drop([PQPF_PROC], axis=1)
         season_df = df[["cmu_id", "season"]].drop_duplicates()
-        joined_df = new_df.join(season_df.set_index("cmu_id"), on="cmu_id")
-        joined_df.to_csv(csv_out_fpath, index=False)
+        return new_df.join(season_df.set_index("cmu_id"), on="cmu_id")
 
     def check_tp_outputs(self):
         logger.info(f"Checking TP outputs in: {self.tp_outputs_dir}")
@@ -250,75 +199,164 @@ class FLPQPF:
             logger.info(f"Found {len(tiffs)} TIFF files")
         return True
 
-    def get_season_now(self, in_csv_fpath, out_csv_fpath):
+    @telemetry.timed()
+    def get_season_now(self, df):
         """
-        Create CSV file that contains cmu_id and prob_1d_perc columns based on the
-        season.
+        CMU probabilities based on the season: a CMU out of season gets 100. The
+        season strings are compiled once per lease layer into day-of-year masks
+        (see :mod:`fl_pqpf.season`).
         Args:
-            in_csv_fpath (str): Input CSV file path (all)
-            out_csv_fpath (str): Output CSV file path (only in season)-this is the
-                final output file, and this data will be saved to the database.
-
+            df (DataFrame): cmu_id, prob_1d_perc and season columns from
+                :meth:`cmu_mean`
+        Returns (DataFrame): cmu_id and prob_1d_perc columns (only in season)-this
+            data will be saved to the database.
         """
-        columns = ["cmu_id", "prob_1d_perc"]
-        with open(in_csv_fpath, "r") as rf:
-            reader = csv.reader(rf)
-            next(reader)
-            with open(out_csv_fpath, "w", newline="") as wf:
-                writer = csv.writer(wf)
-                writer.writerow(columns)
-                for row in reader:
-                    flag = False
-                    # e.g 1/1-12/31 or multiple like 4/1-6/30, 9/1-11/30
-                    dt_str_lst = row[2].strip("[]").split(", ")
-                    if dt_str_lst and len(dt_str_lst) > 0:
-                        for dt_str in dt_str_lst:
-                            dates = utils.convert_date_string(dt_str)
-                            if utils.is_season(
-                                self.date_today, dates["start"], dates["end"]
-                            ):
-                                flag = True
-                                break
-                    # cmu_id, prob_1d_perc, if not in season, assign 100
-                    writer.writerow([row[0], row[1]] if flag else [row[0], 100])
+        calendar = season.load_calendar(self.lease_shp)
+        flags = calendar.in_season(df["season"], self.date_today)
+        # cmu_id, prob_1d_perc, if not in season, assign 100
+        return pd.DataFrame(
+            {
+                "cmu_id": df["cmu_id"].to_numpy(),
+                PQPF_CAT: np.where(flags, df[PQPF_CAT].to_numpy(), 100),
+            }
+        )
 
-    def main(self):
-        start = datetime.now()
+    @telemetry.timed()
+    def prepare(self):
+        """
+        Check the TP accumulations and download the lease and CMU inputs.
+        """
         has_data = self.check_tp_outputs()
         if not has_data:
             logger.error("No TP outputs found")
             sys.exit(1)
-        utils.db_connection_test(self.connect_str)
         self.procs.get_input_files()
-        utils.delete_outdated_grbs(self.grb_raw_dir)
-        file_list = self.procs.get_files_to_download()
-        utils.download_grbs(
-            self.grb_raw_dir, file_list, ct.PQPF_FTP_URL, ct.PQPF_FTP_CWD
-        )
-        to_db_bool = self.procs.check_grb_files()
 
-        if to_db_bool:
-            date_str = self.date_today.strftime("%Y-%m-%d")
-            csv_lease_fpath = os.path.join(
-                self.outputs_dir, f"pqpf_lease_probs_season{date_str}.csv"
-            )
-            csv_cmu_tmp_fpath = os.path.join(
-                self.outputs_dir, f"pqpf_cmu_probs_tmp_{date_str}.csv"
+    def sample(self, cube):
+        """
+        Combine lease TP accumulations (Process A) with the PQPF forecast (Process B).
+
+        Args:
+            cube (PQPFCube): f030 PQPF cube on the native PQPF grid
+        Returns (gpd.GeoDataFrame): Leases with PQPF probabilities
+        """
+        accum_df = self.tp_accum_ras_values_to_pts()
+        return self.pqpf_ras_values_to_pts(accum_df, cube)
+
+    def archive(self, day, cube):
+        """
+        Append the day's PQPF cube and TP accumulations (variable 'tp', one band per
+        accumulation hours) to the FL archive.
+
+        Args:
+            day (str): Forecast date (YYYY-MM-DD)
+            cube (PQPFCube): f030 PQPF cube
+        """
+        self.procs.archive_cubes(day, {cube.hour: cube})
+        try:
+            hours, stack, transform = read_accumulation_tiffs(self.tp_outputs_dir)
+            if stack is not None:
+                CubeArchive(self.procs.archive_dir).append(
+                    day, "tp", stack, hours, transform, ct.TP_DST_SRS
+                )
+        except Exception as e:
+            logger.error(f"Archiving the TP accumulations failed: {e!r}")
+
+    def aggregate(self, pqpf_df, csv_lease_fpath, csv_cmu_tmp_fpath, csv_cmu_fpath):
+        """
+        Lease categories, CMU means and the in-season CMU probabilities.
+
+        Args:
+            pqpf_df (gpd.GeoDataFrame): Leases with PQPF probabilities
+            csv_lease_fpath (str): Lease probabilities CSV file path
+            csv_cmu_tmp_fpath (str): CMU probabilities CSV file path (all)
+            csv_cmu_fpath (str): CMU probabilities CSV file path (only in season)
+        Returns (dict): {CSV file path: DataFrame}
+        """
+        cmu_df = self.cmu_mean(pqpf_df)
+        return {
+            csv_lease_fpath: self.pqpf_probability_into_category(pqpf_df),
+            csv_cmu_tmp_fpath: cmu_df,
+            csv_cmu_fpath: self.get_season_now(cmu_df),
+        }
+
+    def process(self, cubes):
+        """
+        Combine TP accumulations with the PQPF forecast and save CMU probabilities.
+        Sampling, aggregation and the database insert are checkpointed stages. The
+        probabilities go to the database in memory; the CSV files are written in the
+        background.
+
+        Args:
+            cubes (dict): {hour label: PQPFCube} on the native PQPF grid covering the FL
+                leases
+        """
+        date_str = self.date_today.strftime("%Y-%m-%d")
+        csv_lease_fpath = os.path.join(
+            self.outputs_dir, f"pqpf_lease_probs_season{date_str}.csv"
+        )
+        csv_cmu_tmp_fpath = os.path.join(
+            self.outputs_dir, f"pqpf_cmu_probs_tmp_{date_str}.csv"
+        )
+        csv_cmu_fpath = os.path.join(self.outputs_dir, f"pqpf_cmu_probs_{date_str}.csv")
+
+        cube = cubes[pqpf_cube.hour_label(ct.VALID_HOURS[0])]
+        cube_key = pipeline.digest(cube)
+        tp_tiffs = utils.list_files(self.tp_outputs_dir, "tif")
+        pqpf_df = self.pipeline.stage(
+            "sample",
+            partial(self.sample, cube),
+            params={"cube": cube_key},
+            files=pipeline.shapefile_files(self.lease_shp) + tp_tiffs,
+        )
+        if ct.ARCHIVE_CUBES:
+            self.pipeline.stage(
+                "archive",
+                partial(self.archive, date_str, cube),
+                params={"date": date_str, "cube": cube_key},
+                files=tp_tiffs,
             )
-            csv_cmu_fpath = os.path.join(
-                self.outputs_dir, f"pqpf_cmu_probs_{date_str}.csv"
+        frames = self.pipeline.stage(
+            "aggregate",
+            partial(
+                self.aggregate,
+                pqpf_df,
+                csv_lease_fpath,
+                csv_cmu_tmp_fpath,
+                csv_cmu_fpath,
+            ),
+            params={"date": date_str},
+            deps=["sample"],
+        )
+        for fpath, df in frames.items():
+            self.artifacts.write(df, fpath)
+        if self.save:
+            self.pipeline.stage(
+                "persist",
+                partial(
+                    utils.save_df_to_db,
+                    self.connect_str,
+                    frames[csv_cmu_fpath],
+                    self.created,
+                ),
+                deps=["aggregate"],
             )
 
+    def main(self):
+        start = datetime.now()
+        self.prepare()
+        utils.db_connection_test(self.connect_str)
+        to_db_bool, cubes = self.pipeline.stage(
+            "ingest",
+            self.procs.ingest,
+            params={"date": self.date_today.isoformat()},
+            outputs=lambda _: utils.get_raw_grb_list(self.grb_raw_dir),
+            checkpoint_if=lambda result: result[0],
+        )
+
+        if to_db_bool:
             # Process data
-            self.procs.small_grb()
-            self.procs.grb_to_tiff_all()
-            accum_df = self.tp_accum_ras_values_to_pts()
-            pqpf_df = self.pqpf_ras_values_to_pts(accum_df)
-            self.pqpf_probability_into_category(pqpf_df, csv_lease_fpath)
-            self.cmu_mean(pqpf_df, csv_cmu_tmp_fpath)
-            self.get_season_now(csv_cmu_tmp_fpath, csv_cmu_fpath)
-            if self.save:
-                utils.save_to_db(self.connect_str, csv_cmu_fpath)
+            self.process(cubes)
 
         stop = datetime.now()
         utils.calculate_duration(start, stop)
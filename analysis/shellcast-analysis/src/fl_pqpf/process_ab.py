@@ -0,0 +1,116 @@
+"""
+Vectorized FL Process A/B.
+
+Process A subtracts the rainfall already accumulated over a lease's closure window
+(``tp_{hours}h``) from its rain threshold and bins the remainder to a PQPF
+threshold. Process B reads the probability of that threshold at the lease from the
+PQPF cube, or 1 when the accumulation already exceeds the rain threshold.
+
+Both processes work on whole arrays: every lease's closure days map to one band of
+the accumulation stack and every PQPF threshold to one band of the cube, so each
+process is a single indexed read instead of a loop over days and thresholds.
+"""
+
+import numpy as np
+import raster_sampling
+
+# Upper bounds of the remaining rainfall (in) bins and their PQPF thresholds
+TP_CALC_BOUNDS = np.array([0.2, 0.5, 1, 1.5, 2, 2.5, 3, 4, 5, 6, 8], dtype="float64")
+PQPF_THRESHOLDS = np.array(
+    [0.2, 0.5, 1, 1.5, 2, 2.5, 3, 4, 5, 6, 8, 16], dtype="float64"
+)
+# Closure days with an accumulation layer of (days - 1) * 24 hours
+MAX_DAYS = 7
+
+
+def pqpf_thresholds(tp_calc):
+    """
+    PQPF threshold of the remaining rainfall (rain_in - tp_accum) of each lease.
+        0           0
+        (0, 0.2]    0.2
+        (0.2, 0.5]  0.5
+        ...
+        (6, 8]      8
+        > 8         16
+    Negative and missing values have no threshold (NaN).
+
+    Args:
+        tp_calc (array-like): Remaining rainfall in inches
+
+    Returns (np.ndarray): PQPF threshold per lease
+    """
+    tp_calc = np.asarray(tp_calc, dtype="float64")
+    idx = np.searchsorted(TP_CALC_BOUNDS, tp_calc, side="left")
+    binned = PQPF_THRESHOLDS[np.minimum(idx, len(PQPF_THRESHOLDS) - 1)]
+    with np.errstate(invalid="ignore"):
+        return np.where(tp_calc > 0, binned, np.where(tp_calc == 0, 0.0, np.nan))
+
+
+def accumulation_layers(days, layer_hours):
+    """
+    Accumulation layer of each lease's closure days: the (days - 1) * 24 hour
+    accumulation for 2 to 7 days.
+
+    Args:
+        days (array-like): Closure days per lease
+        layer_hours (List[int]): Hours of the accumulation layers, ascending
+
+    Returns (np.ndarray): Layer index per lease, -1 for 1 day, other days and
+        missing layers
+    """
+    days = np.asarray(days, dtype="int64")
+    hours = np.where((days > 1) & (days <= MAX_DAYS), (days - 1) * 24, -1)
+    return raster_sampling.band_lookup(layer_hours, hours)
+
+
+def tp_accumulation(days, layer_hours, stack, rows, cols, inside):
+    """
+    Process A accumulation: rainfall of the closure window before the forecast day.
+
+    Args:
+        days (array-like): Closure days per lease
+        layer_hours (List[int]): Hours of the accumulation layers, ascending
+        stack (np.ndarray): Accumulation layers (layer x y x x), None when there are
+            none
+        rows (np.ndarray): Row index per lease on the accumulation grid
+        cols (np.ndarray): Column index per lease on the accumulation grid
+        inside (np.ndarray): Mask of leases inside the accumulation grid
+
+    Returns (np.ndarray): Accumulation per lease, 0 for 1 day (forecast only), NaN
+        where there is no layer or the lease is outside the grid
+    """
+    days = np.asarray(days, dtype="int64")
+    if stack is None:
+        values = np.full(len(days), np.nan, dtype="float64")
+    else:
+        layer_idx = accumulation_layers(days, layer_hours)
+        values = raster_sampling.gather(stack, layer_idx, rows, cols, inside)
+    values[days == 1] = 0
+    return values
+
+
+def pqpf_probabilities(tp_calc, pqpf_th, cube, rows, cols, inside):
+    """
+    Process B: probability of each lease's PQPF threshold.
+
+    Args:
+        tp_calc (array-like): Remaining rainfall per lease (Process A)
+        pqpf_th (array-like): PQPF threshold per lease (Process A)
+        cube (PQPFCube): PQPF cube with all thresholds
+        rows (np.ndarray): Row index per lease on the cube grid
+        cols (np.ndarray): Column index per lease on the cube grid
+        inside (np.ndarray): Mask of leases inside the cube grid
+
+    Returns (tuple[np.ndarray, np.ndarray]): Probability per lease (1 where the
+        remaining rainfall is negative) and the positions of the leases with a
+        result: the negative ones first, then by ascending threshold. Leases whose
+        threshold is not in the cube have no result.
+    """
+    tp_calc = np.asarray(tp_calc, dtype="float64")
+    band_idx = cube.band_lookup(pqpf_th)
+    values = raster_sampling.gather(cube.data, band_idx, rows, cols, inside)
+    negative = tp_calc < 0
+    values[negative] = 1
+    keep = np.flatnonzero(negative | (band_idx >= 0))
+    order_key = np.where(negative, -1, band_idx)[keep]
+    return values, keep[np.argsort(order_key, kind="stable")]
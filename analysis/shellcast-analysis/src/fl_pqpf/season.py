@@ -0,0 +1,181 @@
+"""
+Compiled FL harvest season windows.
+
+A CMU's season is a list of inclusive month/day windows, e.g. ``"[1/1-12/31]"`` or
+``"4/1-6/30, 9/1-11/30"``; a window whose end is before its start crosses the new
+year (``"11/1-2/28"``). Every distinct season string is compiled once into a
+day-of-year mask over a leap-year calendar (366 days, so 2/29 has a slot every
+year), and the masks are stored with the lease layer cache. Checking the seasons
+of all CMUs is then a single lookup of today's day-of-year column.
+"""
+
+import logging
+import os
+from datetime import date
+
+import layer_cache
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DAYS = 366
+LEAP_YEAR = 2000
+SIDECAR_SUFFIX = "_seasons.npz"
+
+
+def day_index(day):
+    """
+    Day-of-year slot of a date in the leap-year calendar.
+
+    Args:
+        day (datetime.date): Date (only its month and day are used)
+
+    Returns (int): 0 (1/1) to 365 (12/31)
+    """
+    return date(LEAP_YEAR, day.month, day.day).timetuple().tm_yday - 1
+
+
+def parse_windows(season):
+    """
+    Parse a season string into day-of-year windows.
+
+    Args:
+        season (str): e.g. '[4/1-6/30, 9/1-11/30]'
+
+    Returns (List[tuple[int, int]]): Inclusive (start, end) slots per window
+    """
+    windows = []
+    for window in str(season).strip("[]").split(","):
+        window = window.strip()
+        if not window:
+            continue
+        try:
+            start, end = (
+                day_index(date(LEAP_YEAR, *map(int, part.split("/"))))
+                for part in window.split("-")
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid season window {window!r} in {season!r}") from e
+        windows.append((start, end))
+    return windows
+
+
+def compile_season(season):
+    """
+    Day-of-year mask of a season string.
+
+    Args:
+        season (str): e.g. '11/1-2/28'
+
+    Returns (np.ndarray): Boolean mask of length 366, True on the days in season
+    """
+    mask = np.zeros(DAYS, dtype=bool)
+    for start, end in parse_windows(season):
+        if start <= end:
+            mask[start : end + 1] = True
+        else:  # Crosses the new year
+            mask[start:] = True
+            mask[: end + 1] = True
+    return mask
+
+
+class SeasonCalendar:
+    def __init__(self, seasons=(), masks=None):
+        """
+        Day-of-year masks of distinct season strings.
+
+        Args:
+            seasons (List[str]): Season strings
+            masks (np.ndarray): Masks (season x 366), compiled when None
+        """
+        self.seasons = [str(season) for season in seasons]
+        if masks is None:
+            masks = np.array(
+                [compile_season(season) for season in self.seasons], dtype=bool
+            ).reshape(len(self.seasons), DAYS)
+        self.masks = masks
+        self.index = {season: i for i, season in enumerate(self.seasons)}
+
+    def add(self, seasons):
+        """Compile season strings that are not in the calendar yet."""
+        new = [str(s) for s in dict.fromkeys(seasons) if str(s) not in self.index]
+        if new:
+            compiled = SeasonCalendar(new)
+            self.masks = np.concatenate([self.masks, compiled.masks])
+            for season in new:
+                self.index[season] = len(self.seasons)
+                self.seasons.append(season)
+
+    def in_season(self, seasons, day):
+        """
+        Whether each season includes a date.
+
+        Args:
+            seasons (array-like): Season string per CMU
+            day (datetime.date): Date (e.g. today)
+
+        Returns (np.ndarray): Boolean per CMU
+        """
+        seasons = pd.Series(seasons).astype(str)
+        self.add(seasons.unique())
+        codes = seasons.map(self.index).to_numpy(dtype="int64")
+        return self.masks[codes, day_index(day)]
+
+    def save(self, fpath, sha256=None):
+        """
+        Store the calendar as a NumPy archive.
+
+        Args:
+            fpath (str): '.npz' path
+            sha256 (str): Fingerprint of the source layer
+        """
+        tmp_path = f"{fpath}.tmp.npz"
+        np.savez(
+            tmp_path,
+            seasons=np.array(self.seasons, dtype=str),
+            masks=np.packbits(self.masks, axis=1),
+            sha256=np.array(sha256 or ""),
+        )
+        os.replace(tmp_path, fpath)
+
+    @classmethod
+    def load(cls, fpath):
+        """
+        Args:
+            fpath (str): '.npz' path from :meth:`save`
+
+        Returns (tuple[SeasonCalendar, str]): Calendar and source fingerprint
+        """
+        with np.load(fpath) as npz:
+            masks = np.unpackbits(npz["masks"], axis=1, count=DAYS).astype(bool)
+            return cls(npz["seasons"].tolist(), masks), str(npz["sha256"])
+
+
+def load_calendar(shp_path, season_col="season"):
+    """
+    Season calendar of a layer, compiled once per layer version and stored with its
+    GeoParquet cache.
+
+    Args:
+        shp_path (str): Lease shapefile path
+        season_col (str): Season column
+
+    Returns (SeasonCalendar):
+    """
+    cache = layer_cache.LayerCache(shp_path)
+    if layer_cache.pyarrow is None:
+        seasons = layer_cache.read_layer(shp_path, [season_col])[season_col]
+        return SeasonCalendar(seasons.astype(str).unique())
+
+    sha256 = cache.ensure()["sha256"]
+    fpath = cache.sidecar_path(SIDECAR_SUFFIX)
+    if os.path.exists(fpath):
+        calendar, calendar_sha256 = SeasonCalendar.load(fpath)
+        if calendar_sha256 == sha256:
+            return calendar
+    seasons = cache.load([season_col])[season_col]
+    calendar = SeasonCalendar(seasons.astype(str).unique())
+    calendar.save(fpath, sha256)
+    logger.info(f"{len(calendar.seasons)} season windows --- compiled")
+    return calendar
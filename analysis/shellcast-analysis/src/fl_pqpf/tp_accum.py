@@ -0,0 +1,220 @@
+"""
+Rolling total precipitation accumulation for FL.
+
+Each ShellCast day (24 hourly XMRG files) is reduced once to a 24-hour sum that is
+already cropped to the FL AOI, reprojected and converted to inches, and cached as
+``<store_dir>/<first hour>-<last hour>.npy`` with a JSON sidecar. A daily run only
+reads the hours of days that are not cached yet. The ``tp_{24..144}h``
+accumulations are running sums of the cached days from the oldest day of the window,
+like the ``cdo timcumsum`` over the oldest-first series of ``xmrg_proc.sh``:
+``tp_24h`` is the oldest day and ``tp_144h`` the whole 6-day window. With
+``trailing=True`` they are sums of the most recent days instead (``tp_24h`` is the
+24 hours before 7:00 AM).
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+logger = logging.getLogger(__name__)
+
+
+def day_key(hour_fpaths):
+    """
+    Cache key of one day (e.g. 'xmrg0113202407z-xmrg0114202406z').
+
+    Args:
+        hour_fpaths (List[str]): Hourly XMRG file paths of the day
+
+    Returns (str):
+    """
+    stems = sorted(Path(fpath).name.split(".")[0] for fpath in hour_fpaths)
+    return f"{stems[0]}-{stems[-1]}"
+
+
+def hours_signature(hour_fpaths):
+    """
+    Size and modification time of each hourly file of a day.
+
+    Args:
+        hour_fpaths (List[str]): Hourly XMRG file paths
+
+    Returns (dict): {file name: [size, mtime_ns]}
+    """
+    signature = {}
+    for fpath in sorted(hour_fpaths):
+        stat = os.stat(fpath)
+        signature[os.path.basename(fpath)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+class TPAccumulationStore:
+    def __init__(self, store_dir, read_hour):
+        """
+        Cache of daily total precipitation sums.
+
+        Args:
+            store_dir (str): Directory of the cached day sums
+            read_hour (callable): Reads one hourly XMRG file and returns
+                (np.ndarray in inches with NaN for nodata, affine.Affine, CRS WKT)
+        """
+        self.store_dir = store_dir
+        self.read_hour = read_hour
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _paths(self, key):
+        fpath = os.path.join(self.store_dir, key)
+        return f"{fpath}.npy", f"{fpath}.json"
+
+    def _load(self, key, signature):
+        npy_path, meta_path = self._paths(key)
+        if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, "r") as rf:
+            meta = json.load(rf)
+        if meta.get("hours") != signature:
+            return None
+        return np.load(npy_path), Affine.from_gdal(*meta["transform"]), meta["crs"]
+
+    def day_sum(self, hour_fpaths):
+        """
+        24-hour sum of one day, read from the cache or computed from the hourly files.
+
+        Args:
+            hour_fpaths (List[str]): Hourly XMRG file paths of the day
+
+        Returns (tuple[np.ndarray, affine.Affine, str]): Sum in inches, transform
+            and CRS WKT.
+        """
+        key = day_key(hour_fpaths)
+        signature = hours_signature(hour_fpaths)
+        cached = self._load(key, signature)
+        if cached is not None:
+            logger.info(f"{key} --- cached")
+            return cached
+
+        total, transform, crs = None, None, None
+        for fpath in sorted(hour_fpaths):
+            data, transform, crs = self.read_hour(fpath)
+            total = data.astype("float64") if total is None else total + data
+        npy_path, meta_path = self._paths(key)
+        # Written through per-process temporary files: backfill workers sum the
+        # days their windows share concurrently
+        tmp_path = f"{npy_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as wf:
+            np.save(wf, total.astype("float32"))
+        os.replace(tmp_path, npy_path)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(
+                {
+                    "hours": signature,
+                    "transform": list(transform.to_gdal()),
+                    "crs": crs,
+                },
+                wf,
+            )
+        os.replace(tmp_path, meta_path)
+        logger.info(f"{key} --- {len(hour_fpaths)} hours summed")
+        return total.astype("float32"), transform, crs
+
+    def accumulations(self, days, trailing=False):
+        """
+        Running accumulations of the days from the oldest day of the window.
+
+        Args:
+            days (List[List[str]]): Hourly file paths per day, most recent day first
+            trailing (bool): Accumulate from the most recent day instead
+
+        Returns (dict): {hours: (np.ndarray, affine.Affine, str)}, e.g. 48 -> sum of
+            the two oldest days (the two most recent days when trailing).
+        """
+        result = {}
+        total = None
+        for idx, hour_fpaths in enumerate(days if trailing else reversed(days)):
+            data, transform, crs = self.day_sum(hour_fpaths)
+            total = data.copy() if total is None else total + data
+            result[(idx + 1) * 24] = (total.copy(), transform, crs)
+        return result
+
+    def prune(self, days):
+        """
+        Delete cached day sums that are no longer in the window.
+
+        Args:
+            days (List[List[str]]): Hourly file paths per day in the window
+        """
+        keep = {day_key(hour_fpaths) for hour_fpaths in days}
+        for fpath in Path(self.store_dir).glob("*.npy"):
+            if fpath.stem not in keep:
+                for path in self._paths(fpath.stem):
+                    if os.path.exists(path):
+                        os.remove(path)
+                logger.info(f"{fpath.stem} --- removed from the store")
+
+
+def write_accumulation_tiffs(accumulations, out_dir):
+    """
+    Write accumulations to 'tp_{hours}h.tif', replacing the previous outputs.
+
+    Args:
+        accumulations (dict): Output of :func:`TPAccumulationStore.accumulations`
+        out_dir (str): Output directory
+
+    Returns (List[str]): Written GeoTIFF paths
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for fpath in Path(out_dir).glob("tp_*h.tif"):
+        os.remove(fpath)
+    tiffs = []
+    for hours, (data, transform, crs) in sorted(accumulations.items()):
+        out_tiff = os.path.join(out_dir, f"tp_{hours}h.tif")
+        profile = {
+            "driver": "GTiff",
+            "height": data.shape[0],
+            "width": data.shape[1],
+            "count": 1,
+            "dtype": "float32",
+            "crs": crs,
+            "transform": transform,
+            "nodata": np.nan,
+        }
+        with rasterio.open(out_tiff, "w", **profile) as dst:
+            dst.write(data.astype("float32"), 1)
+        tiffs.append(out_tiff)
+        logger.info(f"tp_{hours}h.tif --- saved")
+    return tiffs
+
+
+def read_accumulation_tiffs(out_dir):
+    """
+    Read the 'tp_{hours}h.tif' accumulations into one stack.
+
+    Args:
+        out_dir (str): Directory of :func:`write_accumulation_tiffs`
+
+    Returns (tuple[List[int], np.ndarray, Affine]): Accumulation hours in ascending
+        order, the matching band stack (hours x y x x) and its transform. The stack
+        is None when there are no accumulations.
+    """
+    tiffs = {}
+    for fpath in Path(out_dir).glob("tp_*h.tif"):
+        hours = fpath.stem[len("tp_") : -len("h")]
+        if hours.isdigit():
+            tiffs[int(hours)] = fpath
+    hours, bands, transform = sorted(tiffs), [], None
+    for hour in hours:
+        with rasterio.open(tiffs[hour]) as src:
+            if transform is not None and (
+                src.transform != transform or src.shape != bands[0].shape
+            ):
+                raise ValueError(f"{tiffs[hour].name} is not on the grid of tp_*h.tif")
+            transform = src.transform
+            bands.append(src.read(1))
+    stack = np.stack(bands) if bands else None
+    return hours, stack, transform
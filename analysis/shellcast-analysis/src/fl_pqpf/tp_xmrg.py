@@ -5,21 +5,21 @@ for today. The forecast today and 6 days of past data make up a total of 7 days.
 ShellCast defines a day as the period between 7 am and 24 hours prior.
 """
 
-import gzip
 import json
 import logging
 import os
-import shutil
-import subprocess
 import sys
-from datetime import datetime, timedelta
-from ftplib import FTP, error_perm
+from datetime import datetime, time, timedelta
 from pathlib import Path
 from typing import List
 
 import constants as ct
 import pytz
+import telemetry
 import utils
+from fl_pqpf.tp_accum import TPAccumulationStore, write_accumulation_tiffs
+from fl_pqpf.xmrg_reader import XMRGReader
+from ftp_download import FTPDownloader
 
 logger = logging.getLogger(__name__)
 
@@ -50,21 +50,44 @@ class MissingTPGRBsError(Exception):
 
 
 class TPXMRG:
-    def __init__(self, state, hour_from):
+    def __init__(
+        self,
+        state,
+        hour_from,
+        run_date=None,
+        archive_dir=None,
+        outputs_dir=None,
+        store_dir=None,
+    ):
         """
         Download the XMRG GRIB files for the past 120 hours (5 days) from NOAA's FTP site. Upon downloading 120 XMRG
-        GRIB files, run the [xmrg_proc.sh] command to process them.
+        GRIB files, sum them into daily totals (cached in tp/<state>/daily) and write the tp_{hours}h accumulations.
 
         Args:
             state (str): Abbreviated state name in upper case.
             hour_from (int): Hours in 24 hours format. 7:00 AM should be the setting for ShelCast. In this case, input
             is 7. Due to limited availability of data in the afternoon for 7 AM data, you might need to adjust your
             development environment time.
+            run_date (datetime.date): Run date of a backfill, today when None
+            archive_dir (str): Directory of archived XMRG GRB files to read instead of
+                downloading (the files are never deleted)
+            outputs_dir (str): Directory of the tp_{hours}h.tif files
+            store_dir (str): Directory of the cached day sums
         """
         self.state = state.upper()
-        self.tp_proc_sh = os.path.join(os.path.dirname(__file__), "xmrg_proc.sh")
-        self.tp_raw_dir = os.path.join(ct.TP_DATA_DIR, "raw")
+        state_dir = os.path.join(ct.TP_DATA_DIR, self.state.lower())
+        self.archived = archive_dir is not None
+        self.tp_raw_dir = archive_dir or os.path.join(ct.TP_DATA_DIR, "raw")
         utils.create_directory(self.tp_raw_dir)
+        self.tp_outputs_dir = outputs_dir or os.path.join(state_dir, "outputs")
+        self.catalog_path = ct.TP_DATA_CATALOG_PATH
+        if outputs_dir:
+            self.catalog_path = os.path.join(outputs_dir, "tpxmrg_inventory.json")
+        self.reader = XMRGReader(os.path.join(state_dir, "warp_index"))
+        self.store = TPAccumulationStore(
+            store_dir or os.path.join(state_dir, "daily"), self.reader.read
+        )
+        self.run_date = run_date
         self.hour_from = hour_from
         self.max_threshold_days = 6
 
@@ -77,7 +100,10 @@ class TPXMRG:
             file_names: A list of hourly total precipitation date and time.
         """
         try:
-            today = datetime.now(pytz.timezone("America/New_York")).today()
+            if self.run_date is None:
+                today = datetime.now(pytz.timezone("America/New_York")).today()
+            else:
+                today = datetime.combine(self.run_date, time())
             days_in_hours = self.max_threshold_days * 24
             file_names = []
             new_datetime = today.replace(hour=self.hour_from, minute=0, second=0)
@@ -105,13 +131,6 @@ class TPXMRG:
         exist_files = [f.name for f in Path(self.tp_raw_dir).glob("xmrg*.grb")]
         return exist_files
 
-    def ungz(self, gz_fpath):
-        unzipped = str(gz_fpath).split(".gz")[0]
-        with gzip.open(gz_fpath, "rb") as rf:
-            with open(unzipped, "wb") as wf:
-                shutil.copyfileobj(rf, wf)
-                os.remove(gz_fpath)
-
     def tp_data_inventory(self, required_files, existing_files):
         """
         Catalog total precipitation data.
@@ -124,7 +143,7 @@ class TPXMRG:
             day': <int: 1 through 7 - Florida rain threshold days>,
             values: <list(dict)>: [
                 {'tpxmrg_name': <str: name of grb file>,
-                'path': <str: path for compressed gz file>,
+                'path': <str: path for the decompressed grb file>,
                 'exists': <bool: True when file is in tp/raw folder, otherwise False>}, ...] (length of the list should
                 be 24),
             'check': <bool: True for required data for "day" is in tp/raw folder, otherwise False.>,
@@ -139,7 +158,7 @@ class TPXMRG:
             for val in vals:
                 data = {
                     "tpxmrg_name": val,
-                    "path": os.path.join(self.tp_raw_dir, val + ".gz"),
+                    "path": os.path.join(self.tp_raw_dir, val),
                     "exists": False,
                 }
                 if val in existing_files:
@@ -148,9 +167,11 @@ class TPXMRG:
             inventory.append(dt_dict)
         return inventory
 
+    @telemetry.timed()
     def download_tp_data(self, data_inventory, ftp_url, ftp_cwd):
         """
-        Download total precipitation data that is not in tp/raw directory. Successful file download, updates
+        Download total precipitation data that is not in tp/raw directory. The gzip files are decompressed as they
+        stream in, so only the GRB file is written. Successful file download, updates
         data_inventory['values']['exists'] to True.
         Args:
             data_inventory (list[dict]): Data catalog created in :func:`.tp_data_inventory`.
@@ -163,39 +184,35 @@ class TPXMRG:
         logger.info("[Download GRIBs from FTP]")
 
         try:
-            if data_inventory:
-                ftp = FTP(ftp_url)
-                ftp.login()
-                ftp.encoding = "utf-8"
-                ftp.cwd(ftp_cwd)
-                for item in data_inventory:
-                    if item["day"] < 6:
-                        for ele in item["values"]:
-                            if not ele["exists"]:
-                                try:
-                                    with open(ele["path"], "wb") as f:
-                                        ftp.retrbinary(
-                                            "RETR " + ele["tpxmrg_name"] + ".gz",
-                                            f.write,
-                                        )
-                                    self.ungz(ele["path"])
-                                    grb_fpath = ele["path"].split(".gz")[0]
-                                    file_size = os.path.getsize(grb_fpath)
-                                    if file_size > 0:
-                                        ele["exists"] = True
-                                        logger.info(f"{ele['tpxmrg_name']} downloaded.")
-                                    else:
-                                        os.remove(ele["path"])
-                                        logger.info(
-                                            f"{ele['tpxmrg_name']} file size 0 -> file deleted."
-                                        )
-
-                                except error_perm:
-                                    logger.error(
-                                        f"Download failed -> {item['day']}: {ele['tpxmrg_name']}"
-                                    )
-                                    os.unlink(ele["path"])
-                ftp.quit()
+            pending = [
+                (item["day"], ele)
+                for item in data_inventory or []
+                if item["day"] < 6
+                for ele in item["values"]
+                if not ele["exists"]
+            ]
+            if pending:
+                downloader = FTPDownloader(
+                    ftp_url,
+                    ftp_cwd,
+                    max_workers=ct.FTP_MAX_WORKERS,
+                    retries=ct.FTP_RETRIES,
+                )
+                results = downloader.download(
+                    [f"{ele['tpxmrg_name']}.gz" for _, ele in pending],
+                    self.tp_raw_dir,
+                    gunzip=True,
+                )
+                for day, ele in pending:
+                    if not results[f"{ele['tpxmrg_name']}.gz"]:
+                        logger.error(f"Download failed -> {day}: {ele['tpxmrg_name']}")
+                    elif os.path.getsize(ele["path"]) > 0:
+                        ele["exists"] = True
+                    else:
+                        os.remove(ele["path"])
+                        logger.info(
+                            f"{ele['tpxmrg_name']} file size 0 -> file deleted."
+                        )
             else:
                 logger.info("Skip download")
             logger.info(utils.done_str)
@@ -207,13 +224,14 @@ class TPXMRG:
             utils.error_process(msg, e)
 
     @staticmethod
-    def check_tp_data(data_inventory):
+    def check_tp_data(data_inventory, catalog_path=ct.TP_DATA_CATALOG_PATH):
         """
         Verify that the precipitation data for a given day exist in the tp/raw directory and record them in the JSON
         file.
 
         Args:
             data_inventory list(dict):
+            catalog_path (str): JSON file path
 
         Returns:
 
@@ -225,11 +243,12 @@ class TPXMRG:
                 else:
                     item["check"] = False
                     break
-        with open(ct.TP_DATA_CATALOG_PATH, "w") as f:
+        with open(catalog_path, "w") as f:
             json.dump(data_inventory, f)
 
         return data_inventory
 
+    @telemetry.timed()
     def delete_tp_data(self, data_inventory):
         """
         Deletes unnecessary total precipitation data from tp/raw directory.
@@ -247,6 +266,11 @@ class TPXMRG:
                 required_files.append(ele["tpxmrg_name"])
         delete_files = list(set(existing_files).symmetric_difference(required_files))
 
+        # Partial downloads of hours that dropped out of the window
+        for part in Path(self.tp_raw_dir).glob("xmrg*.part"):
+            if part.name.split(".")[0] + ".grb" not in required_files:
+                delete_files.append(part.name)
+
         for f in delete_files:
             path = os.path.join(self.tp_raw_dir, f)
             try:
@@ -280,23 +304,54 @@ class TPXMRG:
         elif xth_day in [1, 2, 3, 4, 5]:
             return 0
 
+    @telemetry.timed()
+    def accumulate_tp_data(self, data_inventory, hours):
+        """
+        Write the tp_{24..hours}h running accumulations of the window from cached day sums.
+
+        Args:
+            data_inventory (list[dict]): Data inventory after :func:`.check_tp_data` (most recent day first)
+            hours (int): Hours to accumulate from :func:`.days_to_process_tp_data`
+
+        Returns (List[str]): Written GeoTIFF paths
+        """
+        logger.info("[Accumulate total precipitation]")
+        days = [
+            [ele["path"] for ele in item["values"]]
+            for item in data_inventory[: hours // 24]
+        ]
+        if not self.archived:
+            # Archived runs share the store across run dates
+            self.store.prune(days)
+        tiffs = write_accumulation_tiffs(
+            self.store.accumulations(days, trailing=ct.TP_TRAILING_WINDOW),
+            self.tp_outputs_dir,
+        )
+        logger.info(utils.done_str)
+        return tiffs
+
+    @telemetry.timed()
     def main(self):
         try:
             xmrg_files = self.list_required_tp_data()
             existing_xmrg_files = self.list_existing_tp_data()
             inventory = self.tp_data_inventory(xmrg_files, existing_xmrg_files)
 
-            af_inventory = self.download_tp_data(
-                inventory, ct.TG_FTP_URL, ct.TG_FTP_CWD
-            )
-            checked_inventory = self.check_tp_data(af_inventory)
+            if self.archived:
+                af_inventory = inventory
+            else:
+                af_inventory = self.download_tp_data(
+                    inventory, ct.TG_FTP_URL, ct.TG_FTP_CWD
+                )
+            checked_inventory = self.check_tp_data(af_inventory, self.catalog_path)
 
-            self.delete_tp_data(checked_inventory)
+            if not self.archived:
+                self.delete_tp_data(checked_inventory)
 
             hours = self.days_to_process_tp_data(checked_inventory)
 
             if hours > 0:
-                subprocess.call(self.tp_proc_sh, shell=True)
+                self.accumulate_tp_data(checked_inventory, hours)
             else:
                 raise MissingTPGRBsError
 
@@ -0,0 +1,173 @@
+"""
+Native XMRG reader.
+
+Hourly XMRG GRIB1 files are decoded with GDAL straight into NumPy arrays and
+resampled to the FL AOI (WGS84, inches) with a cached warp index: for every output
+cell the flat index of the nearest source cell. The index is built once per source
+grid by warping a raster of cell indices with GDAL, so every following hour is a
+single NumPy gather instead of a cnvgrib/cdo/gdalwarp/wgrib2 subprocess chain.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import constants as ct
+import numpy as np
+from affine import Affine
+from osgeo import gdal
+
+gdal.UseExceptions()
+logger = logging.getLogger(__name__)
+
+
+def warp_key(transform, shape, crs, dst_srs, bounds):
+    """
+    Cache key of a warp index (source grid and destination grid spec).
+
+    Args:
+        transform (tuple): Source GDAL geotransform
+        shape (tuple[int, int]): Source (height, width)
+        crs (str): Source CRS WKT
+        dst_srs (str): Destination CRS
+        bounds (tuple): Destination bounds (min x, min y, max x, max y)
+
+    Returns (str):
+    """
+    spec = json.dumps(
+        [[round(v, 9) for v in transform], list(shape), crs, dst_srs, list(bounds)]
+    )
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()[:12]
+
+
+def apply_warp_index(data, index, nodata=None):
+    """
+    Resample a source band with a warp index.
+
+    Args:
+        data (np.ndarray): Source band
+        index (np.ndarray): Flat source index per destination cell, -1 outside the source
+        nodata (float): Source nodata value
+
+    Returns (np.ndarray): Destination band (float64), NaN for nodata and outside cells.
+    """
+    values = np.asarray(data, dtype="float64").ravel()
+    if nodata is not None:
+        values = np.where(values == nodata, np.nan, values)
+    out = values[np.clip(index, 0, None)]
+    out[index < 0] = np.nan
+    return out
+
+
+class XMRGReader:
+    def __init__(
+        self,
+        cache_dir,
+        dst_srs=ct.TP_DST_SRS,
+        bounds=ct.TP_AOI_BOUNDS,
+        scale=ct.MM_TO_INCH,
+    ):
+        """
+        Read hourly XMRG files onto the AOI grid.
+
+        Args:
+            cache_dir (str): Directory of cached warp indices
+            dst_srs (str): Destination CRS
+            bounds (tuple): Destination bounds (min x, min y, max x, max y)
+            scale (float): Unit conversion factor (mm -> inches)
+        """
+        self.cache_dir = cache_dir
+        self.dst_srs = dst_srs
+        self.bounds = bounds
+        self.scale = scale
+        self._indices = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _build_index(self, ds):
+        """Warp a raster of flat cell indices with nearest-neighbour resampling."""
+        width, height = ds.RasterXSize, ds.RasterYSize
+        src = gdal.GetDriverByName("MEM").Create("", width, height, 1, gdal.GDT_Float64)
+        src.SetGeoTransform(ds.GetGeoTransform())
+        src.SetProjection(ds.GetProjection())
+        band = src.GetRasterBand(1)
+        band.SetNoDataValue(-1)
+        band.WriteArray(
+            np.arange(width * height, dtype="float64").reshape(height, width)
+        )
+        warp_options = gdal.WarpOptions(
+            format="MEM",
+            dstSRS=self.dst_srs,
+            outputBounds=self.bounds,
+            resampleAlg="near",
+            dstNodata=-1,
+        )
+        warped = gdal.Warp("", src, options=warp_options)
+        index = warped.GetRasterBand(1).ReadAsArray().astype("int64")
+        transform = Affine.from_gdal(*warped.GetGeoTransform())
+        crs = warped.GetProjection()
+        src, warped = None, None
+        return index, transform, crs
+
+    def warp_index(self, ds):
+        """
+        Warp index of a source dataset's grid, from memory, disk or built.
+
+        Args:
+            ds (gdal.Dataset): Source dataset
+
+        Returns (tuple[np.ndarray, affine.Affine, str]): Index (height x width of the
+            destination grid), destination transform and CRS WKT.
+        """
+        key = warp_key(
+            ds.GetGeoTransform(),
+            (ds.RasterYSize, ds.RasterXSize),
+            ds.GetProjection(),
+            self.dst_srs,
+            self.bounds,
+        )
+        if key in self._indices:
+            return self._indices[key]
+
+        npy_path = os.path.join(self.cache_dir, f"{key}.npy")
+        meta_path = os.path.join(self.cache_dir, f"{key}.json")
+        if os.path.exists(npy_path) and os.path.exists(meta_path):
+            with open(meta_path, "r") as rf:
+                meta = json.load(rf)
+            index = np.load(npy_path)
+            transform = Affine.from_gdal(*meta["transform"])
+            crs = meta["crs"]
+        else:
+            index, transform, crs = self._build_index(ds)
+            # Written through per-process temporary files: backfill workers can
+            # build the same index concurrently. The metadata is written last and
+            # marks the index as complete.
+            tmp_path = f"{npy_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as wf:
+                np.save(wf, index.astype("int32"))
+            os.replace(tmp_path, npy_path)
+            tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as wf:
+                json.dump({"transform": list(transform.to_gdal()), "crs": crs}, wf)
+            os.replace(tmp_path, meta_path)
+            logger.info(f"Warp index {key} --- built")
+        self._indices[key] = (index, transform, crs)
+        return self._indices[key]
+
+    def read(self, fpath):
+        """
+        Read one hourly XMRG file on the AOI grid.
+
+        Args:
+            fpath (str): XMRG GRIB file path
+
+        Returns (tuple[np.ndarray, affine.Affine, str]): Precipitation in inches (NaN
+            for nodata), transform and CRS WKT.
+        """
+        ds = gdal.Open(fpath)
+        band = ds.GetRasterBand(1)
+        data = band.ReadAsArray()
+        nodata = band.GetNoDataValue()
+        index, transform, crs = self.warp_index(ds)
+        ds = None
+        return apply_warp_index(data, index, nodata) * self.scale, transform, crs
@@ -0,0 +1,340 @@
+"""
+Concurrent, resumable FTP downloads.
+
+Files are fetched by a bounded pool of worker threads, each with its own FTP
+session. Transfers are written to a ``.part`` file named after the remote size and
+modification time, so an interrupted transfer is resumed with a REST offset only
+while the remote file is unchanged. Completed files are verified against the
+server size and atomically renamed into place.
+
+Gzip files can be decompressed while they stream in, so only the final
+uncompressed file is ever written to disk. Byte ranges of a file (e.g. single GRIB
+messages) are read with a REST offset and the transfer is aborted once the range
+is in.
+"""
+
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from ftplib import FTP, error_perm, error_reply, error_temp
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (error_temp, error_reply, OSError, EOFError)
+RANGE_BLOCK = 65536
+
+
+def parse_mdtm(response):
+    """
+    Parse an FTP MDTM response.
+
+    Args:
+        response (str): MDTM response (e.g. '213 20240114130501')
+
+    Returns (float): POSIX timestamp, None when the response can't be parsed.
+    """
+    try:
+        value = response.split()[-1][:14]
+        dt = datetime.strptime(value, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except (IndexError, ValueError):
+        return None
+
+
+class GunzipWriter:
+    def __init__(self, wf):
+        """
+        Streaming gzip decompressor for FTP ``retrbinary`` callbacks.
+
+        Args:
+            wf (file): Binary file object receiving the decompressed bytes
+        """
+        self.wf = wf
+        self.received = 0
+        self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+    def write(self, chunk):
+        self.received += len(chunk)
+        while chunk:
+            self.wf.write(self._decompressor.decompress(chunk))
+            chunk = b""
+            if self._decompressor.eof and self._decompressor.unused_data:
+                # Concatenated gzip members
+                chunk = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+    def finish(self):
+        """Flush the decompressor; raise EOFError when the stream is truncated."""
+        self.wf.write(self._decompressor.flush())
+        if not self._decompressor.eof:
+            raise EOFError("truncated gzip stream")
+
+
+class FTPDownloader:
+    def __init__(
+        self,
+        host,
+        cwd,
+        max_workers=4,
+        retries=3,
+        backoff=2.0,
+        timeout=60,
+        port=21,
+        user="",
+        passwd="",
+    ):
+        """
+        Download files from one FTP directory with parallel sessions.
+
+        Args:
+            host (str): FTP host
+            cwd (str): Remote directory
+            max_workers (int): Number of parallel FTP sessions
+            retries (int): Retries per file after the first attempt
+            backoff (float): Base delay in seconds, doubled after each retry
+            timeout (int): Socket timeout in seconds
+            port (int): FTP port
+            user (str): User name, anonymous when empty
+            passwd (str): Password
+        """
+        self.host = host
+        self.cwd = cwd
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.port = port
+        self.user = user
+        self.passwd = passwd
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        ftp = FTP(timeout=self.timeout)
+        ftp.connect(self.host, self.port)
+        ftp.login(self.user, self.passwd)
+        ftp.encoding = "utf-8"
+        ftp.cwd(self.cwd)
+        ftp.voidcmd("TYPE I")
+        return ftp
+
+    def _session(self):
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is None:
+            ftp = self._connect()
+            self._local.ftp = ftp
+            with self._lock:
+                self._sessions.append(ftp)
+        return ftp
+
+    def _reset_session(self):
+        ftp = getattr(self._local, "ftp", None)
+        self._local.ftp = None
+        if ftp is not None:
+            with self._lock:
+                if ftp in self._sessions:
+                    self._sessions.remove(ftp)
+            try:
+                ftp.close()
+            except OSError:
+                pass
+
+    def close(self):
+        """Close all FTP sessions."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for ftp in sessions:
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+    @staticmethod
+    def remote_info(ftp, name):
+        """
+        Size and modification time of a remote file.
+
+        Args:
+            ftp (FTP): Connected session
+            name (str): Remote file name
+
+        Returns (tuple[int, float]): Size in bytes and POSIX mtime; either is None
+            when the server doesn't support SIZE/MDTM.
+        """
+        try:
+            size = ftp.size(name)
+        except error_perm:
+            size = None
+        try:
+            mtime = parse_mdtm(ftp.sendcmd(f"MDTM {name}"))
+        except error_perm:
+            mtime = None
+        return size, mtime
+
+    @staticmethod
+    def part_path(dest_path, size, mtime):
+        """Partial transfer path tied to the remote file version."""
+        version = f"{int(mtime) if mtime else 'x'}-{size if size is not None else 'x'}"
+        return f"{dest_path}.{version}.part"
+
+    @staticmethod
+    def _remove_stale_parts(dest_path, keep):
+        dest_dir = os.path.dirname(dest_path) or "."
+        prefix = os.path.basename(dest_path) + "."
+        for fname in os.listdir(dest_dir):
+            fpath = os.path.join(dest_dir, fname)
+            if not (fname.startswith(prefix) and fname.endswith(".part")):
+                continue
+            # Only '<dest>.<version>.part', not parts of longer names ('<dest>.gz...')
+            if "." not in fname[len(prefix) : -len(".part")] and fpath != keep:
+                os.remove(fpath)
+
+    def _is_complete(self, dest_path, size, mtime, gunzip=False):
+        if not os.path.exists(dest_path):
+            return False
+        if gunzip:
+            # Decompressed size is unknown; the remote mtime is stamped on completion
+            return mtime is not None and int(os.path.getmtime(dest_path)) == int(mtime)
+        if size is None or os.path.getsize(dest_path) != size:
+            return False
+        return mtime is None or int(os.path.getmtime(dest_path)) == int(mtime)
+
+    def _transfer(self, ftp, name, dest_path, gunzip=False):
+        size, mtime = self.remote_info(ftp, name)
+        if self._is_complete(dest_path, size, mtime, gunzip):
+            return
+        part = self.part_path(dest_path, size, mtime)
+        self._remove_stale_parts(dest_path, keep=part)
+        # A decompressor can't pick up mid-stream, so gzip transfers restart
+        offset = os.path.getsize(part) if os.path.exists(part) and not gunzip else 0
+        if size is not None and offset > size:
+            offset = 0
+        if offset:
+            logger.info(f"{name} --- resume at {offset} bytes")
+        try:
+            with open(part, "ab" if offset else "wb") as wf:
+                writer = GunzipWriter(wf) if gunzip else wf
+                ftp.retrbinary(f"RETR {name}", writer.write, rest=offset or None)
+                if gunzip:
+                    writer.finish()
+        except error_perm:
+            if os.path.getsize(part) == 0:
+                os.remove(part)
+            raise
+        received = writer.received if gunzip else os.path.getsize(part)
+        if size is not None and received != size:
+            raise EOFError(f"{name}: received {received} of {size} bytes")
+        os.replace(part, dest_path)
+        if mtime:
+            os.utime(dest_path, (mtime, mtime))
+
+    @staticmethod
+    def read_range(ftp, name, offset, nbytes):
+        """
+        Read a byte range of a remote file (REST offset, then abort the transfer).
+
+        Args:
+            ftp (FTP): Connected session
+            name (str): Remote file name
+            offset (int): First byte
+            nbytes (int): Number of bytes to read
+
+        Returns (bytes): Up to `nbytes` bytes, fewer at the end of the file
+        """
+        buf = bytearray()
+        with ftp.transfercmd(f"RETR {name}", rest=offset or None) as conn:
+            while len(buf) < nbytes:
+                chunk = conn.recv(min(RANGE_BLOCK, nbytes - len(buf)))
+                if not chunk:
+                    break
+                buf += chunk
+        try:
+            ftp.voidresp()
+        except (error_temp, error_reply):
+            pass  # 426: transfer aborted by closing the data connection early
+        return bytes(buf)
+
+    def call(self, name, func, *args):
+        """
+        Run an FTP operation on a remote file with retries.
+
+        Args:
+            name (str): Remote file name (for the log)
+            func (callable): func(ftp, *args), run on this thread's session
+            *args: Arguments of `func`
+
+        Returns (tuple[bool, object]): Success and the result of `func`
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return True, func(self._session(), *args)
+            except error_perm as e:
+                # Missing file or no permission: retrying won't help
+                logger.error(f"Download failed -> {name}: {str(e).strip()}")
+                return False, None
+            except (*RETRYABLE_ERRORS, zlib.error) as e:
+                self._reset_session()
+                if attempt == self.retries:
+                    logger.error(f"Download failed -> {name}: {e}")
+                    return False, None
+                delay = self.backoff * 2**attempt
+                logger.warning(f"{name} --- {e}; retry in {delay:.0f} s")
+                time.sleep(delay)
+        return False, None
+
+    def fetch(self, name, dest_path, gunzip=False):
+        """
+        Download one file with retries, resuming partial transfers.
+
+        Args:
+            name (str): Remote file name
+            dest_path (str): Local file path
+            gunzip (bool): Decompress the gzip stream while downloading
+
+        Returns (bool): True when the file was downloaded (or already complete).
+        """
+        ok, _ = self.call(name, self._transfer, name, dest_path, gunzip)
+        if ok:
+            logger.info(f"{name} downloaded.")
+        return ok
+
+    def map(self, func, names):
+        """
+        Run a per-file function on the session pool, closing the sessions after.
+
+        Args:
+            func (callable): func(name), e.g. a bound :meth:`fetch`
+            names (List[str]): Remote file names
+
+        Returns (dict): {file name: result}
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {name: pool.submit(func, name) for name in names}
+                return {name: future.result() for name, future in futures.items()}
+        finally:
+            self.close()
+
+    def download(self, names, dest_dir, gunzip=False):
+        """
+        Download files in parallel.
+
+        Args:
+            names (List[str]): Remote file names
+            dest_dir (str): Local directory
+            gunzip (bool): Decompress '.gz' files while downloading, saving them
+                without the '.gz' suffix
+
+        Returns (dict): {file name: True when downloaded}
+        """
+
+        def fetch(name):
+            fname = name[: -len(".gz")] if gunzip and name.endswith(".gz") else name
+            return self.fetch(name, os.path.join(dest_dir, fname), gunzip)
+
+        return self.map(fetch, names)
@@ -0,0 +1,521 @@
+"""
+Inventory of the GRIB2 messages of a PQPF file, for byte-range downloads.
+
+A PQPF file holds 8 percentile messages followed by 12 exceedance probability
+messages, one per rainfall threshold (``upperLimit``). The states only decode the
+probability messages, NC and SC only a few of them, so the downloader fetches just
+the byte ranges of the messages it needs and concatenates them into the local
+``.grb`` (a GRIB2 file is a plain sequence of messages, so wgrib2, pygrib and GDAL
+read it like the full file).
+
+The inventory (offset, length and threshold of every message) comes from a
+wgrib2-style ``.idx`` published next to the file when there is one, or is built
+by reading the first bytes of each message (sections 0 to 4). It is stored with
+the local file in a ``<file>.inv.json`` sidecar together with the remote file
+version and the messages already downloaded, so the inventory is built once per
+cycle and a later run that needs other thresholds only fetches the missing ones.
+
+Every local GRIB (raw or subset) also gets a message index, ``<file>.index.json``
+(band number, threshold, forecast hour and byte range of each message), built from
+the headers once when the file lands and reused by every consumer: band lookups
+need no pygrib scan, and the messages of the decoded thresholds are copied out
+before cropping so wgrib2 and GDAL only read those. Print an index with
+``python grib_inventory.py <file.grb> [--json]``.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import struct
+from ftplib import error_perm
+
+logger = logging.getLogger(__name__)
+
+IDX_SUFFIX = ".idx"
+SIDECAR_SUFFIX = ".inv.json"
+INDEX_SUFFIX = ".index.json"
+SUFFIXES = (SIDECAR_SUFFIX, INDEX_SUFFIX)
+HEADER_BYTES = 512
+# Product definition templates with probability limits (4.5, 4.9)
+PROBABILITY_TEMPLATES = (5, 9)
+HOURS = 1  # Indicator of unit of time range
+IDX_PROB_ABOVE = re.compile(r"prob >\s*([-+0-9.eE]+)")
+IDX_HOURS = re.compile(r":\d+-(\d+) hour ")
+
+
+def threshold_inches(upper_limit):
+    """
+    Rainfall threshold of a probability message, as used to key PQPF bands.
+
+    Args:
+        upper_limit (float): upperLimit in mm
+
+    Returns (float): Threshold in inches rounded to 0.1 (e.g. 6.35 mm -> 0.2)
+    """
+    return float(round(upper_limit / 25.4, 1))
+
+
+def _signed(value, nbytes):
+    # GRIB2 signed integers are sign and magnitude, not two's complement
+    sign_bit = 1 << (8 * nbytes - 1)
+    return -(value & (sign_bit - 1)) if value & sign_bit else value
+
+
+def parse_header(buf):
+    """
+    Length, upper limit and forecast hour of the GRIB2 message at the start of a
+    buffer.
+
+    Args:
+        buf (bytes): First bytes of the message (sections 0 to 4)
+
+    Returns (tuple[int, float, int]): Message length in bytes, upperLimit in mm and
+        end of the accumulation in forecast hours (None for messages without a
+        probability limit)
+    """
+    if len(buf) < 16:
+        raise EOFError("truncated GRIB indicator section")
+    if buf[:4] != b"GRIB" or buf[7] != 2:
+        raise ValueError("not a GRIB2 message")
+    length = struct.unpack(">Q", buf[8:16])[0]
+    pos = 16
+    while True:
+        if len(buf) < pos + 5:
+            raise EOFError("truncated GRIB header")
+        sec_len, sec_num = struct.unpack(">IB", buf[pos : pos + 5])
+        if sec_num >= 5:
+            return length, None, None
+        if sec_num == 4:
+            break
+        pos += sec_len
+    sec = buf[pos : pos + sec_len]
+    if len(sec) < sec_len:
+        raise EOFError("truncated GRIB product definition section")
+    template = struct.unpack(">H", sec[7:9])[0]
+    if template not in PROBABILITY_TEMPLATES:
+        return length, None, None
+    # Octets 43 to 47: scale factor and scaled value of the upper limit
+    scale, value = struct.unpack(">BI", sec[42:47])
+    if scale == 0xFF and value == 0xFFFFFFFF:  # Missing
+        return length, None, None
+    return length, _signed(value, 4) / 10 ** _signed(scale, 1), _end_hour(sec)
+
+
+def _end_hour(sec):
+    # Octets 18 to 22: unit and forecast time; 4.9 octets 62 to 66: unit and length
+    # of the time range
+    unit, forecast_time = struct.unpack(">BI", sec[17:22])
+    if unit != HOURS:
+        return None
+    if struct.unpack(">H", sec[7:9])[0] != 9 or len(sec) < 66:
+        return _signed(forecast_time, 4)
+    range_unit, range_length = struct.unpack(">BI", sec[61:66])
+    if range_unit != HOURS:
+        return None
+    return _signed(forecast_time, 4) + range_length
+
+
+def scan(read, size):
+    """
+    Build the inventory of a GRIB2 file by reading the header of each message.
+
+    Args:
+        read (callable): read(offset, nbytes) -> bytes
+        size (int): File size in bytes
+
+    Returns (List[dict]): Messages with their 'number' (1-based, the GDAL band),
+        'offset', 'length', 'upper_limit' (mm) and 'hour' (end of the accumulation)
+    """
+    messages = []
+    offset = 0
+    while offset < size:
+        nbytes = HEADER_BYTES
+        while True:
+            buf = read(offset, nbytes)
+            try:
+                length, upper_limit, hour = parse_header(buf)
+                break
+            except EOFError:
+                if len(buf) < nbytes:  # End of file
+                    raise
+                nbytes *= 4
+        messages.append(
+            {
+                "number": len(messages) + 1,
+                "offset": offset,
+                "length": length,
+                "upper_limit": upper_limit,
+                "hour": hour,
+            }
+        )
+        offset += length
+    return messages
+
+
+def parse_idx(text, size):
+    """
+    Parse a wgrib2 inventory ('1:0:d=2022093012:APCP:surface:6-30 hour acc fcst:prob
+    >6.35:...').
+
+    Args:
+        text (str): '.idx' content
+        size (int): GRIB file size in bytes (length of the last message)
+
+    Returns (List[dict]): Messages as in :func:`scan`
+    """
+    messages = []
+    for line in text.splitlines():
+        fields = line.split(":")
+        if len(fields) < 3 or "." in fields[0]:  # Sub-messages share the offset
+            continue
+        match = IDX_PROB_ABOVE.search(line)
+        hours = IDX_HOURS.search(line) if match else None
+        messages.append(
+            {
+                "number": int(fields[0]),
+                "offset": int(fields[1]),
+                "length": None,
+                "upper_limit": float(match.group(1)) if match else None,
+                "hour": int(hours.group(1)) if hours else None,
+            }
+        )
+    for msg, next_msg in zip(messages, messages[1:] + [None]):
+        end = next_msg["offset"] if next_msg else size
+        msg["length"] = end - msg["offset"]
+    return messages
+
+
+def select(messages, thresholds=None):
+    """
+    Probability messages of the rainfall thresholds.
+
+    Args:
+        messages (List[dict]): Inventory
+        thresholds (List[float]): Rainfall thresholds in inches, all probability
+            messages when None
+
+    Returns (List[dict]): Selected messages, in file order
+    """
+    wanted = None if thresholds is None else {float(th) for th in thresholds}
+    return [
+        msg
+        for msg in messages
+        if msg["upper_limit"] is not None
+        and (wanted is None or threshold_inches(msg["upper_limit"]) in wanted)
+    ]
+
+
+def byte_ranges(messages):
+    """
+    Merge the byte ranges of messages that follow each other in the file.
+
+    Args:
+        messages (List[dict]): Messages sorted by offset
+
+    Returns (List[tuple[int, int]]): (offset, nbytes) per range
+    """
+    ranges = []
+    for msg in messages:
+        if ranges and sum(ranges[-1]) == msg["offset"]:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + msg["length"])
+        else:
+            ranges.append((msg["offset"], msg["length"]))
+    return ranges
+
+
+def sidecar_path(grb_fpath):
+    return f"{grb_fpath}{SIDECAR_SUFFIX}"
+
+
+def load_sidecar(grb_fpath):
+    """
+    Args:
+        grb_fpath (str): Local GRB file path
+
+    Returns (dict): Sidecar ('size', 'mtime', 'messages', 'local'), None when
+        missing or unreadable
+    """
+    try:
+        with open(sidecar_path(grb_fpath), "r") as rf:
+            return json.load(rf)
+    except (OSError, ValueError):
+        return None
+
+
+def save_sidecar(grb_fpath, sidecar):
+    tmp_path = f"{sidecar_path(grb_fpath)}.tmp"
+    with open(tmp_path, "w") as wf:
+        json.dump(sidecar, wf)
+    os.replace(tmp_path, sidecar_path(grb_fpath))
+
+
+def covers(grb_fpath, thresholds=None):
+    """
+    Whether a local GRB file holds the messages of the rainfall thresholds. A file
+    without a sidecar is a full download.
+
+    Args:
+        grb_fpath (str): Local GRB file path
+        thresholds (List[float]): Rainfall thresholds in inches, all probability
+            messages when None
+
+    Returns (bool):
+    """
+    if not os.path.exists(grb_fpath):
+        return False
+    sidecar = load_sidecar(grb_fpath)
+    if sidecar is None:
+        return not os.path.exists(sidecar_path(grb_fpath))
+    local = set(sidecar["local"])
+    needed = select(sidecar["messages"], thresholds)
+    return bool(needed) and all(msg["number"] in local for msg in needed)
+
+
+class MessageIndex:
+    def __init__(self, messages, stat=None):
+        """
+        Message index of a local GRIB2 file: band number, threshold, forecast hour
+        and byte range of every message.
+
+        Args:
+            messages (List[dict]): Messages as in :func:`scan`
+            stat (List[int]): File size and mtime (ns) the index was built from
+        """
+        self.messages = messages
+        self.stat = stat
+
+    @staticmethod
+    def path(grb_fpath):
+        return f"{grb_fpath}{INDEX_SUFFIX}"
+
+    @staticmethod
+    def file_stat(grb_fpath):
+        stat = os.stat(grb_fpath)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @classmethod
+    def build(cls, grb_fpath):
+        """
+        Index a GRIB2 file by reading the header of each message.
+
+        Args:
+            grb_fpath (str): GRIB file path
+
+        Returns (MessageIndex):
+        """
+        stat = cls.file_stat(grb_fpath)
+        with open(grb_fpath, "rb") as rf:
+
+            def read(offset, nbytes):
+                rf.seek(offset)
+                return rf.read(nbytes)
+
+            return cls(scan(read, stat[0]), stat)
+
+    @classmethod
+    def for_file(cls, grb_fpath):
+        """
+        Stored index of a GRIB2 file, built and stored when missing or stale.
+
+        Args:
+            grb_fpath (str): GRIB file path
+
+        Returns (MessageIndex):
+        """
+        try:
+            with open(cls.path(grb_fpath), "r") as rf:
+                meta = json.load(rf)
+            if meta["stat"] == cls.file_stat(grb_fpath):
+                return cls(meta["messages"], meta["stat"])
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.build(grb_fpath)
+        index.save(grb_fpath)
+        return index
+
+    def save(self, grb_fpath):
+        # Per process temporary file: PQPF workers may index the same file
+        tmp_path = f"{self.path(grb_fpath)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump({"stat": self.stat, "messages": self.messages}, wf)
+        os.replace(tmp_path, self.path(grb_fpath))
+
+    def bands(self):
+        """
+        Returns (dict): {threshold in inches: band number} of the probability
+            messages
+        """
+        return {
+            threshold_inches(msg["upper_limit"]): msg["number"]
+            for msg in select(self.messages)
+        }
+
+    def select(self, thresholds=None):
+        """Probability messages of the rainfall thresholds (see :func:`select`)."""
+        return select(self.messages, thresholds)
+
+    def extract(self, grb_fpath, out_fpath, messages):
+        """
+        Copy messages of the indexed file to a new GRIB2 file.
+
+        Args:
+            grb_fpath (str): Indexed GRIB file path
+            out_fpath (str): New GRIB file path
+            messages (List[dict]): Messages of this index
+
+        Returns (MessageIndex): Index of the new file (bands renumbered in order)
+        """
+        extracted = []
+        with open(grb_fpath, "rb") as rf, open(out_fpath, "wb") as wf:
+            for offset, nbytes in byte_ranges(messages):
+                rf.seek(offset)
+                wf.write(rf.read(nbytes))
+        offset = 0
+        for number, msg in enumerate(messages, start=1):
+            extracted.append(dict(msg, number=number, offset=offset))
+            offset += msg["length"]
+        index = MessageIndex(extracted, self.file_stat(out_fpath))
+        index.save(out_fpath)
+        return index
+
+    def table(self):
+        """
+        Returns (str): One line per message (band, offset, length, threshold in
+            inches, forecast hour), for debugging
+        """
+        lines = ["band     offset     length  threshold  hour"]
+        for msg in self.messages:
+            upper = msg["upper_limit"]
+            threshold = f"{threshold_inches(upper):g} in" if upper is not None else "-"
+            hour = msg["hour"] if msg["hour"] is not None else "-"
+            lines.append(
+                f"{msg['number']:>4} {msg['offset']:>10} {msg['length']:>10} "
+                f"{threshold:>10} {hour:>5}"
+            )
+        return "\n".join(lines)
+
+
+class GribRangeFetcher:
+    def __init__(self, downloader, dest_dir, thresholds=None):
+        """
+        Download only the PQPF messages of some rainfall thresholds.
+
+        Args:
+            downloader (FTPDownloader): Downloader of the remote directory
+            dest_dir (str): Local directory
+            thresholds (List[float]): Rainfall thresholds in inches, all probability
+                messages when None
+        """
+        self.downloader = downloader
+        self.dest_dir = dest_dir
+        self.thresholds = thresholds
+
+    def inventory(self, ftp, name, size):
+        """
+        Inventory of a remote file: its '.idx' when published, otherwise the
+        message headers.
+
+        Returns (List[dict]): Messages as in :func:`scan`
+        """
+        chunks = []
+        try:
+            ftp.retrbinary(f"RETR {name}{IDX_SUFFIX}", chunks.append)
+            messages = parse_idx(b"".join(chunks).decode("ascii"), size)
+        except (error_perm, UnicodeDecodeError, ValueError):
+            messages = None  # No (valid) published inventory
+        if messages:
+            return messages
+        return scan(
+            lambda offset, nbytes: self.downloader.read_range(
+                ftp, name, offset, nbytes
+            ),
+            size,
+        )
+
+    def _transfer(self, ftp, name):
+        dest_path = os.path.join(self.dest_dir, name)
+        size, mtime = self.downloader.remote_info(ftp, name)
+        if size is None:
+            raise ValueError("the server does not report file sizes")
+        version = {"size": size, "mtime": mtime}
+        sidecar = load_sidecar(dest_path)
+        if sidecar is not None and all(sidecar[k] == v for k, v in version.items()):
+            local = sidecar["local"] if os.path.exists(dest_path) else []
+        else:
+            sidecar = dict(version, messages=self.inventory(ftp, name, size))
+            local = []
+        needed = select(sidecar["messages"], self.thresholds)
+        if not needed:
+            raise ValueError("no probability messages of the thresholds")
+        missing = [msg for msg in needed if msg["number"] not in local]
+        if not missing:
+            return 0
+
+        part = f"{dest_path}.messages.part"
+        with open(part, "wb") as wf:
+            if local:
+                with open(dest_path, "rb") as rf:
+                    wf.write(rf.read())
+            for offset, nbytes in byte_ranges(missing):
+                data = self.downloader.read_range(ftp, name, offset, nbytes)
+                if len(data) != nbytes:
+                    raise EOFError(f"{name}: received {len(data)} of {nbytes} bytes")
+                wf.write(data)
+        # Sidecar first: a GRB without a valid sidecar is never taken as complete
+        save_sidecar(dest_path, dict(sidecar, local=[]))
+        os.replace(part, dest_path)
+        local = local + [msg["number"] for msg in missing]
+        save_sidecar(dest_path, dict(sidecar, local=local))
+        return sum(msg["length"] for msg in missing)
+
+    def fetch(self, name):
+        """
+        Download the missing messages of one file, falling back to the full file
+        when the messages can't be located.
+
+        Args:
+            name (str): Remote file name
+
+        Returns (bool): True when the local file holds the messages
+        """
+        try:
+            ok, nbytes = self.downloader.call(name, self._transfer, name)
+        except ValueError as e:
+            logger.warning(f"{name} --- {e}; download the full file")
+            return self._fetch_full(name)
+        if ok:
+            logger.info(f"{name} --- {nbytes} bytes of messages downloaded.")
+        return ok
+
+    def _fetch_full(self, name):
+        dest_path = os.path.join(self.dest_dir, name)
+        for fpath in (dest_path, sidecar_path(dest_path)):
+            if os.path.exists(fpath):
+                os.remove(fpath)
+        return self.downloader.fetch(name, dest_path)
+
+    def download(self, names):
+        """
+        Download the messages of several files in parallel.
+
+        Args:
+            names (List[str]): Remote file names
+
+        Returns (dict): {file name: True when downloaded}
+        """
+        return self.downloader.map(self.fetch, names)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the message index of GRIBs")
+    parser.add_argument("grb_fpaths", nargs="+", help="GRIB2 file paths")
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args()
+    for fpath in args.grb_fpaths:
+        index = MessageIndex.build(fpath)
+        if args.json:
+            print(json.dumps({"file": fpath, "messages": index.messages}, indent=2))
+        else:
+            print(f"{fpath}\n{index.table()}")
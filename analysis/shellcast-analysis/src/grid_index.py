@@ -0,0 +1,273 @@
+"""
+Persistent lease to grid-cell index.
+
+The row/col of every lease on a PQPF grid only changes when the lease shapefile or
+the grid geometry changes, so it is computed once and stored next to the inputs
+(``inputs/grid_index``). Each index is keyed on the grid geotransform and shape and
+is rebuilt automatically when the shapefile fingerprint no longer matches.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import raster_sampling
+
+logger = logging.getLogger(__name__)
+
+SHP_EXTENSIONS = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+INDEX_DIR_NAME = "grid_index"
+META_FNAME = "meta.json"
+
+
+def _shp_files(shp_path):
+    stem = os.path.splitext(shp_path)[0]
+    return [stem + ext for ext in SHP_EXTENSIONS if os.path.exists(stem + ext)]
+
+
+def shp_stat_signature(shp_path):
+    """
+    Size and modification time of each file of a shapefile.
+
+    Args:
+        shp_path (str): Shapefile path
+
+    Returns (dict): {file name: [size, mtime_ns]}
+    """
+    signature = {}
+    for fpath in _shp_files(shp_path):
+        stat = os.stat(fpath)
+        signature[os.path.basename(fpath)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def shp_fingerprint(shp_path):
+    """
+    SHA-256 of the contents of every file of a shapefile.
+
+    Args:
+        shp_path (str): Shapefile path
+
+    Returns (str): Hex digest
+    """
+    sha = hashlib.sha256()
+    for fpath in _shp_files(shp_path):
+        sha.update(os.path.basename(fpath).encode("utf-8"))
+        with open(fpath, "rb") as rf:
+            for chunk in iter(lambda: rf.read(1 << 20), b""):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def source_unchanged(meta, shp_path):
+    """
+    Check a cached artifact's recorded shapefile against the file on disk.
+
+    The size/mtime signature is compared first; the contents are only hashed when
+    the files were touched. ``meta['stat']`` is refreshed in place when the files
+    were touched but the contents are unchanged.
+
+    Args:
+        meta (dict): Cache metadata with 'stat' and 'sha256' keys
+        shp_path (str): Shapefile path
+
+    Returns (bool): True when the shapefile is unchanged.
+    """
+    signature = shp_stat_signature(shp_path)
+    if meta.get("stat") == signature:
+        return True
+    if meta.get("sha256") == shp_fingerprint(shp_path):
+        meta["stat"] = signature
+        return True
+    return False
+
+
+def grid_fingerprint(transform, shape, crs=None):
+    """
+    Short hash of a grid's geotransform, shape and CRS.
+
+    Args:
+        transform (affine.Affine): Grid affine transform
+        shape (tuple[int, int]): Grid (height, width)
+        crs (str): Optional CRS the lease coordinates are projected to
+
+    Returns (str): Hex digest
+    """
+    key = {
+        "transform": [round(float(v), 6) for v in tuple(transform)[:6]],
+        "shape": [int(v) for v in shape],
+        "crs": str(crs) if crs else None,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[
+        :12
+    ]
+
+
+class GridIndex:
+    def __init__(self, rows, cols, inside, codes=None, groups=None):
+        """
+        Row/col of each lease on one grid, in shapefile row order.
+
+        Args:
+            rows (np.ndarray): Row index per lease
+            cols (np.ndarray): Column index per lease
+            inside (np.ndarray): Mask of leases inside the grid
+            codes (np.ndarray): Group (CMU) code per lease, -1 for missing
+            groups (List[str]): Group (CMU) names indexed by code
+        """
+        self.rows = rows
+        self.cols = cols
+        self.inside = inside
+        self.codes = codes
+        self.groups = groups
+
+    def __len__(self):
+        return len(self.rows)
+
+    def sample(self, band, positions=None):
+        """
+        Gather band values for leases.
+
+        Args:
+            band (np.ndarray): 2D band on the index grid
+            positions (array-like): Optional lease positions (shapefile row numbers)
+
+        Returns (np.ndarray): Value per lease, NaN outside the grid.
+        """
+        rows, cols, inside = self.rows, self.cols, self.inside
+        if positions is not None:
+            positions = np.asarray(positions)
+            rows, cols, inside = rows[positions], cols[positions], inside[positions]
+        values = np.full(len(rows), np.nan, dtype="float64")
+        values[inside] = band[rows[inside], cols[inside]]
+        return values
+
+
+class LeaseGridIndex:
+    def __init__(self, lease_shp, group_col=None, cache_dir=None):
+        """
+        Cached lease to grid-cell index for one lease layer.
+
+        Args:
+            lease_shp (str): Lease (or CMU) shapefile path
+            group_col (str): Optional CMU column stored as integer grouping codes
+            cache_dir (str): Cache directory, defaults to ``grid_index`` next to the
+                shapefile
+        """
+        self.lease_shp = lease_shp
+        self.group_col = group_col
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.dirname(lease_shp), INDEX_DIR_NAME
+        )
+
+    def index_dir(self, transform, shape, crs=None):
+        stem = os.path.splitext(os.path.basename(self.lease_shp))[0]
+        return os.path.join(
+            self.cache_dir, f"{stem}_{grid_fingerprint(transform, shape, crs)}"
+        )
+
+    def _is_valid(self, index_dir):
+        meta_fpath = os.path.join(index_dir, META_FNAME)
+        if not os.path.exists(meta_fpath):
+            return False
+        with open(meta_fpath, "r") as rf:
+            meta = json.load(rf)
+        if meta.get("group_col") != self.group_col:
+            return False
+        stat = meta.get("stat")
+        if not source_unchanged(meta, self.lease_shp):
+            return False
+        if meta["stat"] != stat:
+            with open(meta_fpath, "w") as wf:
+                json.dump(meta, wf)
+        return True
+
+    def build(self, transform, shape, crs=None, gdf=None):
+        """
+        Compute and store the index for a grid.
+
+        Args:
+            transform (affine.Affine): Grid affine transform
+            shape (tuple[int, int]): Grid (height, width)
+            crs (str): Optional CRS to project the leases to before indexing
+            gdf (gpd.GeoDataFrame): Already loaded lease layer, read from
+                ``lease_shp`` when None
+
+        Returns (GridIndex):
+        """
+        index_dir = self.index_dir(transform, shape, crs)
+        logger.info(f"Build grid index: {os.path.basename(index_dir)}")
+        if gdf is None:
+            gdf = gpd.read_file(self.lease_shp)
+        geoms = gdf.geometry
+        if crs:
+            geoms = geoms.to_crs(crs)
+        if not (geoms.geom_type == "Point").all():
+            geoms = geoms.centroid
+        rows, cols, inside = raster_sampling.rowcol_index(
+            transform, shape, geoms.x.to_numpy(), geoms.y.to_numpy()
+        )
+        codes, groups = None, None
+        if self.group_col:
+            codes, uniques = pd.factorize(gdf[self.group_col])
+            groups = [str(group) for group in uniques]
+
+        os.makedirs(index_dir, exist_ok=True)
+        meta_fpath = os.path.join(index_dir, META_FNAME)
+        if os.path.exists(meta_fpath):
+            os.remove(meta_fpath)
+        np.save(os.path.join(index_dir, "rows.npy"), rows.astype("int32"))
+        np.save(os.path.join(index_dir, "cols.npy"), cols.astype("int32"))
+        np.save(os.path.join(index_dir, "inside.npy"), inside)
+        if codes is not None:
+            np.save(os.path.join(index_dir, "codes.npy"), codes.astype("int32"))
+        # meta.json is written last and marks the index as complete
+        meta = {
+            "lease_shp": os.path.basename(self.lease_shp),
+            "group_col": self.group_col,
+            "groups": groups,
+            "stat": shp_stat_signature(self.lease_shp),
+            "sha256": shp_fingerprint(self.lease_shp),
+            "transform": list(tuple(transform)[:6]),
+            "shape": list(shape),
+            "crs": str(crs) if crs else None,
+        }
+        with open(meta_fpath, "w") as wf:
+            json.dump(meta, wf)
+        return self._load(index_dir)
+
+    @staticmethod
+    def _load(index_dir):
+        with open(os.path.join(index_dir, META_FNAME), "r") as rf:
+            meta = json.load(rf)
+        codes_fpath = os.path.join(index_dir, "codes.npy")
+        return GridIndex(
+            rows=np.load(os.path.join(index_dir, "rows.npy"), mmap_mode="r"),
+            cols=np.load(os.path.join(index_dir, "cols.npy"), mmap_mode="r"),
+            inside=np.load(os.path.join(index_dir, "inside.npy"), mmap_mode="r"),
+            codes=np.load(codes_fpath, mmap_mode="r")
+            if os.path.exists(codes_fpath)
+            else None,
+            groups=meta["groups"],
+        )
+
+    def load(self, transform, shape, crs=None, gdf=None):
+        """
+        Load the index for a grid, building it when missing or stale.
+
+        Args:
+            transform (affine.Affine): Grid affine transform
+            shape (tuple[int, int]): Grid (height, width)
+            crs (str): Optional CRS to project the leases to before indexing
+            gdf (gpd.GeoDataFrame): Already loaded lease layer used on rebuild
+
+        Returns (GridIndex):
+        """
+        index_dir = self.index_dir(transform, shape, crs)
+        if self._is_valid(index_dir):
+            return self._load(index_dir)
+        return self.build(transform, shape, crs, gdf)
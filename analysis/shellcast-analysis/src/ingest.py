@@ -0,0 +1,96 @@
+"""
+Pipelined PQPF ingest: download, subset and decode overlap.
+
+The forecast-hour GRB files used to be downloaded all together before the first
+one was cropped, and all cropped before the first was decoded. Here every file moves
+on as soon as its transfer completes: download threads put finished files on a
+bounded queue, and a dispatcher hands them to the subset-and-decode workers while
+the other transfers are still running. A download worker waits for a free queue
+slot before it takes the next file, so transfers never run far ahead of the
+decoders. The run then takes about max(download, compute) instead of their sum.
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def pipelined(
+    names, fetch, decode, fetch_workers=1, decode_workers=1, queue_size=1, keep=None
+):
+    """
+    Download files and decode each one as soon as it is in.
+
+    Args:
+        names (List[str]): File names
+        fetch (callable): fetch(name) -> local path, None when the download failed
+            (run on threads)
+        decode (callable): decode(path) -> result (run in worker processes, so it
+            must be picklable)
+        fetch_workers (int): Parallel downloads
+        decode_workers (int): Decoding worker processes; decoding runs in this
+            process when 1
+        queue_size (int): Downloaded files waiting for a decoder
+        keep (callable): keep(name) -> whether to decode the file (default: all)
+
+    Returns (dict): {name: decode result} of the decoded files, in `names` order
+    """
+    downloaded = queue.Queue(maxsize=max(1, queue_size))
+
+    def download(name):
+        path = None
+        try:
+            path = fetch(name)
+        finally:
+            # Blocks while the queue is full: back pressure on the downloads
+            downloaded.put((name, path))
+
+    def produce():
+        with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as pool:
+            for future in [pool.submit(download, name) for name in names]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Download failed: {e!r}")
+
+    producer = threading.Thread(target=produce, name="ingest-download", daemon=True)
+    producer.start()
+    pool = None
+    if decode_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=decode_workers)
+    pending = {}
+    try:
+        for _ in names:
+            if pool is not None:
+                # At most one file per decoder in flight; the rest wait in the queue
+                running = [future for future in pending.values() if not future.done()]
+                if len(running) >= decode_workers:
+                    wait(running, return_when=FIRST_COMPLETED)
+            name, path = downloaded.get()
+            if path is None or (keep is not None and not keep(name)):
+                continue
+            logger.info(f"{name} --- queued for decoding")
+            pending[name] = pool.submit(decode, path) if pool else decode(path)
+        results = {
+            name: pending[name].result() if pool else pending[name]
+            for name in names
+            if name in pending
+        }
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        # After a decoding error, unblock the downloads still waiting for a slot
+        while producer.is_alive():
+            try:
+                downloaded.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    return results
@@ -0,0 +1,89 @@
+"""
+Storage for intermediate files.
+
+The subset GRB files are written only to be read back right away: wgrib2 writes
+them and GDAL decodes them a moment later. A Scratch area keeps them off the
+persistent disk in a RAM-backed temporary directory (/dev/shm when it exists), which
+an external command like wgrib2 can still write to, and removes them when it is
+closed. With a spill directory the files are written there and kept after the run,
+for debugging.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# RAM-backed file systems, in order of preference
+RAM_DIRS = ["/dev/shm"]
+
+
+def ram_dir():
+    """
+    Returns (str): First writable RAM-backed directory, the system temporary
+        directory when there is none
+    """
+    for directory in RAM_DIRS:
+        if os.path.isdir(directory) and os.access(directory, os.W_OK):
+            return directory
+    return tempfile.gettempdir()
+
+
+class Scratch:
+    def __init__(self, name, spill_dir=None):
+        """
+        Intermediate files of one processing step.
+
+        Args:
+            name (str): Step name, used as the temporary directory prefix
+            spill_dir (str): Optional directory to write the files to and keep
+                instead (cleared when the area is opened)
+        """
+        self.name = name
+        self.spill_dir = spill_dir
+        self.dir = None
+
+    @property
+    def spilled(self):
+        """Whether the files are kept in the spill directory."""
+        return self.spill_dir is not None
+
+    def open(self):
+        """
+        Create the directory of the intermediate files.
+
+        Returns (Scratch): self
+        """
+        if self.spilled:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            os.makedirs(self.spill_dir)
+            self.dir = self.spill_dir
+        else:
+            self.dir = tempfile.mkdtemp(prefix=f"shellcast_{self.name}_", dir=ram_dir())
+        logger.info(f"{self.name} intermediates --- {self.dir}")
+        return self
+
+    def path(self, fname):
+        """
+        Args:
+            fname (str): File name
+
+        Returns (str): Path of an intermediate file
+        """
+        if self.dir is None:
+            raise RuntimeError(f"{self.name} intermediates are not open")
+        return os.path.join(self.dir, fname)
+
+    def close(self):
+        """Remove the intermediate files (spilled files are kept)."""
+        if self.dir is not None and not self.spilled:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
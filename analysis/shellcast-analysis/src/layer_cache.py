@@ -0,0 +1,179 @@
+"""
+GeoParquet cache of the lease and CMU input layers.
+
+Every run used to parse the lease shapefile several times with all of its columns
+(thresholds, sampling, the grid index). Each shapefile is now converted once to a
+GeoParquet file stored next to the inputs (``inputs/layer_cache``) and rebuilt
+automatically when the shapefile fingerprint no longer matches (e.g. new layers
+from the GCS bucket). Parquet is columnar, so a reader only decodes the columns it
+asks for.
+
+Text columns are stored as categoricals and numeric columns are downcast when
+that is lossless: integers to the smallest integer type and floats to float32 only
+when every value round-trips exactly, so rain thresholds such as 0.3 in stay
+float64 and still match the PQPF thresholds.
+
+Without pyarrow the layers are read from the shapefiles.
+"""
+
+import json
+import logging
+import os
+
+import geopandas as gpd
+import grid_index
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = "layer_cache"
+GEOMETRY = "geometry"
+
+
+def compact_dtypes(df):
+    """
+    Lossless compact dtypes of the attribute columns of a layer.
+
+    Args:
+        df (pd.DataFrame): Layer attributes (the geometry column is left as is)
+
+    Returns (pd.DataFrame): Layer with categorical, downcast integer and float32
+        columns
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column == GEOMETRY or isinstance(values.dtype, gpd.array.GeometryDtype):
+            continue
+        if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            columns[column] = values.astype("category")
+        elif pd.api.types.is_integer_dtype(values):
+            columns[column] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_float_dtype(values):
+            as_float32 = values.astype("float32")
+            if np.array_equal(
+                as_float32.to_numpy(dtype="float64"),
+                values.to_numpy(dtype="float64"),
+                equal_nan=True,
+            ):
+                columns[column] = as_float32
+    return df.assign(**columns) if columns else df
+
+
+class LayerCache:
+    def __init__(self, shp_path, cache_dir=None):
+        """
+        Cached GeoParquet copy of one shapefile.
+
+        Args:
+            shp_path (str): Shapefile path
+            cache_dir (str): Cache directory, defaults to ``layer_cache`` next to the
+                shapefile
+        """
+        self.shp_path = shp_path
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.dirname(shp_path), CACHE_DIR_NAME
+        )
+        stem = os.path.splitext(os.path.basename(shp_path))[0]
+        self.parquet_path = os.path.join(self.cache_dir, f"{stem}.parquet")
+        self.meta_path = os.path.join(self.cache_dir, f"{stem}.json")
+
+    def _is_valid(self):
+        if not (os.path.exists(self.meta_path) and os.path.exists(self.parquet_path)):
+            return False
+        with open(self.meta_path, "r") as rf:
+            meta = json.load(rf)
+        stat = meta.get("stat")
+        if not grid_index.source_unchanged(meta, self.shp_path):
+            return False
+        if meta["stat"] != stat:
+            with open(self.meta_path, "w") as wf:
+                json.dump(meta, wf)
+        return True
+
+    def build(self):
+        """
+        Convert the shapefile to GeoParquet.
+
+        Returns (str): GeoParquet file path
+        """
+        logger.info(f"Build layer cache: {os.path.basename(self.parquet_path)}")
+        gdf = compact_dtypes(gpd.read_file(self.shp_path))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        tmp_path = f"{self.parquet_path}.tmp"
+        gdf.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.parquet_path)
+        # The metadata file is written last and marks the cache as complete
+        meta = {
+            "shp": os.path.basename(self.shp_path),
+            "stat": grid_index.shp_stat_signature(self.shp_path),
+            "sha256": grid_index.shp_fingerprint(self.shp_path),
+            "columns": [column for column in gdf.columns if column != GEOMETRY],
+        }
+        with open(self.meta_path, "w") as wf:
+            json.dump(meta, wf)
+        return self.parquet_path
+
+    def ensure(self):
+        """
+        Convert the shapefile when the cache is missing or stale.
+
+        Returns (dict): Cache metadata (shapefile 'sha256', 'stat' and 'columns')
+        """
+        if not self._is_valid():
+            self.build()
+        with open(self.meta_path, "r") as rf:
+            return json.load(rf)
+
+    def sidecar_path(self, suffix):
+        """
+        Path of a file derived from the layer (e.g. compiled season windows), stored
+        with the cache.
+
+        Args:
+            suffix (str): File name suffix (e.g. '_seasons.npz')
+
+        Returns (str):
+        """
+        stem = os.path.splitext(os.path.basename(self.parquet_path))[0]
+        return os.path.join(self.cache_dir, f"{stem}{suffix}")
+
+    def load(self, columns=None):
+        """
+        Load a layer, converting the shapefile when the cache is missing or stale.
+
+        Args:
+            columns (List[str]): Columns to read (default: all). Without 'geometry'
+                a plain DataFrame is returned.
+
+        Returns (gpd.GeoDataFrame or pd.DataFrame): Layer in shapefile row order
+        """
+        columns = list(columns) if columns is not None else None
+        if pyarrow is None:
+            gdf = compact_dtypes(gpd.read_file(self.shp_path))
+            return gdf if columns is None else gdf[columns]
+        self.ensure()
+        if columns is not None and GEOMETRY not in columns:
+            return pd.read_parquet(self.parquet_path, columns=columns)
+        return gpd.read_parquet(self.parquet_path, columns=columns)
+
+
+def read_layer(shp_path, columns=None):
+    """
+    Read columns of an input layer through its GeoParquet cache.
+
+    Args:
+        shp_path (str): Shapefile path
+        columns (List[str]): Columns to read (default: all)
+
+    Returns (gpd.GeoDataFrame or pd.DataFrame): Layer in shapefile row order
+    """
+    return LayerCache(shp_path).load(columns)
@@ -7,30 +7,61 @@ import configparser
 import logging
 import os
 import platform
-from datetime import datetime
+from datetime import datetime, time
 
 import pytz
 import utils
-from constants import CONFIG_INI, PQPF_DATA_DIR, ROOT_DIR, TP_DATA_DIR
+from artifacts import CSVArtifacts
+from constants import CONFIG_INI, PQPF_DATA_DIR, PQPF_JOBS, ROOT_DIR, TP_DATA_DIR
+from pipeline import Pipeline
 
 logger = logging.getLogger(__name__)
 
 
 class DirectoryConfig:
-    def __init__(self, state: str, db: str):
+    def __init__(
+        self,
+        state: str,
+        db: str,
+        jobs: int = PQPF_JOBS,
+        run_date=None,
+        work_root: str = None,
+    ):
         """
         Initialize configuration and directory management.
 
         Args:
             state (str): State abbreviation
             db (str): Database configuration section name
+            jobs (int): Worker processes for per-forecast-hour PQPF processing
+            run_date (datetime.date): Forecast date of a past run (backfill), today
+                when None
+            work_root (str): Root of the outputs, intermediate and run directories,
+                the state's data directory by default (the inputs always stay there)
         """
         self._state = state.upper()
         self._db = db
+        self._jobs = max(1, int(jobs))
         self._config = configparser.ConfigParser()
         self._config.read(CONFIG_INI)
-        self._date_today = datetime.now(pytz.timezone("America/New_York")).date()
+        self._run_date = run_date
+        self._date_today = (
+            run_date or datetime.now(pytz.timezone("America/New_York")).date()
+        )
         self._data_root = os.path.join(PQPF_DATA_DIR, self._state.lower())
+        self._work_root = work_root or self._data_root
+        self._cleaned = set()
+        self._pipeline = None
+        self._artifacts = None
+
+    def _work_directory(self, path: str) -> str:
+        """
+        Create a working directory, emptying it the first time this run uses it.
+        Later accesses keep the files written so far in the run.
+        """
+        delete = path not in self._cleaned
+        self._cleaned.add(path)
+        return utils.create_directory(path, delete=delete)
 
     @property
     def os_type(self) -> str:
@@ -42,11 +73,26 @@ class DirectoryConfig:
         """State abbreviation in uppercase."""
         return self._state
 
+    @property
+    def jobs(self) -> int:
+        """Worker processes for per-forecast-hour PQPF processing."""
+        return self._jobs
+
     @property
     def date_today(self) -> datetime.date:
-        """Today's date in America/New_York timezone."""
+        """Today's date in America/New_York timezone (the run date of a backfill)."""
         return self._date_today
 
+    @property
+    def created(self) -> datetime:
+        """
+        Time stored with the database rows: the start of the run date for a
+        backfill, None (database server time) for today's run.
+        """
+        if self._run_date is None:
+            return None
+        return datetime.combine(self._run_date, time())
+
     @property
     def config(self) -> configparser.ConfigParser:
         """Configuration parser instance."""
@@ -69,12 +115,15 @@ class DirectoryConfig:
         """Directory for input files."""
         return os.path.join(self._data_root, "inputs")
 
+    @property
+    def archive_dir(self) -> str:
+        """Directory of the daily PQPF cube archive (shared with backfills)."""
+        return os.path.join(self._data_root, "archive")
+
     @property
     def outputs_dir(self) -> str:
         """Directory for output files."""
-        return utils.create_directory(
-            os.path.join(self._data_root, "outputs"), delete=True
-        )
+        return self._work_directory(os.path.join(self._work_root, "outputs"))
 
     @property
     def grb_raw_dir(self) -> str:
@@ -84,24 +133,45 @@ class DirectoryConfig:
     @property
     def intermediate_dir(self) -> str:
         """Directory for intermediate processing files."""
-        return utils.create_directory(
-            os.path.join(self._data_root, "intermediate"), delete=True
-        )
+        return self._work_directory(os.path.join(self._work_root, "intermediate"))
 
     @property
     def grb_subsets_dir(self) -> str:
         """Directory for subset GRIB files."""
-        return utils.create_directory(
-            os.path.join(self._data_root, "intermediate", "subsets"), delete=True
+        return self._work_directory(
+            os.path.join(self._work_root, "intermediate", "subsets")
         )
 
     @property
     def tiffs_dir(self) -> str:
         """Directory for TIFF files."""
-        return utils.create_directory(
-            os.path.join(self._data_root, "intermediate", "tiffs"), delete=True
+        return self._work_directory(
+            os.path.join(self._work_root, "intermediate", "tiffs")
         )
 
+    @property
+    def run_dir(self) -> str:
+        """Directory of today's run manifest and stage checkpoints."""
+        return os.path.join(self._work_root, "runs", self._date_today.isoformat())
+
+    @property
+    def pipeline(self) -> Pipeline:
+        """Checkpointed stages of today's run."""
+        if self._pipeline is None:
+            self._pipeline = Pipeline(self.run_dir, label=self._state)
+        return self._pipeline
+
+    @property
+    def artifacts(self) -> CSVArtifacts:
+        """Background writer of the run's CSV outputs ([<state>.Outputs] WRITE_CSV)."""
+        if self._artifacts is None:
+            self._artifacts = CSVArtifacts(
+                self._config.getboolean(
+                    f"{self._state}.Outputs", "WRITE_CSV", fallback=True
+                )
+            )
+        return self._artifacts
+
     @property
     def lease_shp(self) -> str:
         """Path to lease shapefile."""
@@ -114,12 +184,17 @@ class DirectoryConfig:
         """GCP bucket name."""
         return self._config["gcp.bucket"]["BUCKET_NAME"]
 
+    @property
+    def tp_outputs_dir(self) -> str:
+        """Directory of the tp_{hours}h.tif total precipitation accumulations."""
+        if self._work_root == self._data_root:
+            return os.path.join(TP_DATA_DIR, self._state.lower(), "outputs")
+        return os.path.join(self._work_root, "tp_outputs")
+
     @property
     def tp_intermediate_dir(self) -> str:
         """Directory for total precipitation intermediate processing files."""
-        return utils.create_directory(
-            os.path.join(TP_DATA_DIR, "intermediate"), delete=True
-        )
+        return self._work_directory(os.path.join(TP_DATA_DIR, "intermediate"))
 
 
 class NotificationConfig:
@@ -0,0 +1,121 @@
+"""
+Multi-state PQPF run.
+
+Today's PQPF GRB files are downloaded and decoded once, cropped to the union of the
+state bounding boxes, and the NC, SC and FL processors then run concurrently off
+the same in-memory cubes.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import constants as ct
+from pqpf_procs import parse_range, subset_and_decode
+
+logger = logging.getLogger(__name__)
+
+
+def union_bbox(config, states):
+    """
+    Union of the state bounding boxes.
+
+    Args:
+        config (configparser.ConfigParser): Analysis settings
+        states (List[str]): State abbreviations
+
+    Returns (tuple[str, str]): wgrib2 longitude and latitude ranges
+    """
+    lons = [parse_range(config[state]["LON_WE"]) for state in states]
+    lats = [parse_range(config[state]["LAT_SN"]) for state in states]
+    lon_we = f"{min(v[0] for v in lons):g}:{max(v[1] for v in lons):g}"
+    lat_sn = f"{min(v[0] for v in lats):g}:{max(v[1] for v in lats):g}"
+    return lon_we, lat_sn
+
+
+class SharedPQPF:
+    def __init__(self, procs, states, jobs=ct.PQPF_JOBS):
+        """
+        Download and decode PQPF once for several states.
+
+        Args:
+            procs (PQPFProcs): PQPF processing instance of any state (used for the
+                state independent download and date check)
+            states (List[str]): State abbreviations
+            jobs (int): Worker processes for the forecast hours
+        """
+        self.procs = procs
+        self.states = states
+        self.jobs = max(1, jobs)
+        self.grb_raw_dir = procs.grb_raw_dir
+        self.subsets_dir = os.path.join(ct.PQPF_DATA_DIR, "shared", "subsets")
+
+    def ingest(self):
+        """
+        Download today's PQPF GRB files, cropping each forecast hour to the union
+        bounding box and decoding all thresholds as soon as its transfer completes.
+
+        Returns (tuple[bool, dict]): True when the raw GRB files are today's data,
+            and {hour label: PQPFCube} on the native PQPF grid
+        """
+        return self.procs.ingest(
+            decode=self.decoder(),
+            decodes=lambda fname: True,
+            jobs=self.jobs,
+            spill_dir=self.subsets_dir,
+        )
+
+    def decode_archive(self, archive_dir, date):
+        """
+        Crop the archived PQPF GRB files of a past run to the union bounding box and
+        decode all thresholds.
+
+        Args:
+            archive_dir (str): Directory of archived raw GRB files
+            date (datetime.date): Run date
+
+        Returns (dict): {hour label: PQPFCube} on the native PQPF grid
+        """
+        return self.procs.decode_archive(
+            archive_dir, date, decode=self.decoder(), decodes=lambda fname: True
+        )
+
+    def decoder(self):
+        """
+        Returns (callable): Subset-and-decode worker of the union bounding box
+        """
+        lon_we, lat_sn = union_bbox(self.procs.config, self.states)
+        logger.info(f"Union bounding box: {lon_we} {lat_sn}")
+        return partial(
+            subset_and_decode,
+            self.procs.wgrib2,
+            lon_we=lon_we,
+            lat_sn=lat_sn,
+            thresholds=None,
+            dst_srs=None,
+        )
+
+
+def run_states(tasks):
+    """
+    Run state tasks concurrently; a failing state does not stop the others.
+
+    Args:
+        tasks (dict): {state: callable}
+
+    Returns (dict): {state: True when the task finished}
+    """
+    results = {}
+    if not tasks:
+        return results
+    with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+        futures = {state: pool.submit(task) for state, task in tasks.items()}
+        for state, future in futures.items():
+            try:
+                future.result()
+                results[state] = True
+            except (Exception, SystemExit) as e:  # error_process exits via SystemExit
+                logger.error(f"{state} run failed: {e!r}")
+                results[state] = False
+    return results
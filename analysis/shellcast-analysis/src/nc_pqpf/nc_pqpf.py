@@ -2,16 +2,19 @@ import logging.config
 import os
 import warnings
 from datetime import datetime
+from functools import partial
 
 import constants as ct
-import geopandas as gpd
+import grid_index
+import layer_cache
 import numpy as np
 import pandas as pd
-import rasterio
+import pipeline
+import raster_sampling
+import telemetry
 import utils
 from pqpf_procs import PQPFProcs
 from shapely.errors import ShapelyDeprecationWarning
-from shapely.geometry import Point
 
 warnings.filterwarnings("ignore", category=ShapelyDeprecationWarning)
 
@@ -25,10 +28,10 @@ class NCPQPF:
         self.connect_str = config_dirs.connect_str
         self.inputs_dir = config_dirs.inputs_dir
         self.grb_raw_dir = config_dirs.grb_raw_dir
-        self.tiffs_dir = config_dirs.tiffs_dir
         self.lease_shp = config_dirs.lease_shp
         self.outputs_dir = config_dirs.outputs_dir
         self.outfile_date = config_dirs.date_today.strftime("%Y-%m-%d")
+        self.created = config_dirs.created
         self.intermediate_dir = config_dirs.intermediate_dir
         self.cmu_shp = os.path.join(self.inputs_dir, self.config[self.state]["CMU_SHP"])
         self.use_cols = [
@@ -44,9 +47,12 @@ class NCPQPF:
         ]
 
         self.procs = PQPFProcs(config_dirs)
+        self.pipeline = config_dirs.pipeline
+        self.artifacts = config_dirs.artifacts
         # Use config value if save parameter is None, otherwise use the provided value
         self.save = self.config[f"{self.state}.SaveToDB"].getboolean("SAVE_TO_DB")
 
+    @telemetry.timed()
     def nc_get_thresholds(self):
         """
         Get unique rain_in values.
@@ -57,8 +63,9 @@ class NCPQPF:
         """
         logger.info("[Get unique rainfall thresholds]")
         try:
-            gdf = gpd.read_file(self.lease_shp)
-            gdf = gdf[self.use_cols]
+            gdf = layer_cache.read_layer(
+                self.lease_shp, [self.config[self.state]["LEASE_SHP_COL_RAIN_IN"]]
+            )
             thresholds = sorted(
                 gdf.rain_in.unique()
             )  # Returns list of class numpy.float64
@@ -74,42 +81,46 @@ class NCPQPF:
             msg = "Failed to get rainfall thresholds."
             utils.error_process(msg, e)
 
-    def ras_values_to_pts(self, pts_shp, what_lyr):
+    @telemetry.timed()
+    def ras_values_to_pts(self, pts_shp, what_lyr, cubes):
         """
         --- [ NC ] ---
-        Assign PQPF raster values to leases.
+        Assign PQPF raster values to leases. Lease row/col indices come from the cached
+        grid index and every threshold band of a forecast hour is gathered in one
+        indexed read.
 
+        Args:
+            pts_shp (str): Lease or CMU point shapefile path
+            what_lyr (str): 'cmu' or 'lease'
+            cubes (dict): {hour label: PQPFCube} from :func:`PQPFProcs.ingest`
         Returns (gpd.GeoDataFrame): DataFrame containing each lease's lease_id, cmu_name, rain_in,
             pqpf_24h, pqpf_48h, pqpf_72h columns with values.
         """
         logger.info("[Get PQPF raster value]")
         logger.info(f"{'-' * 5} {what_lyr.upper()} {'-' * 5}")
         try:
-            gdf = gpd.read_file(pts_shp)
-            result_gdf = gpd.GeoDataFrame()
             if what_lyr == "cmu":
-                gdf = gdf[self.cmu_use_cols]
+                gdf = layer_cache.read_layer(pts_shp, self.cmu_use_cols)
+                group_col = self.config[self.state]["CMU_SHP_COL_CMU_NAME"]
             elif what_lyr == "lease":
-                gdf = gdf[self.use_cols]
-            tiffs = utils.list_files(self.tiffs_dir, ".tif")
-
-            for tiff in tiffs:
-                tiff_fname = os.path.basename(tiff)
-
-                logger.info(f"Process: {tiff_fname}")
-                src = rasterio.open(tiff)
-                fname = os.path.basename(tiff)
-                match = utils.regex_find(ct.REG_PATTERN_GRB_HOURS, fname)
-                if match and len(match) > 0:
-                    file_hour = f"{match[0][2:]}"
-                    hour = str(int(file_hour) + ct.TO_HOUR) + "h"
-                    rainfall_str = fname.split("_")[-1].split(".")[0]
-                    rainfall_in = float(rainfall_str.replace("p", "."))
-                    gdf_q = gdf.query(f"rain_in == {rainfall_in}").copy()
-                    coords = [(Point(i).x, Point(i).y) for i in gdf_q.geometry]
-                    gdf_q[f"pqpf_{hour}"] = [x for x in src.sample(coords)]
-                    result_gdf = pd.concat([result_gdf, gdf_q])
-                    logger.info(f"pqpf_{hour}: {rainfall_in} in ---> Done")
+                gdf = layer_cache.read_layer(pts_shp, self.use_cols)
+                group_col = self.config[self.state]["LEASE_SHP_COL_CMU_NAME"]
+            lease_index = grid_index.LeaseGridIndex(pts_shp, group_col)
+            rain_in = gdf["rain_in"].to_numpy(dtype="float64")
+            matched = np.zeros(len(gdf.index), dtype=bool)
+            columns = {}
+
+            for hour, cube in sorted(cubes.items()):
+                index = lease_index.load(cube.transform, cube.shape, gdf=gdf)
+                band_idx = cube.band_lookup(rain_in)
+                matched |= band_idx >= 0
+                columns[f"pqpf_{hour}"] = raster_sampling.gather(
+                    cube.data, band_idx, index.rows, index.cols, index.inside
+                )
+                logger.info(
+                    f"pqpf_{hour}: {', '.join(str(t) for t in cube.thresholds)} in ---> Done"
+                )
+            result_gdf = gdf.assign(**columns)[matched]
             logger.info(utils.done_str)
             return result_gdf
 
@@ -117,10 +128,11 @@ class NCPQPF:
             msg = "Raster values to points failed."
             utils.error_process(msg, e)
 
+    @telemetry.timed()
     def cmu_mean(self, df, group_col, what_lyr):
         """
         --- [ NC ] ---
-        Calculate each CMU mean value for qppf_24h, pqpf_48h, and pqpf_72h and saves the data in CSV.
+        Calculate each CMU mean value for qppf_24h, pqpf_48h, and pqpf_72h.
             # mean >= 0.9	Very High	5
             # mean >= 0.75	High	    4
             # mean >= 0.5	Moderate	3
@@ -130,7 +142,8 @@ class NCPQPF:
             df (DataFrame): Each lease has cmu_name, rain_in, and probabilities.
             group_col (str): CMU name field (e.g. 'cmu_name')
             what_lyr (str): 'cmu' or 'lease'
-        Returns (str): CMU probability CSV file path
+        Returns (DataFrame): CMU name and prob_1d_perc, prob_2d_perc, prob_3d_perc
+            categories
         """
         logger.info("[Calculate CMU mean values]")
         logger.info(f"{'-' * 5} {what_lyr.upper()} {'-' * 5}")
@@ -141,15 +154,10 @@ class NCPQPF:
                 "pqpf_48h": "prob_2d_perc",
                 "pqpf_72h": "prob_3d_perc",
             }
-            # Delete previous outputs
-            utils.delete_files(self.outputs_dir)
-            out_csv_path = os.path.join(
-                self.intermediate_dir, f"pqpf_{what_lyr}_{self.outfile_date}.csv"
-            )
             # group_col = [self.config[self.state]['LEASE_SHP_COL_CMU_NAME']]
             metric_cols = ["pqpf_24h", "pqpf_48h", "pqpf_72h"]
-            aggs = df.groupby(group_col)[metric_cols].mean()  # Aggregate by CMU
-            aggs.to_csv(os.path.join(self.intermediate_dir, "aggs.csv"))
+            # Aggregate by CMU
+            aggs = df.groupby(group_col, observed=True)[metric_cols].mean()
 
             for key in rename_cols.keys():
                 prob_col = aggs[key]
@@ -162,41 +170,67 @@ class NCPQPF:
                 ]
                 aggs[key] = np.select(cond_lst, cat_labels)
                 aggs = aggs.rename({key: rename_cols[key]}, axis=1)
-            aggs.to_csv(out_csv_path)
             logger.info(utils.done_str)
-            return out_csv_path
+            return aggs.reset_index()
 
         except Exception as e:
             msg = "CMU mean process failed."
             utils.error_process(msg, e)
 
     @staticmethod
-    def csv_concat(lease_csv_fpath, cmu_csv_fpath, csv_out_fpath):
+    @telemetry.timed()
+    def concat_probs(lease_df, cmu_df):
         """
         --- [ NC ] ---
         Merge lease points' probabilities and the CMU centroid point probabilities where the CMUs
         don't have lease points.
         Args:
-            lease_csv_fpath (str): lease probabilities CSV file path
-            cmu_csv_fpath (str): CMU probabilities CSV file path
-            csv_out_fpath (str): Resulting CSV file path
+            lease_df (DataFrame): Lease probabilities by CMU from :meth:`cmu_mean`
+            cmu_df (DataFrame): CMU centroid probabilities from :meth:`cmu_mean`
+        Returns (DataFrame): CMU probabilities
         """
-        logger.info("[Concatenate CSV files]")
+        logger.info("[Concatenate CMU probabilities]")
         column = "cmu_name"
-        df1 = pd.read_csv(lease_csv_fpath)
-        df2 = pd.read_csv(cmu_csv_fpath)
-        df3 = df2[~df2.cmu_name.isin(df1.cmu_name)]
-        df4 = pd.concat([df1, df3])
-        df4 = df4.sort_values(by=[column])
-        df4.to_csv(csv_out_fpath, index=False)
+        missing = cmu_df[~cmu_df.cmu_name.isin(lease_df.cmu_name)]
+        df = pd.concat([lease_df, missing])
+        df = df.sort_values(by=[column])
         logger.info(utils.done_str)
+        return df
 
-    def main(self) -> None:
+    def aggregate(self, dfs, lyrs, csv_out_fpath):
         """
-        Runs NC PQPF data extraction and save the results in a database.
+        --- [ NC ] ---
+        Aggregate lease and CMU probabilities by CMU and merge them.
+
+        Args:
+            dfs (dict): {'lease' or 'cmu': DataFrame from ras_values_to_pts}
+            lyrs (dict): {'lease' or 'cmu': [shapefile path, CMU name field]}
+            csv_out_fpath (str): Resulting CSV file path
+        Returns (dict): {CSV file path: DataFrame} of the CMU probabilities
+            (csv_out_fpath) and of each layer's CMU means
+        """
+        means = {
+            key: self.cmu_mean(dfs[key], vals[1], key) for key, vals in lyrs.items()
+        }
+        frames = {csv_out_fpath: self.concat_probs(means["lease"], means["cmu"])}
+        for key, df in means.items():
+            fpath = os.path.join(
+                self.intermediate_dir, f"pqpf_{key}_{self.outfile_date}.csv"
+            )
+            frames[fpath] = df
+        return frames
+
+    def process(self, cubes) -> None:
+        """
+        Extract lease and CMU probabilities from decoded PQPF cubes and save them.
+        Sampling, aggregation and the database insert are checkpointed stages, so a
+        rerun with the same cubes only repeats the steps that did not finish. The
+        probabilities go to the database in memory; the CSV files are written in the
+        background.
+
+        Args:
+            cubes (dict): {hour label: PQPFCube} covering the NC leases
         """
-        start = datetime.now()
-        utils.db_connection_test(self.connect_str)
         lyrs = {
             "lease": [
                 self.lease_shp,
@@ -204,30 +238,66 @@ class NCPQPF:
             ],
             "cmu": [self.cmu_shp, self.config[self.state]["CMU_SHP_COL_CMU_NAME"]],
         }
-        csv_fpaths = []
+        csv_out_fpath = os.path.join(
+            self.outputs_dir, f"pqpf_cmu_probs_{self.outfile_date}.csv"
+        )
+        cubes_key = pipeline.digest(cubes)
+        dfs = {
+            key: self.pipeline.stage(
+                f"sample.{key}",
+                partial(self.ras_values_to_pts, vals[0], key, cubes),
+                params={"cubes": cubes_key},
+                files=pipeline.shapefile_files(vals[0]),
+            )
+            for key, vals in lyrs.items()
+        }
+        frames = self.pipeline.stage(
+            "aggregate",
+            partial(self.aggregate, dfs, lyrs, csv_out_fpath),
+            params={"date": self.outfile_date},
+            deps=[f"sample.{key}" for key in lyrs],
+        )
+        if ct.ARCHIVE_CUBES:
+            self.pipeline.stage(
+                "archive",
+                partial(self.procs.archive_cubes, self.outfile_date, cubes),
+                params={"date": self.outfile_date, "cubes": cubes_key},
+            )
+        for fpath, df in frames.items():
+            self.artifacts.write(df, fpath)
+        if self.save:
+            self.pipeline.stage(
+                "persist",
+                partial(
+                    utils.save_df_to_db,
+                    self.connect_str,
+                    frames[csv_out_fpath],
+                    self.created,
+                ),
+                deps=["aggregate"],
+            )
+
+    def main(self) -> None:
+        """
+        Runs NC PQPF data extraction and save the results in a database.
+        """
+        start = datetime.now()
+        utils.db_connection_test(self.connect_str)
 
         # Get data
-        utils.delete_outdated_grbs(self.grb_raw_dir)
-        files = self.procs.get_files_to_download()
-        utils.download_grbs(self.grb_raw_dir, files, ct.PQPF_FTP_URL, ct.PQPF_FTP_CWD)
-        to_db_bool = self.procs.check_grb_files()
+        thresholds = self.nc_get_thresholds()
+        to_db_bool, cubes = self.pipeline.stage(
+            "ingest",
+            partial(self.procs.ingest, thresholds),
+            params={"date": self.outfile_date, "thresholds": thresholds},
+            outputs=lambda _: utils.get_raw_grb_list(self.grb_raw_dir),
+            checkpoint_if=lambda result: result[0],
+        )
 
         # Save data to DB
         if to_db_bool:
-            csv_out_fpath = os.path.join(
-                self.outputs_dir, f"pqpf_cmu_probs_{self.outfile_date}.csv"
-            )
             # Process data
-            self.procs.small_grb()
-            thresholds = self.nc_get_thresholds()
-            self.procs.grb_to_tiff(thresholds)
-            for key, vals in lyrs.items():
-                df = self.ras_values_to_pts(vals[0], key)
-                csv_path = self.cmu_mean(df, vals[1], key)
-                csv_fpaths.append(csv_path)
-            self.csv_concat(csv_fpaths[0], csv_fpaths[1], csv_out_fpath)
-            if self.save:
-                utils.save_to_db(self.connect_str, csv_out_fpath)
+            self.process(cubes)
         else:
             logger.info(
                 f"Raw GRB files date is not today. {'!' * 5} DATA NOT SAVED IN DATABASE {'!' * 5}"
@@ -7,6 +7,7 @@ from datetime import datetime
 from email.message import EmailMessage
 
 import pandas as pd
+import telemetry
 import utils
 from constants import PQPF_DATA_DIR
 from cryptography.fernet import Fernet
@@ -509,6 +510,7 @@ class EmailNotification:
         self.log_manager = NotificationLogManager(self.dir_config.connect_str)
         logger.info(f"Initialized EmailNotification for state: {state}")
 
+    @telemetry.timed()
     def send(self):
         logger.info("[Send Notifications]")
         try:
@@ -654,6 +656,7 @@ class DevEmailNotificationFL:
             )
             raise
 
+    @telemetry.timed()
     def send(self):
         """Main function to handle Gmail operations"""
         try:
@@ -0,0 +1,227 @@
+"""
+Checkpointed analysis stages.
+
+A state run is a sequence of named stages (ingest, sample, aggregate, persist,
+notify). Every stage is keyed on a content hash of its inputs (parameters,
+input files and the keys of the stages it depends on) and recorded with the hashes
+of its output files in a run manifest (``<data root>/runs/<date>/manifest.json``).
+A rerun skips a stage whose key and outputs are unchanged and returns its
+checkpointed result, so a run that failed at the database or SMTP step resumes
+there instead of reprocessing the PQPF data.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FNAME = "manifest.json"
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(fpath):
+    """
+    SHA-256 of a file's contents.
+
+    Args:
+        fpath (str): File path
+
+    Returns (str): Hex digest
+    """
+    sha = hashlib.sha256()
+    with open(fpath, "rb") as rf:
+        for chunk in iter(lambda: rf.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def shapefile_files(shp_path):
+    """
+    Files of a shapefile (.shp and its .shx, .dbf, .prj, ... companions).
+
+    Args:
+        shp_path (str): Shapefile path
+
+    Returns (List[str]):
+    """
+    stem = os.path.splitext(shp_path)[0]
+    return sorted(glob.glob(f"{glob.escape(stem)}.*"))
+
+
+def _update(sha, value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        sha.update(json.dumps(value).encode("utf-8"))
+    elif isinstance(value, dict):
+        sha.update(b"{")
+        for key in sorted(value, key=str):
+            _update(sha, str(key))
+            _update(sha, value[key])
+        sha.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        sha.update(b"[")
+        for item in value:
+            _update(sha, item)
+        sha.update(b"]")
+    elif hasattr(value, "tobytes") and hasattr(value, "dtype"):
+        # NumPy arrays (including memory-mapped ones)
+        sha.update(f"{value.dtype}{value.shape}".encode("utf-8"))
+        sha.update(value.tobytes())
+    elif hasattr(value, "__dict__"):
+        sha.update(type(value).__name__.encode("utf-8"))
+        _update(sha, vars(value))
+    else:
+        sha.update(repr(value).encode("utf-8"))
+
+
+def digest(value):
+    """
+    SHA-256 of a value (JSON-like structures, NumPy arrays and plain objects).
+
+    Args:
+        value: Value to hash
+
+    Returns (str): Hex digest
+    """
+    sha = hashlib.sha256()
+    _update(sha, value)
+    return sha.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, run_dir, keep_runs=7, label=None):
+        """
+        Run manifest and checkpoints of one state's daily run.
+
+        Args:
+            run_dir (str): Directory of this run (e.g. '<data root>/runs/2024-01-14')
+            keep_runs (int): Number of most recent run directories kept next to it
+            label (str): Prefix of the stage names in the run telemetry (e.g. 'NC')
+        """
+        self.run_dir = run_dir
+        self.label = label
+        self.manifest_path = os.path.join(run_dir, MANIFEST_FNAME)
+        os.makedirs(run_dir, exist_ok=True)
+        self._prune(keep_runs)
+        self.manifest = {"stages": {}, "files": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as rf:
+                self.manifest = json.load(rf)
+
+    def _prune(self, keep_runs):
+        runs_root = os.path.dirname(self.run_dir)
+        runs = sorted(
+            name
+            for name in os.listdir(runs_root)
+            if os.path.isdir(os.path.join(runs_root, name))
+        )
+        for name in runs[:-keep_runs]:
+            if os.path.join(runs_root, name) != self.run_dir:
+                shutil.rmtree(os.path.join(runs_root, name), ignore_errors=True)
+
+    def _save(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(self.manifest, wf, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def file_digest(self, fpath):
+        """
+        Content hash of a file, reused from the manifest while its size and
+        modification time are unchanged.
+
+        Args:
+            fpath (str): File path
+
+        Returns (str): Hex digest, None when the file doesn't exist
+        """
+        if not os.path.isfile(fpath):
+            return None
+        stat = os.stat(fpath)
+        cached = self.manifest["files"].get(fpath)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        value = file_digest(fpath)
+        self.manifest["files"][fpath] = [stat.st_size, stat.st_mtime_ns, value]
+        return value
+
+    def stage_key(self, name):
+        """Key recorded for a finished stage, None when it hasn't run."""
+        entry = self.manifest["stages"].get(name)
+        return entry["key"] if entry else None
+
+    def _checkpoint_path(self, name):
+        return os.path.join(self.run_dir, f"{name}.pkl")
+
+    def _is_fresh(self, name, key):
+        entry = self.manifest["stages"].get(name)
+        if entry is None or entry["key"] != key:
+            return False
+        for fpath, value in entry["outputs"].items():
+            if self.file_digest(fpath) != value:
+                return False
+        return os.path.exists(self._checkpoint_path(name))
+
+    def stage(
+        self,
+        name,
+        func,
+        params=None,
+        files=(),
+        deps=(),
+        outputs=None,
+        checkpoint_if=None,
+    ):
+        """
+        Run a stage unless its inputs and outputs are unchanged since the last run.
+
+        Args:
+            name (str): Stage name (e.g. 'decode', 'sample.lease')
+            func (callable): Stage body without arguments
+            params: JSON-like parameters or in-memory inputs of the stage
+            files (List[str]): Input file paths
+            deps (List[str]): Names of stages this stage depends on
+            outputs (List[str] or callable): Output file paths, or a function
+                returning them from the stage result
+            checkpoint_if (callable): Predicate on the result; when it is False the
+                stage is not recorded and runs again next time (e.g. a download
+                that found incomplete data)
+
+        Returns: The stage result (loaded from the checkpoint when skipped)
+        """
+        key = digest(
+            {
+                "params": params,
+                "files": {fpath: self.file_digest(fpath) for fpath in sorted(files)},
+                "deps": {dep: self.stage_key(dep) for dep in deps},
+            }
+        )
+        stage_name = f"{self.label}.{name}" if self.label else name
+        if self._is_fresh(name, key):
+            logger.info(f"[Stage {name}] --- unchanged, skipped")
+            with telemetry.record(f"{stage_name} (checkpoint)"):
+                with open(self._checkpoint_path(name), "rb") as rf:
+                    return pickle.load(rf)
+
+        logger.info(f"[Stage {name}]")
+        with telemetry.record(stage_name):
+            result = func()
+        if checkpoint_if is not None and not checkpoint_if(result):
+            return result
+        out_paths = outputs(result) if callable(outputs) else outputs or []
+        with open(self._checkpoint_path(name), "wb") as wf:
+            pickle.dump(result, wf, protocol=pickle.HIGHEST_PROTOCOL)
+        self.manifest["stages"][name] = {
+            "key": key,
+            "outputs": {fpath: self.file_digest(fpath) for fpath in out_paths},
+            "finished": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._save()
+        return result
@@ -0,0 +1,188 @@
+"""
+In-memory PQPF probability cube.
+
+All threshold messages of a subset PQPF GRIB file are decoded into a single
+(threshold x y x x) NumPy array with its georeferencing, so the NC, SC and FL
+processors read probabilities directly instead of writing and re-opening one
+GeoTIFF per threshold.
+"""
+
+import json
+import logging
+import os
+
+import constants as ct
+import grib_inventory
+import numpy as np
+import raster_sampling
+import utils
+from affine import Affine
+from osgeo import gdal
+
+gdal.UseExceptions()
+logger = logging.getLogger(__name__)
+
+
+def hour_label(fname):
+    """
+    Forecast hour label of a PQPF file name (e.g. 'pqpf_p24i_conus_2022093012f030.grb'
+    or 'f030' -> '24h').
+
+    Args:
+        fname (str): PQPF file name or valid hour
+
+    Returns (str): Hour label, None when the name has no forecast hour.
+    """
+    match = utils.regex_find(ct.REG_PATTERN_GRB_HOURS, os.path.basename(fname))
+    if match and len(match) > 0:
+        return f"{int(match[-1][1:]) + ct.TO_HOUR}h"
+
+
+def grb_threshold_bands(grb_fpath):
+    """
+    Map rainfall thresholds (inches) to GRIB band numbers from the file's message
+    index (built once and stored next to the file).
+
+    Args:
+        grb_fpath (str): GRIB file path
+
+    Returns (dict): {threshold in inches: 1-based band number}
+    """
+    return grib_inventory.MessageIndex.for_file(grb_fpath).bands()
+
+
+class PQPFCube:
+    def __init__(self, data, thresholds, transform, crs, nodata=None, name=None):
+        """
+        PQPF probabilities of one forecast hour for a set of rainfall thresholds.
+
+        Args:
+            data (np.ndarray): Probabilities (threshold x y x x)
+            thresholds (List[float]): Sorted rainfall thresholds in inches, one per band
+            transform (affine.Affine): Grid affine transform
+            crs (str): Grid CRS as WKT
+            nodata (float): Nodata value
+            name (str): Cycle and forecast hour (e.g. '2022093012f030')
+        """
+        self.data = data
+        self.thresholds = [float(threshold) for threshold in thresholds]
+        self.transform = transform
+        self.crs = crs
+        self.nodata = nodata
+        self.name = name
+
+    @property
+    def shape(self):
+        """Grid (height, width)."""
+        return tuple(self.data.shape[1:])
+
+    @property
+    def hour(self):
+        """Forecast hour label (e.g. '24h')."""
+        return hour_label(self.name) if self.name else None
+
+    def __contains__(self, threshold):
+        return float(threshold) in self.thresholds
+
+    def band(self, threshold):
+        """
+        Probabilities for one threshold.
+
+        Args:
+            threshold (float): Rainfall threshold in inches
+
+        Returns (np.ndarray): 2D band
+        """
+        return self.data[self.thresholds.index(float(threshold))]
+
+    def band_lookup(self, values):
+        """
+        Band index per rainfall threshold value, -1 where the cube has no band.
+
+        Args:
+            values (array-like): Rainfall thresholds (e.g. each lease's rain_in)
+
+        Returns (np.ndarray):
+        """
+        return raster_sampling.band_lookup(self.thresholds, values)
+
+    def save(self, fpath):
+        """
+        Persist the cube as '<fpath>.npy' and '<fpath>.json'.
+
+        Args:
+            fpath (str): Path without extension
+        """
+        np.save(f"{fpath}.npy", self.data)
+        meta = {
+            "thresholds": self.thresholds,
+            "transform": list(self.transform.to_gdal()),
+            "crs": self.crs,
+            "nodata": self.nodata,
+            "name": self.name,
+        }
+        with open(f"{fpath}.json", "w") as wf:
+            json.dump(meta, wf)
+
+    @classmethod
+    def load(cls, fpath, mmap=True):
+        """
+        Load a cube saved by :func:`.save`.
+
+        Args:
+            fpath (str): Path without extension
+            mmap (bool): Memory-map the data instead of reading it
+
+        Returns (PQPFCube):
+        """
+        with open(f"{fpath}.json", "r") as rf:
+            meta = json.load(rf)
+        data = np.load(f"{fpath}.npy", mmap_mode="r" if mmap else None)
+        return cls(
+            data,
+            meta["thresholds"],
+            Affine.from_gdal(*meta["transform"]),
+            meta["crs"],
+            meta["nodata"],
+            meta["name"],
+        )
+
+
+def load_cube(grb_fpath, thresholds=None, dst_srs=None):
+    """
+    Decode the threshold messages of a PQPF GRIB file into a cube.
+
+    Args:
+        grb_fpath (str): Subset PQPF GRIB file path
+        thresholds (List[float]): Thresholds to keep, all thresholds when None
+        dst_srs (str): Optional CRS to warp the grid to (in memory)
+
+    Returns (PQPFCube):
+    """
+    bands = grb_threshold_bands(grb_fpath)
+    if thresholds is not None:
+        wanted = {float(threshold) for threshold in thresholds}
+        bands = {key: val for key, val in bands.items() if key in wanted}
+    inches = sorted(bands)
+    band_numbers = [bands[key] for key in inches]
+
+    ds = gdal.Open(grb_fpath)
+    if dst_srs and band_numbers:
+        warp_options = gdal.WarpOptions(
+            format="MEM", srcBands=band_numbers, dstSRS=dst_srs
+        )
+        ds = gdal.Warp("", ds, options=warp_options)
+        band_numbers = list(range(1, len(inches) + 1))
+    if band_numbers:
+        data = np.stack([ds.GetRasterBand(b).ReadAsArray() for b in band_numbers])
+        nodata = ds.GetRasterBand(band_numbers[0]).GetNoDataValue()
+    else:
+        data = np.empty((0, ds.RasterYSize, ds.RasterXSize), dtype="float64")
+        nodata = None
+    transform = Affine.from_gdal(*ds.GetGeoTransform())
+    crs = ds.GetProjection()
+    ds = None
+
+    name = os.path.basename(grb_fpath).split("_")[-1].split(".")[0]
+    logger.info(f"{name} --- decoded ({', '.join(str(i) for i in inches)} in)")
+    return PQPFCube(data, inches, transform, crs, nodata, name)
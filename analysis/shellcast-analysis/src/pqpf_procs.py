@@ -10,9 +10,15 @@ import os
 import sys
 import warnings
 from datetime import datetime
+from functools import partial
 
 import constants as ct
-import pygrib
+import cube_archive
+import grib_inventory
+import ingest
+import intermediates
+import pqpf_cube
+import telemetry
 import utils
 from shapely.errors import ShapelyDeprecationWarning
 
@@ -21,6 +27,67 @@ warnings.filterwarnings("ignore", category=ShapelyDeprecationWarning)
 logger = logging.getLogger(__name__)
 
 
+def parse_range(value):
+    """
+    Parse a wgrib2 range (e.g. '-79:-75').
+
+    Args:
+        value (str): Range string
+
+    Returns (tuple[float, float]):
+    """
+    low, high = (float(v) for v in value.split(":"))
+    return min(low, high), max(low, high)
+
+
+def small_grib(wgrib2, grb_fpath, out_dir, lon_we, lat_sn):
+    """
+    Crop a GRB file to a lon/lat box with wgrib2.
+
+    Args:
+        wgrib2 (str): wgrib2 command
+        grb_fpath (str): GRB file path
+        out_dir (str): Output directory
+        lon_we (str): Longitude range (e.g. '-79:-75')
+        lat_sn (str): Latitude range (e.g. '33:37')
+
+    Returns (str): Subset GRB file path
+    """
+    grb_fname = os.path.basename(grb_fpath)
+    out_grb_path = os.path.join(out_dir, f"sbs_{grb_fname}")
+    cmd = [wgrib2, grb_fpath, "-small_grib", lon_we, lat_sn, out_grb_path]
+    utils.cmd_subprocess(cmd)
+    logger.info(f"{grb_fname} --- cropped")
+    return out_grb_path
+
+
+def subset_and_decode(wgrib2, grb_fpath, out_dir, lon_we, lat_sn, thresholds, dst_srs):
+    """
+    Crop one forecast hour and decode it into a PQPF cube (process pool worker).
+
+    Args:
+        wgrib2 (str): wgrib2 command
+        grb_fpath (str): Raw GRB file path
+        out_dir (str): Directory of the intermediate GRB files
+        lon_we (str): Longitude range
+        lat_sn (str): Latitude range
+        thresholds (List[float]): Thresholds to keep, all thresholds when None
+        dst_srs (str): Optional CRS to warp the grid to
+
+    Returns (PQPFCube):
+    """
+    # Crop and decode only the messages of the thresholds
+    index = grib_inventory.MessageIndex.for_file(grb_fpath)
+    messages = index.select(thresholds)
+    if messages and len(messages) < len(index.messages):
+        src_fpath = os.path.join(out_dir, os.path.basename(grb_fpath))
+        index.extract(grb_fpath, src_fpath, messages)
+    else:
+        src_fpath = grb_fpath
+    sbs_fpath = small_grib(wgrib2, src_fpath, out_dir, lon_we, lat_sn)
+    return pqpf_cube.load_cube(sbs_fpath, thresholds, dst_srs)
+
+
 class PQPFProcs:
     def __init__(self, configs):
         """
@@ -33,17 +100,25 @@ class PQPFProcs:
         self.config = configs.config
         self.state = configs.state
         self.grb_raw_dir = configs.grb_raw_dir
-        self.tiffs_dir = configs.tiffs_dir
         self.grb_subsets_dir = configs.grb_subsets_dir
         self.inputs_dir = configs.inputs_dir
+        self.archive_dir = configs.archive_dir
         self.outfile_date = None
         self.bucket_name = configs.bucket_name
+        self.jobs = configs.jobs
 
+    @telemetry.timed()
     def get_input_files(self):
         logger.info("[Download CMU and leases spatial data from GCP bucket]")
         try:
             utils.download_files_from_gcloud_bucket(self.bucket_name, self.inputs_dir)
-            if len(os.listdir(self.inputs_dir)) == 19:
+            # Cache directories (grid_index, layer_cache) are not bucket files
+            files = [
+                fname
+                for fname in os.listdir(self.inputs_dir)
+                if os.path.isfile(os.path.join(self.inputs_dir, fname))
+            ]
+            if len(files) == 19:
                 logger.info(utils.done_str)
             else:
                 msg = "Download failed."
@@ -54,25 +129,37 @@ class PQPFProcs:
             msg = "Files to download failed."
             utils.error_process(msg, e)
 
-    def get_files_to_download(self):
+    @staticmethod
+    def grb_names(date=None):
+        """
+        Args:
+            date (datetime.date): Run date, today when None
+        Returns (List[str]): PQPF GRB file names of the date's run, in forecast hour
+            order
+        """
+        day = (date or datetime.today()).strftime("%Y%m%d")
+        return [f"{ct.GRB_PREFIX}_{day}{ct.Z_RUN}{hour}.grb" for hour in ct.VALID_HOURS]
+
+    @telemetry.timed()
+    def get_files_to_download(self, thresholds=None):
         """
-        List today's PQPF GRB files.
+        List today's PQPF GRB files that are missing or lack the messages of some
+        thresholds.
+        Args:
+            thresholds (List[float]): Rainfall thresholds (in) decoded by the run, all
+                thresholds when None
         Returns:
             list[str]: list of today's PQPF GRB files
         """
         logger.info("[PQPF GRB files to download]")
         try:
-            files = []
+            files = self.grb_names()
             files_to_download = []
-            today = datetime.today().strftime("%Y%m%d")
-            # Get GRB names for today
-            for hour in ct.VALID_HOURS:
-                fname = f"{ct.GRB_PREFIX}_{today}{ct.Z_RUN}{hour}.grb"
-                files.append(fname)
             # Check today's GRB files are already in the directory
             if len(files) > 0:
                 for f in files:
-                    if f not in os.listdir(self.grb_raw_dir):
+                    fpath = os.path.join(self.grb_raw_dir, f)
+                    if not grib_inventory.covers(fpath, thresholds):
                         files_to_download.append(f)
                 if len(files_to_download) > 0:
                     for f in files_to_download:
@@ -90,6 +177,7 @@ class PQPFProcs:
             msg = "Files to download failed."
             utils.error_process(msg, e)
 
+    @telemetry.timed()
     def check_grb_files(self):
         """
         Check downloaded PQPF data is current.
@@ -119,114 +207,171 @@ class PQPFProcs:
             logger.error(msg)
             sys.exit(0)
 
-    def wgrib2_small_grib(self, grb_fpath):
-        grb_fname = os.path.basename(grb_fpath)
-        try:
-            wgrib2 = "wgrib2"
-            if self.os_type == "Other":
-                wgrib2 = "/usr/local/bin/wgrib2"
-
-            out_grb_path = os.path.join(self.grb_subsets_dir, f"sbs_{grb_fname}")
-            cmd = [
-                wgrib2,
-                grb_fpath,
-                "-small_grib",
-                self.config[self.state]["LON_WE"],
-                self.config[self.state]["LAT_SN"],
-                out_grb_path,
-            ]
-            utils.cmd_subprocess(cmd)
-            logger.info(f"{grb_fname} --- cropped")
+    @property
+    def wgrib2(self):
+        """wgrib2 command (full path on macOS for cron)."""
+        return "/usr/local/bin/wgrib2" if self.os_type == "Other" else "wgrib2"
 
-        except Exception as e:
-            msg = f"{grb_fname} --- subset GRIB file failed."
-            utils.error_process(msg, e)
+    def raw_grbs(self):
+        """
+        Raw GRB files processed for the state (FL only uses the first valid hour).
+
+        Returns (List[str]): Sorted GRB file paths
+        """
+        grbs = sorted(utils.get_raw_grb_list(self.grb_raw_dir) or [])
+        return [grb for grb in grbs if self.decodes(grb)]
+
+    def decodes(self, grb_fname):
+        """Whether the state decodes a GRB file (FL only the first valid hour)."""
+        return self.state != "FL" or grb_fname.endswith(f"{ct.VALID_HOURS[0]}.grb")
+
+    def decoder(self, thresholds=None):
+        """
+        Subset-and-decode worker of the state's lon/lat box (picklable).
+
+        Args:
+            thresholds (List[float]): Rainfall thresholds to keep, all thresholds when
+                None
+        Returns (callable): worker(raw GRB path, out_dir=...) -> PQPFCube
+        """
+        return partial(
+            subset_and_decode,
+            self.wgrib2,
+            lon_we=self.config[self.state]["LON_WE"],
+            lat_sn=self.config[self.state]["LAT_SN"],
+            thresholds=thresholds,
+            dst_srs=None,
+        )
+
+    def scratch(self, spill_dir=None):
+        """
+        Storage of the intermediate GRB files of a decoding run: a RAM-backed
+        directory removed after the run, or the subsets directory when
+        ct.SPILL_INTERMEDIATES is set.
 
-    def small_grb(self) -> None:
+        Args:
+            spill_dir (str): Spill directory, the state's subsets directory by default
+        Returns (intermediates.Scratch):
+        """
+        if ct.SPILL_INTERMEDIATES:
+            return intermediates.Scratch("subsets", spill_dir or self.grb_subsets_dir)
+        return intermediates.Scratch("subsets")
+
+    @telemetry.timed()
+    def archive_cubes(self, day, cubes):
         """
-        Crop GRB files in small area.
+        Append a day's PQPF cubes, cropped to the state's bounding box, to the
+        state's archive. A failure is logged and does not stop the run.
+        Args:
+            day (datetime.date or str): Forecast date (YYYY-MM-DD)
+            cubes (dict): {hour label: PQPFCube}, on the state's or the multi-state
+                union grid
         """
-        logger.info("[Subset GRB file for small area]")
+        logger.info("[Archive PQPF cubes]")
         try:
-            utils.delete_files(self.grb_subsets_dir)
-            grbs = utils.get_raw_grb_list(self.grb_raw_dir)
-            if grbs and len(grbs) > 0:
-                if self.state == "FL":
-                    for grb in grbs:
-                        if grb.endswith("f030.grb"):
-                            self.wgrib2_small_grib(grb)
-                else:
-                    for grb in grbs:
-                        self.wgrib2_small_grib(grb)
+            west, east = parse_range(self.config[self.state]["LON_WE"])
+            south, north = parse_range(self.config[self.state]["LAT_SN"])
+            cube_archive.CubeArchive(self.archive_dir).append_cubes(
+                day, cubes, bounds=(west, south, east, north)
+            )
             logger.info(utils.done_str)
-
         except Exception as e:
-            msg = "Subset GRIB file failed."
-            utils.error_process(msg, e)
+            logger.error(f"Archiving the PQPF cubes failed: {e!r}")
 
-    def grb_to_tiff(self, thresholds) -> None:
+    @telemetry.timed()
+    def decode_archive(
+        self, archive_dir, date, thresholds=None, decode=None, decodes=None
+    ):
         """
-        Transform GRB to Tiff for each threshold.
+        Crop and decode the archived GRB files of a past run.
         Args:
-            thresholds (List[float]): List of unique rainfall thresholds
+            archive_dir (str): Directory of archived raw GRB files
+            date (datetime.date): Run date
+            thresholds (List[float]): Rainfall thresholds to keep, all thresholds when
+                None
+            decode (callable): Subset-and-decode worker taking out_dir, the state's
+                by default
+            decodes (callable): decodes(file name) -> whether to decode the file,
+                the state's files by default
+        Returns (dict): {hour label: PQPFCube} of the archived forecast hours
         """
-        logger.info("[Transform GRB to Tiff for each threshold]")
+        logger.info(f"[Decode archived GRBs of {date.isoformat()}]")
         try:
-            utils.delete_files(self.tiffs_dir)
-            dst_srs = "EPSG:4326" if self.state == "FL" else None
-
-            for grb_fpath in [
-                os.path.join(self.grb_subsets_dir, f)
-                for f in os.listdir(self.grb_subsets_dir)
-                if f.endswith("grb")
-            ]:
-                grbs = pygrib.open(grb_fpath)
-                fname = grb_fpath.split("_")[-1].split(".")[0]
-
-                for idx, grb in enumerate(grbs):
-                    if "upperLimit" in grb.keys():
-                        inches = round(grb.upperLimit / 25.4, 1)
-                        for threshold in thresholds:
-                            if float(threshold) == inches:
-                                rainfall_str = str(threshold).replace(".", "p")
-                                tiff_path = os.path.join(
-                                    self.tiffs_dir,
-                                    f"{ct.TIFF_PREFIX}_{fname}_{rainfall_str}.tif",
-                                )
-                                utils.run_gdal_to_tiff(
-                                    grb_fpath, tiff_path, {idx + 1}, dst_srs
-                                )
+            grbs = []
+            for fname in self.grb_names(date):
+                fpath = os.path.join(archive_dir, fname)
+                if not (decodes or self.decodes)(fname):
+                    continue
+                if os.path.exists(fpath):
+                    grbs.append(fpath)
+                else:
+                    logger.warning(f"{fname} --- not in the archive")
+            cubes = {}
+            with self.scratch() as scratch:
+                worker = partial(
+                    decode or self.decoder(thresholds), out_dir=scratch.dir
+                )
+                for grb in grbs:
+                    cube = worker(grb)
+                    cubes[cube.hour] = cube
             logger.info(utils.done_str)
+            return cubes
         except Exception as e:
-            msg = "GRB to TIFF transformation failed."
+            msg = "Archived GRB decoding failed."
             utils.error_process(msg, e)
 
-    def grb_to_tiff_all(self) -> None:
+    @telemetry.timed()
+    def ingest(
+        self, thresholds=None, decode=None, decodes=None, jobs=None, spill_dir=None
+    ):
         """
-        Transform GRB thresholds to TIFF.
+        Download today's PQPF GRB files and crop and decode each forecast hour as
+        soon as its transfer completes (see ingest.pipelined).
+        Args:
+            thresholds (List[float]): Rainfall thresholds (in) to download and keep,
+                all thresholds when None
+            decode (callable): Subset-and-decode worker taking out_dir, the state's
+                by default
+            decodes (callable): decodes(file name) -> whether to decode the file,
+                the state's files by default
+            jobs (int): Decoding worker processes, the state's by default
+            spill_dir (str): Directory of the intermediate GRB files when they are
+                spilled to disk, the state's subsets directory by default
+        Returns (tuple[bool, dict]): True when the raw GRB files are today's data,
+            and {hour label: PQPFCube} in forecast hour order
         """
-        logger.info("[Transform all GRB thresholds to TIFF]")
+        utils.delete_outdated_grbs(self.grb_raw_dir)
+        files_to_download = set(self.get_files_to_download(thresholds) or [])
+        logger.info("[Download, subset and decode GRBs]")
         try:
-            utils.delete_files(self.tiffs_dir)
-            dst_srs = "EPSG:4326" if self.state == "FL" else None
-            for grb_fpath in [
-                os.path.join(self.grb_subsets_dir, f)
-                for f in os.listdir(self.grb_subsets_dir)
-                if f.endswith("grb")
-            ]:
-                grbs = pygrib.open(grb_fpath)
-                fname = grb_fpath.split("_")[-1].split(".")[0]
-
-                for idx, grb in enumerate(grbs):
-                    if "upperLimit" in grb.keys():
-                        inches = float(round(grb.upperLimit / 25.4, 1))
-                        rainfall_str = str(inches).replace(".", "p")
-                        tiff_path = os.path.join(
-                            self.tiffs_dir,
-                            f"{ct.TIFF_PREFIX}_{fname}_{rainfall_str}.tif",
-                        )
-                        utils.run_gdal_to_tiff(grb_fpath, tiff_path, {idx + 1}, dst_srs)
+            downloader, fetch = utils.grb_fetcher(
+                self.grb_raw_dir, ct.PQPF_FTP_URL, ct.PQPF_FTP_CWD, thresholds
+            )
+
+            def fetch_missing(fname):
+                if fname in files_to_download:
+                    return fetch(fname)
+                return os.path.join(self.grb_raw_dir, fname)
+
+            try:
+                with self.scratch(spill_dir) as scratch:
+                    worker = partial(
+                        decode or self.decoder(thresholds), out_dir=scratch.dir
+                    )
+                    decoded = ingest.pipelined(
+                        self.grb_names(),
+                        fetch_missing,
+                        worker,
+                        fetch_workers=ct.FTP_MAX_WORKERS,
+                        decode_workers=jobs or self.jobs,
+                        queue_size=ct.INGEST_QUEUE_SIZE,
+                        keep=decodes or self.decodes,
+                    )
+            finally:
+                downloader.close()
+            cubes = {cube.hour: cube for cube in decoded.values()}
             logger.info(utils.done_str)
         except Exception as e:
-            msg = "GRB to TIFF transformation failed."
+            msg = "PQPF download and decoding failed."
             utils.error_process(msg, e)
+        return self.check_grb_files(), cubes
@@ -0,0 +1,70 @@
+"""
+Vectorized raster sampling for lease points.
+
+Lease coordinates are converted to raster row/col indices once with the raster
+affine transform, and the values of every threshold band are gathered with NumPy
+fancy indexing instead of sampling the rasters point-by-point.
+"""
+
+import numpy as np
+
+
+def rowcol_index(transform, shape, xs, ys):
+    """
+    Convert coordinates to raster row/col indices with the inverse affine transform.
+
+    Args:
+        transform (affine.Affine): Raster affine transform
+        shape (tuple[int, int]): Raster (height, width)
+        xs (array-like): X coordinates in the raster CRS
+        ys (array-like): Y coordinates in the raster CRS
+
+    Returns (tuple[np.ndarray, np.ndarray, np.ndarray]): Rows, columns and a mask of
+        coordinates inside the raster.
+    """
+    cols, rows = ~transform * (
+        np.asarray(xs, dtype="float64"),
+        np.asarray(ys, dtype="float64"),
+    )
+    rows = np.floor(rows).astype("int64")
+    cols = np.floor(cols).astype("int64")
+    inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+    return rows, cols, inside
+
+
+def band_lookup(band_values, values):
+    """
+    Map each value to the index of the band with the same value.
+
+    Args:
+        band_values (array-like): Sorted band values (e.g. rainfall thresholds)
+        values (array-like): Values to look up (e.g. each lease's rain_in)
+
+    Returns (np.ndarray): Band index per value, -1 where no band matches.
+    """
+    band_values = np.asarray(band_values, dtype="float64")
+    values = np.asarray(values, dtype="float64")
+    if len(band_values) == 0:
+        return np.full(len(values), -1, dtype="int64")
+    idx = np.clip(np.searchsorted(band_values, values), 0, len(band_values) - 1)
+    return np.where(band_values[idx] == values, idx, -1)
+
+
+def gather(stack, band_idx, rows, cols, inside):
+    """
+    Gather one value per point from a band stack in a single indexed read.
+
+    Args:
+        stack (np.ndarray): Band stack (band x y x x)
+        band_idx (np.ndarray): Band index per point, -1 for no band
+        rows (np.ndarray): Row index per point
+        cols (np.ndarray): Column index per point
+        inside (np.ndarray): Mask of points inside the raster
+
+    Returns (np.ndarray): Values per point, NaN where there is no band or the point
+        is outside the raster.
+    """
+    values = np.full(len(rows), np.nan, dtype="float64")
+    ok = inside & (band_idx >= 0)
+    values[ok] = stack[band_idx[ok], rows[ok], cols[ok]]
+    return values
@@ -0,0 +1,411 @@
+"""
+Sparse lease x grid-cell coverage weights for SC zonal means.
+
+The SC zonal mean used to be computed by upsampling each PQPF TIFF 100 times with
+bilinear resampling and running ``rasterstats.zonal_stats(all_touched=True)`` on the
+result. Both steps are linear in the coarse cell values, so the mean of every lease
+is a fixed weighted sum of a few coarse cells. The weights are built once per lease
+layer and grid, cached under ``inputs/grid_index``, and each forecast hour becomes a
+sparse matrix-vector product.
+
+GDAL drops nodata cells from the bilinear taps of each fine pixel and renormalizes
+the others, and a fine pixel whose own coarse cell is nodata is nodata. That is not
+linear per lease, so the fine pixels are also grouped by their four taps and own
+cell, with the summed renormalized tap weights of every valid-tap combination; the
+leases touching a nodata cell are recomputed from these groups.
+"""
+
+import json
+import logging
+import math
+import os
+
+import constants as ct
+import grid_index
+import layer_cache
+import numpy as np
+from affine import Affine
+from rasterio.features import geometry_mask
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the cached arrays or the cache key change
+CACHE_VERSION = 3
+TAP_BITS = np.array([1, 2, 4, 8])
+
+
+def _taps(rows, cols, factor):
+    """Top-left coarse tap and bilinear weights (tap x pixel) of fine pixels."""
+    # Fine pixel centers in coarse pixel-center coordinates
+    v = (rows + 0.5) / factor - 0.5
+    u = (cols + 0.5) / factor - 0.5
+    r0 = np.floor(v).astype("int64")
+    c0 = np.floor(u).astype("int64")
+    fv = v - r0
+    fu = u - c0
+    weights = np.stack([(1 - fv) * (1 - fu), (1 - fv) * fu, fv * (1 - fu), fv * fu])
+    return r0, c0, weights
+
+
+def _tap_cells(r0, c0, shape):
+    """Flat coarse cells (tap x pixel) of the four taps, clamped to the grid."""
+    cells = []
+    for dr, dc in [(0, 0), (0, 1), (1, 0), (1, 1)]:
+        r = np.clip(r0 + dr, 0, shape[0] - 1)
+        c = np.clip(c0 + dc, 0, shape[1] - 1)
+        cells.append(r * shape[1] + c)
+    return np.stack(cells)
+
+
+def bilinear_taps(rows, cols, factor, shape):
+    """
+    Coarse cells and weights of GDAL-style bilinear upsampling for fine pixels.
+
+    Args:
+        rows (np.ndarray): Fine pixel rows
+        cols (np.ndarray): Fine pixel columns
+        factor (int): Upsampling factor
+        shape (tuple[int, int]): Coarse grid (height, width)
+
+    Returns (tuple[np.ndarray, np.ndarray]): Flat coarse cell index and weight, four
+        taps per fine pixel.
+    """
+    r0, c0, weights = _taps(rows, cols, factor)
+    return _tap_cells(r0, c0, shape).ravel(), weights.ravel()
+
+
+def tap_groups(rows, cols, factor, shape):
+    """
+    Group fine pixels by their four bilinear taps and own coarse cell and sum their
+    renormalized tap weights for every combination of valid taps.
+
+    Args:
+        rows (np.ndarray): Fine pixel rows
+        cols (np.ndarray): Fine pixel columns
+        factor (int): Upsampling factor
+        shape (tuple[int, int]): Coarse grid (height, width)
+
+    Returns (tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]): Flat coarse
+        cells of the taps (group x 4), own cell tap position, pixel count and summed
+        weights (group x valid-tap mask x tap), the mask bit of tap t being 2**t.
+    """
+    r0, c0, weights = _taps(rows, cols, factor)
+    own = 2 * (rows // factor - r0) + (cols // factor - c0)
+    # r0 and c0 start at -1 on the top and left edges
+    key = ((r0 + 1) * (shape[1] + 1) + c0 + 1) * 4 + own
+    uniq, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    n_groups = len(uniq)
+    coefs = np.zeros((n_groups, len(TAP_BITS) ** 2, len(TAP_BITS)), dtype="float32")
+    for mask in range(coefs.shape[1]):
+        on = np.flatnonzero(mask & TAP_BITS)
+        total = weights[on].sum(axis=0)
+        for tap in on:
+            share = np.divide(
+                weights[tap], total, out=np.zeros_like(total), where=total > 0
+            )
+            coefs[:, mask, tap] = np.bincount(
+                inverse, weights=share, minlength=n_groups
+            )
+    cells = _tap_cells(r0[first], c0[first], shape).T
+    counts = np.bincount(inverse, minlength=n_groups)
+    return cells, own[first].astype("int8"), counts, coefs
+
+
+def lease_pixels(geom, transform, shape, factor):
+    """
+    Fine pixels touched by a lease, on the part of the upsampled grid that
+    rasterstats reads for the lease's bounds.
+
+    Args:
+        geom (shapely.Geometry): Lease polygon in the grid CRS
+        transform (affine.Affine): Coarse grid affine transform
+        shape (tuple[int, int]): Coarse grid (height, width)
+        factor (int): Upsampling factor
+
+    Returns (tuple[np.ndarray, np.ndarray]): Fine pixel rows and columns
+    """
+    empty = np.empty(0, dtype="int64")
+    if geom is None or geom.is_empty:
+        return empty, empty
+    fine = transform * Affine.scale(1.0 / factor)
+    fine_height, fine_width = shape[0] * factor, shape[1] * factor
+    minx, miny, maxx, maxy = geom.bounds
+    col_start = max(int(math.floor((minx - fine.c) / fine.a)), 0)
+    col_stop = min(int(math.ceil((maxx - fine.c) / fine.a)), fine_width)
+    row_start = max(int(math.floor((maxy - fine.f) / fine.e)), 0)
+    row_stop = min(int(math.ceil((miny - fine.f) / fine.e)), fine_height)
+    if col_start >= col_stop or row_start >= row_stop:
+        return empty, empty
+
+    mask = geometry_mask(
+        [geom],
+        out_shape=(row_stop - row_start, col_stop - col_start),
+        transform=fine * Affine.translation(col_start, row_start),
+        all_touched=True,
+        invert=True,
+    )
+    rows, cols = np.nonzero(mask)
+    return rows + row_start, cols + col_start
+
+
+def lease_weights(geom, transform, shape, factor):
+    """
+    Coarse cells and weights whose weighted sum is the zonal mean of one lease, and
+    its tap groups (see :func:`.tap_groups`) for nodata cells.
+
+    Args:
+        geom (shapely.Geometry): Lease polygon in the grid CRS
+        transform (affine.Affine): Coarse grid affine transform
+        shape (tuple[int, int]): Coarse grid (height, width)
+        factor (int): Upsampling factor
+
+    Returns (tuple[np.ndarray, np.ndarray, tuple]): Unique flat cell index, weight
+        and tap groups
+    """
+    rows, cols = lease_pixels(geom, transform, shape, factor)
+    cells, weights = bilinear_taps(rows, cols, factor, shape)
+    uniq, inverse = np.unique(cells, return_inverse=True)
+    weights = np.bincount(inverse, weights=weights) / max(len(rows), 1)
+    return uniq, weights, tap_groups(rows, cols, factor, shape)
+
+
+class TapGroups:
+    def __init__(self, leases, cells, own, counts, coefs):
+        """
+        Fine pixels of the leases grouped by bilinear taps (see :func:`.tap_groups`).
+
+        Args:
+            leases (np.ndarray): Lease position per group
+            cells (np.ndarray): Flat coarse cells of the taps (group x 4)
+            own (np.ndarray): Tap position of the pixels' own coarse cell
+            counts (np.ndarray): Pixel count per group
+            coefs (np.ndarray): Summed weights (group x valid-tap mask x tap)
+        """
+        self.leases = leases
+        self.cells = cells
+        self.own = own
+        self.counts = counts
+        self.coefs = coefs
+
+    def zonal_mean(self, values, valid, leases, n_leases):
+        """
+        Mean of the upsampled band over some leases, with GDAL's nodata handling.
+
+        Args:
+            values (np.ndarray): Flat coarse band
+            valid (np.ndarray): Flat mask of the valid coarse cells
+            leases (np.ndarray): Lease positions to compute
+            n_leases (int): Number of leases
+
+        Returns (np.ndarray): Mean per lease position in ``leases``, NaN for leases
+            without valid pixels.
+        """
+        sel = np.flatnonzero(np.isin(self.leases, leases))
+        cells = self.cells[sel]
+        tap_valid = valid[cells]
+        masks = tap_valid @ TAP_BITS
+        rows = np.arange(len(sel))
+        # Pixels whose own coarse cell is nodata are nodata
+        keep = tap_valid[rows, self.own[sel]]
+        coefs = self.coefs[sel, masks].astype("float64")
+        sums = (coefs * np.where(tap_valid, values[cells], 0.0)).sum(axis=1)
+        total = np.bincount(
+            self.leases[sel], weights=np.where(keep, sums, 0.0), minlength=n_leases
+        )
+        count = np.bincount(
+            self.leases[sel],
+            weights=np.where(keep, self.counts[sel], 0),
+            minlength=n_leases,
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / count, np.nan)[leases]
+
+
+class CoverageWeights:
+    def __init__(self, leases, cells, weights, n_leases, groups=None):
+        """
+        Sparse (lease x coarse cell) weight matrix in coordinate format.
+
+        Args:
+            leases (np.ndarray): Lease position per entry
+            cells (np.ndarray): Flat coarse cell index per entry
+            weights (np.ndarray): Weight per entry
+            n_leases (int): Number of leases (matrix rows)
+            groups (TapGroups): Tap groups of the leases, used for the leases
+                touching nodata cells. Without them their weights are only
+                renormalized over the valid cells.
+        """
+        self.leases = leases
+        self.cells = cells
+        self.weights = weights
+        self.n_leases = n_leases
+        self.groups = groups
+
+    def zonal_mean(self, band, nodata=None):
+        """
+        Mean of the upsampled band over each lease.
+
+        Args:
+            band (np.ndarray): Coarse 2D band
+            nodata (float): Band nodata value
+
+        Returns (np.ndarray): Mean per lease, NaN for leases without valid pixels.
+        """
+        band = np.asarray(band, dtype="float64").ravel()
+        valid = np.isfinite(band)
+        if nodata is not None:
+            valid &= band != nodata
+        entry_valid = valid[self.cells]
+        weights = np.where(entry_valid, self.weights, 0.0)
+        weighted = weights * np.where(entry_valid, band[self.cells], 0.0)
+        total = np.bincount(self.leases, weights=weighted, minlength=self.n_leases)
+        coverage = np.bincount(self.leases, weights=weights, minlength=self.n_leases)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(coverage > 0, total / coverage, np.nan)
+        touched = np.unique(self.leases[~entry_valid])
+        if self.groups is not None and len(touched):
+            mean[touched] = self.groups.zonal_mean(band, valid, touched, self.n_leases)
+        return mean
+
+
+class LeaseCoverageCache:
+    def __init__(self, lease_shp, factor=ct.SC_RESAMPLE_FACTOR, cache_dir=None):
+        """
+        Cached coverage weights of a lease polygon layer.
+
+        Args:
+            lease_shp (str): Lease polygon shapefile path
+            factor (int): Upsampling factor emulated by the weights
+            cache_dir (str): Cache directory, defaults to ``grid_index`` next to the
+                shapefile
+        """
+        self.lease_shp = lease_shp
+        self.factor = factor
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.dirname(lease_shp), grid_index.INDEX_DIR_NAME
+        )
+
+    def cache_path(self, transform, shape, crs=None):
+        stem = os.path.splitext(os.path.basename(self.lease_shp))[0]
+        grid_hash = grid_index.grid_fingerprint(transform, shape, crs)
+        return os.path.join(
+            self.cache_dir,
+            f"{stem}_{grid_hash}_cov{self.factor}_v{CACHE_VERSION}",
+        )
+
+    def build(self, transform, shape, crs=None, gdf=None):
+        """
+        Compute and store the coverage weights for a grid.
+
+        Args:
+            transform (affine.Affine): Coarse grid affine transform
+            shape (tuple[int, int]): Coarse grid (height, width)
+            crs (str): Coarse grid CRS, part of the cache key (the lease polygons
+                are in it, as with rasterstats)
+            gdf (gpd.GeoDataFrame): Already loaded lease layer, read from
+                ``lease_shp`` when None
+
+        Returns (CoverageWeights):
+        """
+        cache_path = self.cache_path(transform, shape, crs)
+        logger.info(f"Build coverage weights: {os.path.basename(cache_path)}")
+        if gdf is None:
+            gdf = layer_cache.read_layer(self.lease_shp, ["geometry"])
+        leases, cells, weights, groups = [], [], [], []
+        for pos, geom in enumerate(gdf.geometry):
+            lease_cells, lease_w, lease_groups = lease_weights(
+                geom, transform, shape, self.factor
+            )
+            leases.append(np.full(len(lease_cells), pos, dtype="int64"))
+            cells.append(lease_cells)
+            weights.append(lease_w)
+            groups.append(
+                (np.full(len(lease_groups[0]), pos, dtype="int64"),) + lease_groups
+            )
+        if groups:
+            coverage_groups = TapGroups(
+                *(np.concatenate(arrays) for arrays in zip(*groups))
+            )
+        else:
+            coverage_groups = TapGroups(
+                np.empty(0, dtype="int64"),
+                np.empty((0, len(TAP_BITS)), dtype="int64"),
+                np.empty(0, dtype="int8"),
+                np.empty(0, dtype="int64"),
+                np.empty((0, len(TAP_BITS) ** 2, len(TAP_BITS)), dtype="float32"),
+            )
+        coverage = CoverageWeights(
+            np.concatenate(leases) if leases else np.empty(0, dtype="int64"),
+            np.concatenate(cells) if cells else np.empty(0, dtype="int64"),
+            np.concatenate(weights) if weights else np.empty(0, dtype="float64"),
+            len(gdf.index),
+            coverage_groups,
+        )
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(f"{cache_path}.json"):
+            os.remove(f"{cache_path}.json")
+        np.savez(
+            f"{cache_path}.npz",
+            leases=coverage.leases.astype("int32"),
+            cells=coverage.cells.astype("int32"),
+            weights=coverage.weights,
+            group_leases=coverage_groups.leases.astype("int32"),
+            group_cells=coverage_groups.cells.astype("int32"),
+            group_own=coverage_groups.own,
+            group_counts=coverage_groups.counts.astype("int32"),
+            group_coefs=coverage_groups.coefs,
+        )
+        # The JSON sidecar is written last and marks the cache as complete
+        meta = {
+            "lease_shp": os.path.basename(self.lease_shp),
+            "n_leases": coverage.n_leases,
+            "factor": self.factor,
+            "stat": grid_index.shp_stat_signature(self.lease_shp),
+            "sha256": grid_index.shp_fingerprint(self.lease_shp),
+            "transform": list(tuple(transform)[:6]),
+            "shape": list(shape),
+            "crs": str(crs) if crs else None,
+        }
+        with open(f"{cache_path}.json", "w") as wf:
+            json.dump(meta, wf)
+        return coverage
+
+    def load(self, transform, shape, crs=None, gdf=None):
+        """
+        Load the coverage weights for a grid, building them when missing or stale.
+
+        Args:
+            transform (affine.Affine): Coarse grid affine transform
+            shape (tuple[int, int]): Coarse grid (height, width)
+            crs (str): Coarse grid CRS
+            gdf (gpd.GeoDataFrame): Already loaded lease layer used on rebuild
+
+        Returns (CoverageWeights):
+        """
+        cache_path = self.cache_path(transform, shape, crs)
+        meta_fpath = f"{cache_path}.json"
+        if os.path.exists(meta_fpath):
+            with open(meta_fpath, "r") as rf:
+                meta = json.load(rf)
+            stat = meta.get("stat")
+            if grid_index.source_unchanged(meta, self.lease_shp):
+                if meta["stat"] != stat:
+                    with open(meta_fpath, "w") as wf:
+                        json.dump(meta, wf)
+                with np.load(f"{cache_path}.npz") as npz:
+                    groups = TapGroups(
+                        npz["group_leases"],
+                        npz["group_cells"],
+                        npz["group_own"],
+                        npz["group_counts"],
+                        npz["group_coefs"],
+                    )
+                    return CoverageWeights(
+                        npz["leases"],
+                        npz["cells"],
+                        npz["weights"],
+                        meta["n_leases"],
+                        groups,
+                    )
+        return self.build(transform, shape, crs, gdf)
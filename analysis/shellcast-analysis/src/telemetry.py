@@ -0,0 +1,198 @@
+"""
+Run telemetry.
+
+Stages and processing methods are wrapped with :func:`record` (context manager) or
+:func:`timed` (decorator). Each one records wall time, CPU time of this process,
+CPU time of finished subprocesses (wgrib2, process pool workers), the peak RSS and
+the bytes read/written, and the records are written to a JSON run report next to
+the logs when the process exits.
+
+CPU, RSS and I/O counters are process wide: when states run concurrently in threads
+(all_main.py) a stage's counters include the work of the other threads.
+"""
+
+import atexit
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_TO_MB = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+PROC_IO = "/proc/self/io"
+
+_lock = threading.Lock()
+_local = threading.local()
+_records = []
+_run = {}
+
+
+def _io_bytes():
+    """Bytes read from and written to storage by this process (Linux only)."""
+    try:
+        with open(PROC_IO, "r") as rf:
+            fields = dict(line.split(": ") for line in rf.read().splitlines())
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _snapshot():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read_bytes, write_bytes = _io_bytes()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": own.ru_utime + own.ru_stime,
+        "children_cpu": children.ru_utime + children.ru_stime,
+        "rss": own.ru_maxrss,
+        "children_rss": children.ru_maxrss,
+        "in_blocks": own.ru_inblock + children.ru_inblock,
+        "out_blocks": own.ru_oublock + children.ru_oublock,
+        "read_bytes": read_bytes,
+        "write_bytes": write_bytes,
+    }
+
+
+def _delta(end, start, key):
+    if end[key] is None or start[key] is None:
+        return None
+    return end[key] - start[key]
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def record(name):
+    """
+    Record the resources used by a block.
+
+    Args:
+        name (str): Stage name; nested records are reported as 'outer/inner'
+    """
+    stack = _stack()
+    stack.append(name)
+    path = "/".join(stack)
+    start = _snapshot()
+    started = datetime.now().isoformat(timespec="seconds")
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        end = _snapshot()
+        stack.pop()
+        entry = {
+            "stage": path,
+            "thread": threading.current_thread().name,
+            "started": started,
+            "ok": ok,
+            "wall_s": round(end["wall"] - start["wall"], 3),
+            "cpu_s": round(end["cpu"] - start["cpu"], 3),
+            "subprocess_cpu_s": round(end["children_cpu"] - start["children_cpu"], 3),
+            "peak_rss_mb": round(end["rss"] * RSS_TO_MB, 1),
+            "peak_rss_growth_mb": round((end["rss"] - start["rss"]) * RSS_TO_MB, 1),
+            "subprocess_peak_rss_mb": round(end["children_rss"] * RSS_TO_MB, 1),
+            "read_bytes": _delta(end, start, "read_bytes"),
+            "write_bytes": _delta(end, start, "write_bytes"),
+            "in_blocks": end["in_blocks"] - start["in_blocks"],
+            "out_blocks": end["out_blocks"] - start["out_blocks"],
+        }
+        with _lock:
+            _records.append(entry)
+        logger.debug(
+            f"[Telemetry] {path}: {entry['wall_s']}s wall, {entry['cpu_s']}s cpu"
+        )
+
+
+def timed(name=None):
+    """
+    Decorator version of :func:`record`.
+
+    Args:
+        name (str): Stage name (default: the function's qualified name)
+    """
+
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with record(stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def records():
+    """Records of the finished stages, in completion order."""
+    with _lock:
+        return list(_records)
+
+
+def report():
+    """
+    Run report.
+
+    Returns (dict): Run metadata and stage records
+    """
+    totals = _snapshot()
+    return {
+        **_run,
+        "finished": datetime.now().isoformat(timespec="seconds"),
+        "peak_rss_mb": round(totals["rss"] * RSS_TO_MB, 1),
+        "subprocess_peak_rss_mb": round(totals["children_rss"] * RSS_TO_MB, 1),
+        "stages": records(),
+    }
+
+
+def write_report(fpath):
+    """
+    Write the run report as JSON.
+
+    Args:
+        fpath (str): Report file path
+    """
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    with open(fpath, "w") as wf:
+        json.dump(report(), wf, indent=2)
+    logger.info(f"Run report: {fpath}")
+
+
+def start_run(name, reports_dir):
+    """
+    Start a run and write its report to reports_dir when the process exits
+    (including exits through utils.error_process).
+
+    Args:
+        name (str): Run name (e.g. 'NC')
+        reports_dir (str): Report directory
+    Returns (str): Report file path
+    """
+    started = datetime.now()
+    _run.update(
+        {
+            "run": name,
+            "pid": os.getpid(),
+            "started": started.isoformat(timespec="seconds"),
+        }
+    )
+    fpath = os.path.join(
+        reports_dir, f"run_{name.lower()}_{started.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    atexit.register(write_report, fpath)
+    return fpath
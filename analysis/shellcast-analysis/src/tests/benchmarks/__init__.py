@@ -0,0 +1,7 @@
+"""
+Benchmarks of the analysis hot paths on synthetic lease layers and PQPF grids.
+
+Usage (from analysis/shellcast-analysis/src):
+    python -m tests.benchmarks.run_benchmarks run --sizes 1000 10000 100000
+    python -m tests.benchmarks.run_benchmarks compare <base commit> <head commit>
+"""
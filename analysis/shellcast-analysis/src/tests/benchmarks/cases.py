@@ -0,0 +1,245 @@
+"""
+Benchmark cases.
+
+Every case prepares its inputs in ``setup(ctx, n)`` (not timed) and returns the
+callable that is timed. Cases that need a module which cannot be imported in the
+current environment (e.g. the GDAL bindings behind ``utils``) are reported as
+skipped instead of failing the run.
+"""
+
+import importlib
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import raster_sampling
+from sqlalchemy import create_engine, text
+from tests.benchmarks import fixtures
+
+
+class Context:
+    def __init__(self, tmp_dir):
+        """
+        Shared fixtures of a benchmark run, generated once per size.
+
+        Args:
+            tmp_dir (str): Scratch directory for file outputs
+        """
+        self.tmp_dir = tmp_dir
+        self.grids = fixtures.pqpf_grids()
+        stack, thresholds, transform, crs = next(iter(self.grids.values()))
+        self.shape = stack.shape[1:]
+        self.thresholds = thresholds
+        self.transform = transform
+        self.crs = crs
+        self._points = {}
+
+    def points(self, n):
+        if n not in self._points:
+            self._points = {
+                n: fixtures.lease_points(
+                    n, self.transform, self.shape, self.thresholds, self.crs
+                )
+            }
+        return self._points[n]
+
+
+class Case:
+    def __init__(self, name, setup, requires=(), max_size=None, sized=True):
+        """
+        Args:
+            name (str): Case name
+            setup (callable): setup(ctx, n) -> timed callable
+            requires (tuple[str]): Modules the case imports
+            max_size (int): Largest size the case runs at (e.g. per-polygon loops)
+            sized (bool): False when the case does not depend on the layer size
+        """
+        self.name = name
+        self.setup = setup
+        self.requires = requires
+        self.max_size = max_size
+        self.sized = sized
+
+    def missing(self):
+        """Name and error of the first required module that cannot be imported."""
+        for module in self.requires:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                return f"{module}: {e}"
+        return None
+
+
+def setup_grib_decode(ctx, n):
+    try:
+        pqpf_cube = importlib.import_module("pqpf_cube")
+    except ImportError:
+        return lambda: [fixtures.grib_grid(fpath) for fpath in fixtures.GRB_FPATHS]
+    return lambda: [pqpf_cube.load_cube(fpath) for fpath in fixtures.GRB_FPATHS]
+
+
+def setup_grid_index(ctx, n):
+    points = ctx.points(n)
+    xs, ys = points.geometry.x.to_numpy(), points.geometry.y.to_numpy()
+
+    def run():
+        raster_sampling.rowcol_index(ctx.transform, ctx.shape, xs, ys)
+        pd.factorize(points["cmu_name"])
+
+    return run
+
+
+def setup_point_sampling(ctx, n):
+    points = ctx.points(n)
+    rows, cols, inside = raster_sampling.rowcol_index(
+        ctx.transform,
+        ctx.shape,
+        points.geometry.x.to_numpy(),
+        points.geometry.y.to_numpy(),
+    )
+    rain_in = points["rain_in"].to_numpy(dtype="float64")
+
+    def run():
+        for stack, thresholds, _, _ in ctx.grids.values():
+            band_idx = raster_sampling.band_lookup(thresholds, rain_in)
+            raster_sampling.gather(stack, band_idx, rows, cols, inside)
+
+    return run
+
+
+def setup_sc_coverage_build(ctx, n):
+    coverage_weights = importlib.import_module("sc_pqpf.coverage_weights")
+    polygons = fixtures.lease_polygons(n, ctx.transform, ctx.shape, crs=ctx.crs)
+
+    def run():
+        for geom in polygons.geometry:
+            coverage_weights.lease_weights(geom, ctx.transform, ctx.shape, 100)
+
+    return run
+
+
+def setup_sc_zonal_mean(ctx, n):
+    coverage_weights = importlib.import_module("sc_pqpf.coverage_weights")
+    coverage = coverage_weights.CoverageWeights(
+        *fixtures.coverage_arrays(n, ctx.shape), n
+    )
+
+    def run():
+        for stack, _, _, _ in ctx.grids.values():
+            coverage.zonal_mean(stack[0])
+
+    return run
+
+
+def setup_fl_process_ab(ctx, n):
+    fl_pqpf = importlib.import_module("fl_pqpf.fl_pqpf")
+    process_ab = importlib.import_module("fl_pqpf.process_ab")
+    grid_index = importlib.import_module("grid_index")
+    pqpf_cube = importlib.import_module("pqpf_cube")
+    points = ctx.points(n)
+    stack, thresholds, transform, crs = next(iter(ctx.grids.values()))
+    cube = pqpf_cube.PQPFCube(stack, thresholds, transform, crs, name="f030")
+    index = grid_index.GridIndex(
+        *raster_sampling.rowcol_index(
+            transform, ctx.shape, points.geometry.x, points.geometry.y
+        )
+    )
+    rng = np.random.default_rng(fixtures.SEED)
+    tp_band = rng.gamma(0.5, 1.0, ctx.shape)
+    fl = fl_pqpf.FLPQPF.__new__(fl_pqpf.FLPQPF)
+    fl.lease_index = SimpleNamespace(load=lambda *args, **kwargs: index)
+
+    def run():
+        # Process A: TP accumulation at the leases and the PQPF threshold
+        df = points.copy()
+        df[fl_pqpf.TP_ACCUM] = index.sample(tp_band)
+        df[fl_pqpf.TP_CALC] = df["rain_in"] - df[fl_pqpf.TP_ACCUM]
+        df[fl_pqpf.PQPF_TH] = process_ab.pqpf_thresholds(df[fl_pqpf.TP_CALC])
+        # Process B: PQPF probability of each lease's threshold
+        fl.pqpf_ras_values_to_pts(df, cube)
+
+    return run
+
+
+def setup_cmu_categorize(ctx, n):
+    nc_pqpf = importlib.import_module("nc_pqpf.nc_pqpf")
+    df = fixtures.probabilities(ctx.points(n))
+    nc = nc_pqpf.NCPQPF.__new__(nc_pqpf.NCPQPF)
+    nc.outputs_dir = os.path.join(ctx.tmp_dir, "outputs")
+    nc.intermediate_dir = ctx.tmp_dir
+    nc.outfile_date = "2022-09-30"
+    os.makedirs(nc.outputs_dir, exist_ok=True)
+    return lambda: nc.cmu_mean(df, "cmu_name", "lease")
+
+
+def setup_csv_persist(ctx, n):
+    df = fixtures.probabilities(ctx.points(n))
+    csv_fpath = os.path.join(ctx.tmp_dir, "pqpf_cmu_probs.csv")
+    return lambda: df.to_csv(csv_fpath, index=False)
+
+
+def setup_db_persist(ctx, n):
+    db_load = importlib.import_module("db_load")
+    df = fixtures.probabilities(ctx.points(n))[
+        ["lease_id", "pqpf_24h", "pqpf_48h", "pqpf_72h"]
+    ].rename(
+        columns={
+            "pqpf_24h": "prob_1d_perc",
+            "pqpf_48h": "prob_2d_perc",
+            "pqpf_72h": "prob_3d_perc",
+        }
+    )
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE cmu_probabilities (lease_id varchar(10), "
+                "prob_1d_perc tinyint, prob_2d_perc tinyint, prob_3d_perc tinyint, "
+                "forecast_date date, created datetime, "
+                "UNIQUE (lease_id, forecast_date))"
+            )
+        )
+    return lambda: db_load.upsert_probabilities(engine, df)
+
+
+def setup_email_content(ctx, n):
+    notifications = importlib.import_module("notifications")
+    config = SimpleNamespace(
+        lease_template="Lease template",
+        lease_template_today_only="Lease template today only",
+        subject_template="{} ShellCast Forecasts for {}",
+        notification_footer="Footer",
+        web_base_url="https://example.com",
+        secret_key="benchmark",
+    )
+    rows = fixtures.notification_rows(n)
+    return notifications.NotificationEmailContentGenerator(config, "NC", rows)
+
+
+CASES = [
+    Case("grib_decode", setup_grib_decode, sized=False),
+    Case("grid_index", setup_grid_index),
+    Case("point_sampling", setup_point_sampling),
+    Case(
+        "sc_coverage_build",
+        setup_sc_coverage_build,
+        requires=("sc_pqpf.coverage_weights",),
+        max_size=10_000,
+    ),
+    Case("sc_zonal_mean", setup_sc_zonal_mean, requires=("sc_pqpf.coverage_weights",)),
+    Case(
+        "fl_process_ab",
+        setup_fl_process_ab,
+        requires=("fl_pqpf.fl_pqpf", "grid_index", "pqpf_cube"),
+    ),
+    Case("cmu_categorize", setup_cmu_categorize, requires=("nc_pqpf.nc_pqpf",)),
+    Case("csv_persist", setup_csv_persist),
+    Case("db_persist", setup_db_persist, requires=("db_load",)),
+    Case(
+        "email_content",
+        setup_email_content,
+        requires=("notifications",),
+        max_size=100_000,
+    ),
+]
@@ -0,0 +1,214 @@
+"""
+Synthetic benchmark fixtures.
+
+PQPF grids are decoded from the GRB files in ``src/tests/data`` (pygrib) and cropped
+to a state-sized window; lease layers, coverage weights and notification rows are
+generated at any size with a fixed seed so runs are comparable between commits.
+"""
+
+import glob
+import os
+import re
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pygrib
+import shapely
+from affine import Affine
+from pyproj import Transformer
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+GRB_FPATHS = sorted(glob.glob(os.path.join(DATA_DIR, "*.grb")))
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# State-sized crop of the CONUS grid (rows, cols from the north-west corner)
+WINDOW = (slice(700, 1000), slice(1700, 2100))
+SEED = 20220930
+
+
+def grib_grid(grb_fpath):
+    """
+    Decode the threshold bands of a PQPF GRB file (north-up).
+
+    Args:
+        grb_fpath (str): GRB file path
+
+    Returns (tuple[np.ndarray, List[float], affine.Affine, str]): Band stack,
+        thresholds in inches, transform and PROJ string.
+    """
+    grbs = pygrib.open(grb_fpath)
+    try:
+        bands, thresholds, grb = [], [], None
+        for grb in grbs:
+            if "upperLimit" in grb.keys():
+                bands.append(grb.values)
+                thresholds.append(float(round(grb.upperLimit / 25.4, 1)))
+        proj = grb.projparams
+        dx, dy = grb["DxInMetres"], grb["DyInMetres"]
+        lon0 = grb["longitudeOfFirstGridPointInDegrees"]
+        lat0 = grb["latitudeOfFirstGridPointInDegrees"]
+        flip = grb["jScansPositively"] == 1
+    finally:
+        grbs.close()
+    stack = np.ma.filled(np.ma.array(bands), np.nan).astype("float64")
+    if flip:
+        stack = stack[:, ::-1, :]
+    crs = " ".join(f"+{key}={value}" for key, value in proj.items())
+    x0, y0 = Transformer.from_crs("EPSG:4326", crs, always_xy=True).transform(
+        lon0 - 360 if lon0 > 180 else lon0, lat0
+    )
+    # (x0, y0) is the center of the south-west cell
+    top = y0 + (stack.shape[1] - 0.5) * dy
+    transform = Affine(dx, 0.0, x0 - dx / 2, 0.0, -dy, top)
+    return stack, thresholds, transform, crs
+
+
+def pqpf_grids(window=WINDOW):
+    """
+    Cropped PQPF grids of the test GRB files.
+
+    Args:
+        window (tuple[slice, slice]): Row and column window
+
+    Returns (dict): {forecast hour (e.g. 'f024'): (stack, thresholds, transform, crs)}
+    """
+    grids = {}
+    for grb_fpath in GRB_FPATHS:
+        stack, thresholds, transform, crs = grib_grid(grb_fpath)
+        rows, cols = window
+        crop = np.ascontiguousarray(stack[:, rows, cols])
+        crop_transform = transform * Affine.translation(cols.start, rows.start)
+        hour = re.findall(r"f\d{3}", os.path.basename(grb_fpath))[-1]
+        grids[hour] = (crop, thresholds, crop_transform, crs)
+    return grids
+
+
+def _random_xy(n, transform, shape, rng):
+    cols = rng.uniform(0, shape[1], n)
+    rows = rng.uniform(0, shape[0], n)
+    return transform * (cols, rows)
+
+
+def lease_points(n, transform, shape, thresholds, crs=None, seed=SEED):
+    """
+    Synthetic lease points inside a grid.
+
+    Args:
+        n (int): Number of leases
+        transform (affine.Affine): Grid transform
+        shape (tuple[int, int]): Grid (height, width)
+        thresholds (List[float]): Rainfall thresholds to draw rain_in from
+        crs (str): Layer CRS
+        seed (int): Random seed
+
+    Returns (gpd.GeoDataFrame): lease_id, cmu_name, rain_in, days and geometry
+    """
+    rng = np.random.default_rng(seed)
+    xs, ys = _random_xy(n, transform, shape, rng)
+    n_cmus = max(1, n // 20)
+    return gpd.GeoDataFrame(
+        {
+            "lease_id": [f"L{i:07d}" for i in range(n)],
+            "cmu_name": [f"U{i:05d}" for i in rng.integers(0, n_cmus, n)],
+            "rain_in": rng.choice(thresholds, n),
+            "days": rng.integers(1, 8, n),
+        },
+        geometry=gpd.points_from_xy(xs, ys),
+        crs=crs,
+    )
+
+
+def lease_polygons(n, transform, shape, size=300.0, crs=None, seed=SEED):
+    """
+    Synthetic square lease polygons inside a grid.
+
+    Args:
+        n (int): Number of leases
+        transform (affine.Affine): Grid transform
+        shape (tuple[int, int]): Grid (height, width)
+        size (float): Polygon side length in grid units
+        crs (str): Layer CRS
+        seed (int): Random seed
+
+    Returns (gpd.GeoDataFrame): lease_id and geometry
+    """
+    rng = np.random.default_rng(seed)
+    xs, ys = _random_xy(n, transform, shape, rng)
+    geoms = shapely.box(xs, ys, xs + size, ys + size)
+    return gpd.GeoDataFrame(
+        {"lease_id": [f"L{i:07d}" for i in range(n)]}, geometry=geoms, crs=crs
+    )
+
+
+def coverage_arrays(n, shape, taps=4, seed=SEED):
+    """
+    Synthetic sparse lease x cell coverage weights (``taps`` cells per lease).
+
+    Args:
+        n (int): Number of leases
+        shape (tuple[int, int]): Grid (height, width)
+        taps (int): Cells per lease
+        seed (int): Random seed
+
+    Returns (tuple[np.ndarray, np.ndarray, np.ndarray]): leases, cells, weights
+    """
+    rng = np.random.default_rng(seed)
+    leases = np.repeat(np.arange(n, dtype="int64"), taps)
+    cells = rng.integers(0, shape[0] * shape[1], n * taps)
+    weights = np.full(n * taps, 1.0 / taps)
+    return leases, cells, weights
+
+
+def probabilities(points, seed=SEED):
+    """
+    Lease probabilities like the output of NCPQPF.ras_values_to_pts.
+
+    Args:
+        points (gpd.GeoDataFrame): Synthetic lease points
+        seed (int): Random seed
+
+    Returns (pd.DataFrame):
+    """
+    rng = np.random.default_rng(seed)
+    n = len(points.index)
+    return pd.DataFrame(
+        {
+            "lease_id": points["lease_id"],
+            "cmu_name": points["cmu_name"],
+            "rain_in": points["rain_in"],
+            "pqpf_24h": rng.random(n),
+            "pqpf_48h": rng.random(n),
+            "pqpf_72h": rng.random(n),
+        }
+    )
+
+
+def notification_rows(n, seed=SEED):
+    """
+    Rows as returned by the SelectUserLeaseProbsToday stored procedure.
+
+    Args:
+        n (int): Number of rows (about three leases per user)
+        seed (int): Random seed
+
+    Returns (List[dict]):
+    """
+    rng = np.random.default_rng(seed)
+    cats = rng.integers(1, 6, (n, 3))
+    return [
+        {
+            "user_id": i // 3,
+            "email": f"user{i // 3}@example.com",
+            "phone": None,
+            "prob_pref": 3,
+            "email_pref": 1,
+            "threshold": 4,
+            "lease_id": f"L{i:07d}",
+            "area_id": "NC001",
+            "user_code": f"USER_{i // 3}",
+            "prob_1d_perc": int(cats[i, 0]),
+            "prob_2d_perc": int(cats[i, 1]),
+            "prob_3d_perc": int(cats[i, 2]),
+        }
+        for i in range(n)
+    ]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Run the analysis benchmarks and compare results between commits.
+
+Results are written to ``results/<commit>.json`` next to this file (``-dirty`` is
+appended when the working tree has uncommitted changes).
+
+Usage (from analysis/shellcast-analysis/src):
+    python -m tests.benchmarks.run_benchmarks run
+    python -m tests.benchmarks.run_benchmarks run --sizes 1000 10000 --cases point_sampling
+    python -m tests.benchmarks.run_benchmarks compare 1ee72c2 caec6b2
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from tests.benchmarks import fixtures  # noqa: E402
+from tests.benchmarks.cases import CASES, Context  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def git_commit():
+    """
+    Short commit hash of the working tree, '-dirty' when it has local changes.
+
+    Returns (str): Commit id, 'unknown' outside a git checkout
+    """
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, text=True
+        ).strip()
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=SRC_DIR,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if status.strip() else commit
+
+
+def time_callable(func, repeat):
+    """
+    Time a callable.
+
+    Args:
+        func (callable): Timed callable
+        repeat (int): Number of runs
+
+    Returns (dict): min and median seconds
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+    }
+
+
+def run(sizes, repeat, names=None):
+    """
+    Run the benchmark cases.
+
+    Args:
+        sizes (List[int]): Lease layer sizes
+        repeat (int): Runs per case and size
+        names (List[str]): Cases to run (default: all)
+
+    Returns (dict): Benchmark results
+    """
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "repeat": repeat,
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ctx = Context(tmp_dir)
+        for case in CASES:
+            if names and case.name not in names:
+                continue
+            missing = case.missing()
+            if missing:
+                results["cases"][case.name] = {"skipped": missing}
+                print(f"{case.name:<20} skipped ({missing})")
+                continue
+            case_results = {}
+            for n in sizes if case.sized else [None]:
+                if n is not None and case.max_size and n > case.max_size:
+                    continue
+                timing = time_callable(case.setup(ctx, n), repeat)
+                if n:
+                    timing["us_per_lease"] = round(timing["min_s"] / n * 1e6, 3)
+                case_results[str(n or "-")] = timing
+                print(f"{case.name:<20} {str(n or '-'):>9} {timing['min_s']:>10.4f} s")
+            results["cases"][case.name] = case_results
+    return results
+
+
+def save(results, results_dir=RESULTS_DIR):
+    """
+    Write results to ``<results_dir>/<commit>.json``.
+
+    Returns (str): Results file path
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    fpath = os.path.join(results_dir, f"{results['commit']}.json")
+    with open(fpath, "w") as wf:
+        json.dump(results, wf, indent=2)
+    return fpath
+
+
+def load(commit, results_dir=RESULTS_DIR):
+    with open(os.path.join(results_dir, f"{commit}.json"), "r") as rf:
+        return json.load(rf)
+
+
+def compare(base, head):
+    """
+    Compare two results (head / base ratio of the min times).
+
+    Args:
+        base (dict): Base results
+        head (dict): Head results
+
+    Returns (List[tuple]): (case, size, base s, head s, ratio)
+    """
+    rows = []
+    for name, sizes in head["cases"].items():
+        base_sizes = base["cases"].get(name, {})
+        for size, timing in sizes.items():
+            if size == "skipped" or size not in base_sizes:
+                continue
+            base_s, head_s = base_sizes[size]["min_s"], timing["min_s"]
+            ratio = head_s / base_s if base_s else float("nan")
+            rows.append((name, size, base_s, head_s, ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ShellCast analysis benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(fixtures.SIZES)
+    )
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--cases", nargs="+", choices=[c.name for c in CASES])
+    run_parser.add_argument("--results-dir", default=RESULTS_DIR)
+    compare_parser = sub.add_parser("compare", help="Compare two commits")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument("--results-dir", default=RESULTS_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.sizes, args.repeat, args.cases)
+        print(f"Results: {save(results, args.results_dir)}")
+    else:
+        base = load(args.base, args.results_dir)
+        head = load(args.head, args.results_dir)
+        print(f"{'case':<20} {'size':>9} {'base s':>10} {'head s':>10} {'ratio':>7}")
+        for name, size, base_s, head_s, ratio in compare(base, head):
+            print(f"{name:<20} {size:>9} {base_s:>10.4f} {head_s:>10.4f} {ratio:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
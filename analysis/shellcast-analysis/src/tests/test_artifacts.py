@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the background CSV writer.
+
+Usage:
+    python -m pytest test_artifacts.py -v
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from artifacts import CSVArtifacts  # noqa: E402
+
+
+class TestCSVArtifacts(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({"cmu_name": ["U001", "U002"], "prob_1d_perc": [1, 5]})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_join(self):
+        artifacts = CSVArtifacts()
+        fpath = os.path.join(self.tmp_dir.name, "probs.csv")
+        artifacts.write(self.df, fpath)
+        self.df.loc[0, "prob_1d_perc"] = 3  # the queued write has its own copy
+        self.assertEqual(artifacts.join(), [fpath])
+        self.assertEqual(pd.read_csv(fpath)["prob_1d_perc"].tolist(), [1, 5])
+        self.assertFalse(os.path.exists(f"{fpath}.tmp"))
+
+    def test_disabled(self):
+        artifacts = CSVArtifacts(enabled=False)
+        fpath = os.path.join(self.tmp_dir.name, "probs.csv")
+        artifacts.write(self.df, fpath)
+        self.assertEqual(artifacts.join(), [])
+        self.assertFalse(os.path.exists(fpath))
+
+    def test_failed_write_is_logged(self):
+        artifacts = CSVArtifacts()
+        fpath = os.path.join(self.tmp_dir.name, "missing", "probs.csv")
+        artifacts.write(self.df, fpath)
+        with self.assertLogs("artifacts", level="ERROR"):
+            self.assertEqual(artifacts.join(), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
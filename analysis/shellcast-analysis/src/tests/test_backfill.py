@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the historical backfill dates (requires the GDAL Python bindings).
+
+Usage:
+    python -m pytest test_backfill.py -v
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    import backfill
+    from fl_pqpf.tp_xmrg import TPXMRG
+    from management import DirectoryConfig
+    from pqpf_procs import PQPFProcs
+except ImportError:
+    backfill = None
+
+DAY = date(2024, 1, 14)
+
+
+@unittest.skipIf(backfill is None, "GDAL Python bindings are not installed")
+class TestBackfillDates(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_date_range(self):
+        days = backfill.date_range(date(2024, 2, 27), date(2024, 3, 1))
+        self.assertEqual(len(days), 4)
+        self.assertEqual(days[2], date(2024, 2, 29))
+        self.assertEqual(backfill.date_range(DAY, DAY), [DAY])
+
+    def test_directory_config(self):
+        work_root = os.path.join(self.tmp_dir, "nc", DAY.isoformat())
+        config = DirectoryConfig("NC", "gcp.mysql", run_date=DAY, work_root=work_root)
+        self.assertEqual(config.date_today, DAY)
+        self.assertEqual(config.created, datetime(2024, 1, 14))
+        self.assertTrue(config.outputs_dir.startswith(work_root))
+        self.assertTrue(config.run_dir.endswith(DAY.isoformat()))
+        self.assertFalse(config.inputs_dir.startswith(work_root))
+        self.assertIsNone(DirectoryConfig("NC", "gcp.mysql").created)
+
+    def test_grb_names(self):
+        names = PQPFProcs.grb_names(DAY)
+        self.assertEqual(names[0], "pqpf_p24i_conus_2024011406f030.grb")
+
+    def test_xmrg_window(self):
+        tp = TPXMRG(
+            "FL",
+            7,
+            run_date=DAY,
+            archive_dir=self.tmp_dir,
+            outputs_dir=os.path.join(self.tmp_dir, "outputs"),
+            store_dir=os.path.join(self.tmp_dir, "daily"),
+        )
+        names = tp.list_required_tp_data()
+        self.assertEqual(len(names), 144)
+        self.assertEqual(names[0], "xmrg0108202407z.grb")
+        self.assertEqual(names[-1], "xmrg0114202406z.grb")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
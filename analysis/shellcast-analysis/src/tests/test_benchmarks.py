@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the benchmark fixtures and result comparison.
+
+Usage:
+    python -m pytest test_benchmarks.py -v
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+from affine import Affine
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from tests.benchmarks import fixtures  # noqa: E402
+from tests.benchmarks.run_benchmarks import compare, time_callable  # noqa: E402
+
+
+class TestFixtures(unittest.TestCase):
+    def setUp(self):
+        self.transform = Affine(2500.0, 0.0, 1000.0, 0.0, -2500.0, 9000.0)
+        self.shape = (30, 40)
+
+    def test_lease_points_inside_grid(self):
+        gdf = fixtures.lease_points(500, self.transform, self.shape, [0.5, 1.0])
+        minx, miny, maxx, maxy = gdf.total_bounds
+        self.assertEqual(len(gdf.index), 500)
+        self.assertGreaterEqual(minx, 1000.0)
+        self.assertLessEqual(maxy, 9000.0)
+        self.assertEqual(set(gdf["rain_in"]), {0.5, 1.0})
+        self.assertEqual(gdf["cmu_name"].nunique(), 25)
+
+    def test_fixtures_are_seeded(self):
+        a = fixtures.lease_polygons(10, self.transform, self.shape)
+        b = fixtures.lease_polygons(10, self.transform, self.shape)
+        self.assertTrue(a.geometry.equals(b.geometry))
+
+    def test_coverage_arrays(self):
+        leases, cells, weights = fixtures.coverage_arrays(10, self.shape)
+        self.assertEqual(len(leases), 40)
+        self.assertTrue((cells < 30 * 40).all())
+        np.testing.assert_allclose(np.bincount(leases, weights=weights), 1.0)
+
+    def test_grib_grid(self):
+        stack, thresholds, transform, _ = fixtures.grib_grid(fixtures.GRB_FPATHS[0])
+        self.assertEqual(stack.shape[0], len(thresholds))
+        self.assertIn(1.0, thresholds)
+        self.assertLess(transform.e, 0)
+
+
+class TestRunBenchmarks(unittest.TestCase):
+    def test_time_callable(self):
+        timing = time_callable(lambda: None, 3)
+        self.assertLessEqual(timing["min_s"], timing["median_s"])
+
+    def test_compare(self):
+        base = {"cases": {"point_sampling": {"1000": {"min_s": 2.0}}}}
+        head = {
+            "cases": {
+                "point_sampling": {"1000": {"min_s": 1.0}, "10000": {"min_s": 3.0}},
+                "email_content": {"skipped": "notifications"},
+            }
+        }
+        self.assertEqual(
+            compare(base, head), [("point_sampling", "1000", 2.0, 1.0, 0.5)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
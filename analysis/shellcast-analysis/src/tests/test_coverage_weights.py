@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the SC coverage weights against the rasterstats zonal mean of the
+bilinear upsampled grid they replace.
+
+Usage:
+    python -m pytest test_coverage_weights.py -v
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import geopandas as gpd
+import numpy as np
+from affine import Affine
+from rasterio.warp import Resampling, reproject
+from shapely.geometry import Polygon, box
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sc_pqpf.coverage_weights import LeaseCoverageCache  # noqa: E402
+
+try:
+    from rasterstats import zonal_stats
+except ImportError:
+    zonal_stats = None
+
+CRS = "EPSG:32617"
+FACTOR = 20
+NODATA = 9999.0
+# 6 x 8 grid of 1 km cells, upper-left corner at (500000, 4000000)
+TRANSFORM = Affine(1000.0, 0.0, 500000.0, 0.0, -1000.0, 4000000.0)
+SHAPE = (6, 8)
+
+
+def lease_polygons(x0=500000.0, y0=4000000.0):
+    return [
+        box(x0 + 1200, y0 - 3300, x0 + 2700, y0 - 1800),  # interior
+        Polygon(
+            [(x0 + 4100, y0 - 1100), (x0 + 5900, y0 - 1300), (x0 + 5000, y0 - 2900)]
+        ),
+        box(x0 + 10, y0 - 900, x0 + 600, y0 - 100),  # top-left grid edge
+        box(x0 + 7300, y0 - 5990, x0 + 8000, y0 - 5100),  # bottom-right grid edge
+        box(x0 + 7500, y0 - 2500, x0 + 9000, y0 - 1500),  # partly outside (east)
+        box(x0 - 500, y0 - 4500, x0 + 400, y0 - 3600),  # partly outside (west)
+        box(x0 + 3100, y0 - 3900, x0 + 3400, y0 - 3600),  # inside one cell
+        box(x0 + 20000, y0 - 3000, x0 + 21000, y0 - 2000),  # outside
+    ]
+
+
+@unittest.skipIf(zonal_stats is None, "rasterstats is not installed")
+class TestCoverageWeights(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shp_path = os.path.join(self.tmp_dir.name, "leases.shp")
+        self.geoms = lease_polygons()
+        self.write_layer(self.geoms)
+        self.cache = LeaseCoverageCache(self.shp_path, factor=FACTOR)
+        self.band = np.random.default_rng(7).random(SHAPE).astype("float32")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_layer(self, geoms):
+        gpd.GeoDataFrame(
+            {"lease_id": [f"L{i}" for i in range(len(geoms))], "geometry": geoms},
+            crs=CRS,
+        ).to_file(self.shp_path)
+
+    def rasterstats_mean(self, band):
+        # The replaced method: gdalwarp bilinear upsampling, then a zonal mean
+        fine = np.full((SHAPE[0] * FACTOR, SHAPE[1] * FACTOR), -999, dtype="float32")
+        fine_transform = TRANSFORM * Affine.scale(1.0 / FACTOR)
+        reproject(
+            band,
+            fine,
+            src_transform=TRANSFORM,
+            src_crs=CRS,
+            src_nodata=NODATA,
+            dst_transform=fine_transform,
+            dst_crs=CRS,
+            dst_nodata=-999,
+            resampling=Resampling.bilinear,
+        )
+        stats = zonal_stats(
+            self.geoms,
+            fine,
+            affine=fine_transform,
+            nodata=-999,
+            all_touched=True,
+            stats=["mean"],
+        )
+        return np.array([s["mean"] for s in stats], dtype="float64")
+
+    def assert_matches(self, band):
+        expected = self.rasterstats_mean(band)
+        mean = self.cache.load(TRANSFORM, SHAPE, CRS).zonal_mean(band, NODATA)
+        np.testing.assert_array_equal(np.isnan(mean), np.isnan(expected))
+        np.testing.assert_allclose(mean, expected, rtol=0, atol=1e-6, equal_nan=True)
+        return mean
+
+    def test_matches_zonal_stats(self):
+        mean = self.assert_matches(self.band)
+        self.assertTrue(np.isnan(mean[-1]))
+        self.assertFalse(np.isnan(mean[:-1]).any())
+
+    def test_nodata_cells(self):
+        band = self.band.copy()
+        band[0, 0] = NODATA  # under the top-left lease
+        band[2, 2] = NODATA  # inside the interior lease
+        band[1, 7] = NODATA  # next to the east lease
+        band[5, 6] = NODATA  # next to the bottom-right lease
+        mean = self.assert_matches(band)
+        self.assertTrue(np.isnan(mean[2]))
+
+    def test_cache_rebuild(self):
+        self.cache.load(TRANSFORM, SHAPE, CRS)
+        npz_path = f"{self.cache.cache_path(TRANSFORM, SHAPE, CRS)}.npz"
+        mtime = os.stat(npz_path).st_mtime_ns
+        self.cache.load(TRANSFORM, SHAPE, CRS)
+        self.assertEqual(os.stat(npz_path).st_mtime_ns, mtime)
+
+        # Moved lease
+        self.geoms[0] = box(503100, 3995100, 504900, 3996900)
+        self.write_layer(self.geoms)
+        self.assert_matches(self.band)
+        self.assertNotEqual(os.stat(npz_path).st_mtime_ns, mtime)
+
+        # Another grid, or the same affine in another projection, gets its own cache
+        shifted = TRANSFORM * Affine.translation(1, 0)
+        grids = [(shifted, SHAPE, CRS), (TRANSFORM, SHAPE, "EPSG:32618")]
+        paths = {self.cache.cache_path(TRANSFORM, SHAPE, CRS)}
+        for transform, shape, crs in grids:
+            paths.add(self.cache.cache_path(transform, shape, crs))
+            self.cache.load(transform, shape, crs)
+            npz = f"{self.cache.cache_path(transform, shape, crs)}.npz"
+            self.assertTrue(os.path.exists(npz))
+        self.assertEqual(len(paths), 3)
+        self.assertTrue(os.path.exists(npz_path))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
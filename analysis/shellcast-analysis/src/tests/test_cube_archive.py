@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the daily PQPF cube archive and its time-series queries.
+
+Usage:
+    python -m pytest test_cube_archive.py -v
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+from affine import Affine
+from pyproj import CRS as ProjCRS
+from pyproj import Transformer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import cube_archive  # noqa: E402
+from grid_index import GridIndex  # noqa: E402
+
+TRANSFORM = Affine(2539.703, 0, -1000.0, 0, -2539.703, 2000.0)
+CRS = "EPSG:5070"
+THRESHOLDS = [0.2, 1.0, 4.0]
+NODATA = 9999.0
+DAYS = [date(2024, 1, 12), date(2024, 1, 13), date(2024, 1, 14)]
+# Leases at (row, col), the last one outside the grid, in two CMUs
+ROWS = np.array([0, 70, 129, 0])
+COLS = np.array([5, 100, 149, -1])
+CODES = np.array([0, 0, 1, 1])
+
+
+def cube_data(day_number):
+    rng = np.random.default_rng(day_number)
+    return rng.random((len(THRESHOLDS), 130, 150)).astype("float32")
+
+
+class FakeLeaseIndex:
+    def __init__(self):
+        self.calls = []
+
+    def load(self, transform, shape, crs=None):
+        self.calls.append((transform, shape, crs))
+        inside = (ROWS >= 0) & (COLS >= 0)
+        return GridIndex(ROWS, COLS, inside, CODES, ["cmu_a", "cmu_b"])
+
+
+class TestCubeArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.archive = cube_archive.CubeArchive(self.tmp_dir)
+        self.data = {}
+        for number, day in enumerate(DAYS):
+            self.data[day] = cube_data(number)
+            cube = SimpleNamespace(
+                data=self.data[day],
+                thresholds=THRESHOLDS,
+                transform=TRANSFORM,
+                crs=CRS,
+                nodata=NODATA,
+            )
+            self.archive.append_cubes(day, {"24h": cube})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index(self):
+        self.assertEqual(self.archive.variables(), ["pqpf_24h"])
+        self.assertEqual(self.archive.days("pqpf_24h"), DAYS)
+        self.assertEqual(self.archive.days("pqpf_24h", start=DAYS[1]), DAYS[1:])
+        self.assertEqual(self.archive.days("pqpf_48h"), [])
+
+    def test_read_band(self):
+        band = self.archive.read_band("pqpf_24h", DAYS[1], 1.0)
+        np.testing.assert_array_equal(band, self.data[DAYS[1]][1])
+        with self.assertRaises(KeyError):
+            self.archive.read_band("pqpf_24h", DAYS[1], 2.5)
+
+    def test_nodata(self):
+        data = cube_data(7)
+        data[0, 3, 4] = NODATA
+        self.archive.append(
+            "2024-01-15", "tp", data, [24, 48, 72], TRANSFORM, CRS, NODATA
+        )
+        band = self.archive.read_band("tp", "2024-01-15", 24)
+        self.assertTrue(np.isnan(band[3, 4]))
+        self.assertEqual(np.isnan(band).sum(), 1)
+
+    def test_lease_series(self):
+        lease_index = FakeLeaseIndex()
+        df = cube_archive.lease_series(
+            self.archive, lease_index, "pqpf_24h", 4.0, [1, 2, 3], end=DAYS[1]
+        )
+        self.assertEqual(list(df.index.date), DAYS[:2])
+        for day in DAYS[:2]:
+            expected = self.data[day][2, ROWS[1:3], COLS[1:3]]
+            np.testing.assert_allclose(df.loc[str(day), [1, 2]], expected)
+        self.assertTrue(df[3].isna().all())
+        # One grid: the leases are indexed once
+        self.assertEqual(len(lease_index.calls), 1)
+        self.assertEqual(lease_index.calls[0][2], CRS)
+
+    def test_cmu_series(self):
+        df = cube_archive.cmu_series(
+            self.archive, FakeLeaseIndex(), "pqpf_24h", 0.2, ["cmu_a", "cmu_b", "x"]
+        )
+        for day in DAYS:
+            band = self.data[day][0]
+            expected = band[ROWS[:2], COLS[:2]].mean()
+            self.assertAlmostEqual(df.loc[str(day), "cmu_a"], expected, places=6)
+            self.assertAlmostEqual(df.loc[str(day), "cmu_b"], band[129, 149], places=6)
+        self.assertTrue(df["x"].isna().all())
+
+    def test_reads_only_needed_tiles(self):
+        meta = self.archive.meta("pqpf_24h", DAYS[0])
+        self.assertEqual(len(meta["offsets"]) - 1, len(THRESHOLDS) * 3 * 3)
+        read = []
+        read_tiles = self.archive._read_tiles
+
+        def spy(variable, day, meta, band, keys):
+            read.append(sorted(keys))
+            return read_tiles(variable, day, meta, band, keys)
+
+        self.archive._read_tiles = spy
+        cube_archive.lease_series(self.archive, FakeLeaseIndex(), "pqpf_24h", 1.0, [0])
+        self.assertEqual(read, [[(0, 0)]] * len(DAYS))
+
+    def test_crop_to_state(self):
+        # Union grid of several states on a Lambert conformal grid; the state's
+        # box covers part of it
+        crs = ProjCRS.from_proj4(
+            "+proj=lcc +lat_0=25 +lon_0=-95 +lat_1=25 +lat_2=25 +R=6371200 +units=m"
+        ).to_wkt()
+        transform = Affine(2539.703, 0, 1300000.0, 0, -2539.703, 1200000.0)
+        data = cube_data(9)
+        bounds = (-80.5, 32.5, -79.5, 33.5)
+        cube = SimpleNamespace(
+            data=data,
+            thresholds=THRESHOLDS,
+            transform=transform,
+            crs=crs,
+            nodata=NODATA,
+            shape=data.shape[1:],
+        )
+        self.archive.append_cubes(DAYS[0], {"48h": cube}, bounds=bounds)
+
+        meta = self.archive.meta("pqpf_48h", DAYS[0])
+        rows, cols = cube_archive.crop_window(transform, data.shape[1:], crs, bounds)
+        self.assertLess(meta["shape"][0] * meta["shape"][1], 130 * 150 / 4)
+        self.assertEqual(
+            meta["shape"], [rows.stop - rows.start, cols.stop - cols.start]
+        )
+        band = self.archive.read_band("pqpf_48h", DAYS[0], 4.0)
+        np.testing.assert_array_equal(band, data[2, rows, cols])
+
+        # Every box corner and edge midpoint falls in a stored cell, at the same
+        # position as on the union grid
+        lons, lats = np.meshgrid([-80.5, -80.0, -79.5], [32.5, 33.0, 33.5])
+        to_grid = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+        x, y = to_grid.transform(lons.ravel(), lats.ravel())
+        stored = Affine.from_gdal(*meta["transform"])
+        for col, row in zip(*(~stored * (x, y))):
+            self.assertTrue(0 <= row < band.shape[0] and 0 <= col < band.shape[1])
+            union_col, union_row = (~transform * stored) * (col, row)
+            self.assertEqual(
+                band[int(row), int(col)], data[2, int(union_row), int(union_col)]
+            )
+
+        # A box off the grid stores an empty window
+        rows, cols = cube_archive.crop_window(
+            transform, data.shape[1:], crs, (-70.0, 44.0, -69.0, 45.0)
+        )
+        self.assertEqual((rows.stop - rows.start) * (cols.stop - cols.start), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
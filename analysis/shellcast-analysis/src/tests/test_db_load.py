@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the bulk probability loader (SQLite stands in for MySQL).
+
+Usage:
+    python -m pytest test_db_load.py -v
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import db_load  # noqa: E402
+
+CREATE_TABLE = """
+CREATE TABLE cmu_probabilities (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  cmu_name varchar(10) NOT NULL,
+  prob_1d_perc tinyint NULL,
+  prob_2d_perc tinyint NULL,
+  prob_3d_perc tinyint NULL,
+  forecast_date date NOT NULL,
+  created datetime,
+  UNIQUE (cmu_name, forecast_date)
+)
+"""
+
+
+class TestDBLoad(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine("sqlite://")
+        with self.engine.begin() as conn:
+            conn.execute(sa.text(CREATE_TABLE))
+        self.df = pd.DataFrame(
+            {
+                "cmu_name": ["U001", "U002", "U003", "U004", "U005"],
+                "prob_1d_perc": [1, 2, 3, 4, 5],
+                "prob_2d_perc": [1, 1, 1, 1, np.nan],
+                "prob_3d_perc": [5, 4, 3, 2, 1],
+            }
+        )
+
+    def rows(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                sa.text(
+                    "SELECT cmu_name, prob_1d_perc, prob_2d_perc, forecast_date "
+                    "FROM cmu_probabilities ORDER BY forecast_date, cmu_name"
+                )
+            ).all()
+
+    def test_chunked_insert(self):
+        created = datetime(2024, 1, 14, 6, 40)
+        counts = db_load.upsert_probabilities(
+            self.engine, self.df, created=created, chunk_size=2
+        )
+        rows = self.rows()
+        self.assertEqual(counts, {"upserted": 5, "deleted": 0})
+        self.assertEqual(len(rows), 5)
+        self.assertIsNone(rows[4][2])
+        self.assertEqual(rows[0][3], "2024-01-14")
+
+    def test_rerun_updates_and_removes_stale_units(self):
+        db_load.upsert_probabilities(
+            self.engine, self.df, created=datetime(2024, 1, 14, 6, 40)
+        )
+        df = self.df.iloc[:4].copy()
+        df["prob_1d_perc"] = 5
+        counts = db_load.upsert_probabilities(
+            self.engine, df, created=datetime(2024, 1, 14, 9, 0)
+        )
+        rows = self.rows()
+        self.assertEqual(counts["deleted"], 1)
+        self.assertEqual([row[0] for row in rows], ["U001", "U002", "U003", "U004"])
+        self.assertTrue(all(row[1] == 5 for row in rows))
+
+    def test_other_days_are_kept(self):
+        db_load.upsert_probabilities(
+            self.engine, self.df, created=datetime(2024, 1, 13, 6, 40)
+        )
+        db_load.upsert_probabilities(
+            self.engine, self.df.iloc[:2], created=datetime(2024, 1, 14, 6, 40)
+        )
+        self.assertEqual(len(self.rows()), 7)
+
+    def test_server_time_default(self):
+        db_load.upsert_probabilities(self.engine, self.df)
+        self.assertEqual(len(self.rows()), 5)
+
+    def test_has_forecast_date(self):
+        with self.engine.connect() as conn:
+            self.assertTrue(db_load.has_forecast_date(conn))
+
+    def test_unit_column(self):
+        self.assertEqual(db_load.unit_column(["cmu_id", "prob_1d_perc"]), "cmu_id")
+        with self.assertRaises(ValueError):
+            db_load.unit_column(["prob_1d_perc"])
+
+    def test_mysql_statement(self):
+        sql = db_load.upsert_sql(
+            "mysql", ["lease_id", "prob_1d_perc", "forecast_date"], "lease_id"
+        )
+        self.assertEqual(
+            sql,
+            "INSERT INTO cmu_probabilities (lease_id, prob_1d_perc, forecast_date) "
+            "VALUES (:lease_id, :prob_1d_perc, :forecast_date) "
+            "ON DUPLICATE KEY UPDATE prob_1d_perc = VALUES(prob_1d_perc)",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
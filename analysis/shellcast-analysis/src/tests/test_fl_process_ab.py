@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the vectorized FL Process A/B.
+
+Usage:
+    python -m pytest test_fl_process_ab.py -v
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import raster_sampling  # noqa: E402
+from fl_pqpf import process_ab  # noqa: E402
+
+
+class Cube:
+    """Threshold cube with the PQPFCube attributes used by Process B."""
+
+    def __init__(self, data, thresholds):
+        self.data = data
+        self.thresholds = thresholds
+
+    def band_lookup(self, values):
+        return raster_sampling.band_lookup(self.thresholds, values)
+
+
+class TestProcessAB(unittest.TestCase):
+    def test_pqpf_thresholds(self):
+        tp_calc = [0, 0.1, 0.2, 0.21, 1.0, 1.2, 3.5, 7.9, 8.0, 8.01, 20, -0.5, np.nan]
+        expected = [0, 0.2, 0.2, 0.5, 1, 1.5, 4, 8, 8, 16, 16, np.nan, np.nan]
+        np.testing.assert_array_equal(process_ab.pqpf_thresholds(tp_calc), expected)
+
+    def test_accumulation_layers(self):
+        layers = process_ab.accumulation_layers([1, 2, 3, 7, 8, 4], [24, 48, 144])
+        np.testing.assert_array_equal(layers, [-1, 0, 1, 2, -1, -1])
+
+    def test_tp_accumulation(self):
+        stack = np.stack([np.full((2, 2), 1.0), np.full((2, 2), 2.0)])
+        rows = np.array([0, 1, 1, 0])
+        cols = np.array([0, 1, 0, 1])
+        inside = np.array([True, True, False, True])
+        values = process_ab.tp_accumulation(
+            [1, 2, 3, 4], [24, 48], stack, rows, cols, inside
+        )
+        np.testing.assert_array_equal(values, [0, 1, np.nan, np.nan])
+        values = process_ab.tp_accumulation([1, 2], [], None, None, None, None)
+        np.testing.assert_array_equal(values, [0, np.nan])
+
+    def test_pqpf_probabilities(self):
+        data = np.stack([np.full((2, 2), 0.3), np.full((2, 2), 0.6)])
+        cube = Cube(data, [0.5, 1.0])
+        tp_calc = np.array([0.9, -1.0, 0.4, 9.0, 0.8])
+        pqpf_th = process_ab.pqpf_thresholds(tp_calc)
+        rows = cols = np.zeros(5, dtype="int64")
+        inside = np.ones(5, dtype=bool)
+        values, order = process_ab.pqpf_probabilities(
+            tp_calc, pqpf_th, cube, rows, cols, inside
+        )
+        # Negative first, then 0.5 then 1.0; the 16 in threshold is not in the cube
+        np.testing.assert_array_equal(order, [1, 2, 0, 4])
+        np.testing.assert_array_equal(values[order], [1, 0.3, 0.6, 0.6])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
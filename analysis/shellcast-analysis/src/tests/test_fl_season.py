@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the compiled FL season windows.
+
+Usage:
+    python -m pytest test_fl_season.py -v
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Point
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import layer_cache  # noqa: E402
+from fl_pqpf import season  # noqa: E402
+
+
+class TestSeasonWindows(unittest.TestCase):
+    def test_single_window(self):
+        mask = season.compile_season("[1/1-12/31]")
+        self.assertTrue(mask.all())
+
+    def test_multiple_windows(self):
+        mask = season.compile_season("4/1-6/30, 9/1-11/30")
+        self.assertTrue(mask[season.day_index(date(2023, 4, 1))])
+        self.assertTrue(mask[season.day_index(date(2023, 6, 30))])
+        self.assertFalse(mask[season.day_index(date(2023, 7, 1))])
+        self.assertTrue(mask[season.day_index(date(2023, 10, 15))])
+        self.assertFalse(mask[season.day_index(date(2023, 12, 1))])
+
+    def test_year_crossing_window(self):
+        mask = season.compile_season("[11/1-2/28]")
+        self.assertTrue(mask[season.day_index(date(2023, 12, 31))])
+        self.assertTrue(mask[season.day_index(date(2024, 1, 15))])
+        self.assertTrue(mask[season.day_index(date(2024, 2, 28))])
+        self.assertFalse(mask[season.day_index(date(2024, 2, 29))])
+        self.assertFalse(mask[season.day_index(date(2024, 10, 31))])
+
+    def test_invalid_window(self):
+        with self.assertRaises(ValueError):
+            season.compile_season("4/1-6/31")
+
+    def test_in_season(self):
+        calendar = season.SeasonCalendar(["[1/1-12/31]"])
+        flags = calendar.in_season(
+            ["[1/1-12/31]", "4/1-6/30", "[11/1-2/28]", "4/1-6/30"], date(2024, 5, 2)
+        )
+        np.testing.assert_array_equal(flags, [True, True, False, True])
+        self.assertEqual(len(calendar.seasons), 3)
+
+
+@unittest.skipIf(layer_cache.pyarrow is None, "pyarrow is not installed")
+class TestLoadCalendar(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shp_path = os.path.join(self.tmp_dir.name, "leases.shp")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_layer(self, seasons):
+        gpd.GeoDataFrame(
+            {"season": seasons, "geometry": [Point(i, i) for i in range(len(seasons))]},
+            crs="EPSG:4326",
+        ).to_file(self.shp_path)
+
+    def test_stored_with_layer_cache(self):
+        self.write_layer(["4/1-6/30", "[11/1-2/28]", "4/1-6/30"])
+        calendar = season.load_calendar(self.shp_path)
+        fpath = layer_cache.LayerCache(self.shp_path).sidecar_path(
+            season.SIDECAR_SUFFIX
+        )
+        self.assertTrue(os.path.exists(fpath))
+        self.assertEqual(sorted(calendar.seasons), ["4/1-6/30", "[11/1-2/28]"])
+        loaded, _ = season.SeasonCalendar.load(fpath)
+        np.testing.assert_array_equal(
+            loaded.masks[loaded.index["[11/1-2/28]"]],
+            season.compile_season("[11/1-2/28]"),
+        )
+
+        self.write_layer(["[1/1-12/31]"])
+        self.assertEqual(season.load_calendar(self.shp_path).seasons, ["[1/1-12/31]"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
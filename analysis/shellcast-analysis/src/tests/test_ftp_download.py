@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the concurrent, resumable FTP downloader against a local FTP server.
+
+Usage:
+    python -m pytest test_ftp_download.py -v
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from ftp_download import FTPDownloader, parse_mdtm  # noqa: E402
+
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+except ImportError:
+    ThreadedFTPServer = None
+
+
+@unittest.skipIf(ThreadedFTPServer is None, "pyftpdlib is not installed")
+class TestFTPDownloader(unittest.TestCase):
+    def setUp(self):
+        self.remote_dir = tempfile.mkdtemp()
+        self.local_dir = tempfile.mkdtemp()
+        self.files = {}
+        for idx in range(6):
+            name = f"xmrg01142024{idx:02d}z.grb.gz"
+            data = os.urandom(50_000 + idx)
+            with open(os.path.join(self.remote_dir, name), "wb") as wf:
+                wf.write(data)
+            self.files[name] = data
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_anonymous(self.remote_dir)
+        handler = type("Handler", (FTPHandler,), {"authorizer": authorizer})
+        self.server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+        self.port = self.server.socket.getsockname()[1]
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while not self.stop.is_set():
+            self.server.serve_forever(timeout=0.05, blocking=False)
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join(timeout=5)
+        self.server.close_all()
+        shutil.rmtree(self.remote_dir)
+        shutil.rmtree(self.local_dir)
+
+    def downloader(self):
+        return FTPDownloader(
+            "127.0.0.1", "/", max_workers=3, retries=1, backoff=0, port=self.port
+        )
+
+    def read_local(self, name):
+        with open(os.path.join(self.local_dir, name), "rb") as rf:
+            return rf.read()
+
+    def test_parallel_download(self):
+        results = self.downloader().download(list(self.files), self.local_dir)
+        self.assertTrue(all(results.values()))
+        for name, data in self.files.items():
+            self.assertEqual(self.read_local(name), data)
+        self.assertFalse([f for f in os.listdir(self.local_dir) if f.endswith(".part")])
+
+    def test_resume_partial_transfer(self):
+        name = next(iter(self.files))
+        remote_path = os.path.join(self.remote_dir, name)
+        size = os.path.getsize(remote_path)
+        dest_path = os.path.join(self.local_dir, name)
+        part = FTPDownloader.part_path(dest_path, size, os.path.getmtime(remote_path))
+        # Marker bytes only survive if the transfer restarts at the partial offset
+        with open(part, "wb") as wf:
+            wf.write(b"x" * 1000)
+        stale = FTPDownloader.part_path(dest_path, size - 1, 1)
+        open(stale, "wb").close()
+
+        self.assertTrue(self.downloader().fetch(name, dest_path))
+        self.assertEqual(self.read_local(name), b"x" * 1000 + self.files[name][1000:])
+        self.assertFalse(os.path.exists(part))
+        self.assertFalse(os.path.exists(stale))
+
+    def test_read_range(self):
+        name = next(iter(self.files))
+        downloader = self.downloader()
+        ok, data = downloader.call(name, downloader.read_range, name, 1000, 2000)
+        self.assertTrue(ok)
+        self.assertEqual(data, self.files[name][1000:3000])
+        # The session is still usable after the aborted transfer
+        ok, tail = downloader.call(name, downloader.read_range, name, 50_000, 1000)
+        self.assertEqual(tail, self.files[name][50_000:])
+        downloader.close()
+
+    def test_missing_file(self):
+        results = self.downloader().download(["missing.grb"], self.local_dir)
+        self.assertEqual(results, {"missing.grb": False})
+        self.assertEqual(os.listdir(self.local_dir), [])
+
+    def test_gunzip_stream(self):
+        name = "xmrg0114202406z.grb.gz"
+        raw = os.urandom(1000) * 80
+        with gzip.open(os.path.join(self.remote_dir, name), "wb") as wf:
+            wf.write(raw)
+
+        results = self.downloader().download([name], self.local_dir, gunzip=True)
+        self.assertEqual(results, {name: True})
+        self.assertEqual(self.read_local("xmrg0114202406z.grb"), raw)
+        self.assertEqual(os.listdir(self.local_dir), ["xmrg0114202406z.grb"])
+        # Unchanged remote file is not downloaded again
+        dest_path = os.path.join(self.local_dir, "xmrg0114202406z.grb")
+        inode = os.stat(dest_path).st_ino
+        self.assertTrue(self.downloader().fetch(name, dest_path, gunzip=True))
+        self.assertEqual(os.stat(dest_path).st_ino, inode)
+
+    def test_invalid_gzip(self):
+        name = next(iter(self.files))  # random bytes, not a gzip stream
+        results = self.downloader().download([name], self.local_dir, gunzip=True)
+        self.assertEqual(results, {name: False})
+        self.assertFalse(os.path.exists(os.path.join(self.local_dir, name[:-3])))
+
+    def test_parse_mdtm(self):
+        self.assertEqual(parse_mdtm("213 19700101000100"), 60.0)
+        self.assertIsNone(parse_mdtm("550 not found"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
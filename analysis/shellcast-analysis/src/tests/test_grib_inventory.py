@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the PQPF GRIB inventory and byte-range downloads against a local FTP
+server.
+
+Usage:
+    python -m pytest test_grib_inventory.py -v
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import grib_inventory  # noqa: E402
+from ftp_download import FTPDownloader  # noqa: E402
+
+try:
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+except ImportError:
+    ThreadedFTPServer = None
+
+GRB_NAME = "pqpf_p24i_conus_2022093012f024.grb"
+GRB_FPATH = os.path.join(os.path.dirname(__file__), "data", GRB_NAME)
+# upperLimit (mm) of the probability messages 9 to 20
+UPPER_LIMITS = [
+    6.35,
+    12.7,
+    25.4,
+    38.1,
+    50.8,
+    63.5,
+    76.2,
+    101.6,
+    127.0,
+    152.4,
+    203.2,
+    406.4,
+]
+
+
+def read_grb():
+    with open(GRB_FPATH, "rb") as rf:
+        return rf.read()
+
+
+class TestInventory(unittest.TestCase):
+    def setUp(self):
+        self.data = read_grb()
+        self.messages = grib_inventory.scan(
+            lambda offset, nbytes: self.data[offset : offset + nbytes], len(self.data)
+        )
+
+    def test_scan(self):
+        self.assertEqual(len(self.messages), 20)
+        self.assertEqual(sum(msg["length"] for msg in self.messages), len(self.data))
+        upper_limits = [msg["upper_limit"] for msg in self.messages]
+        self.assertEqual(upper_limits, [None] * 8 + UPPER_LIMITS)
+
+    def test_select(self):
+        selected = grib_inventory.select(self.messages, [1.0, 4.0])
+        self.assertEqual([msg["number"] for msg in selected], [11, 16])
+        # 6.35 mm (0.25 in) is keyed 0.2 like the PQPF cube bands
+        self.assertEqual(grib_inventory.select(self.messages, [0.2])[0]["number"], 9)
+        probability = grib_inventory.select(self.messages)
+        self.assertEqual(len(probability), 12)
+        # The probability messages are contiguous: one range
+        start = self.messages[8]["offset"]
+        self.assertEqual(
+            grib_inventory.byte_ranges(probability), [(start, len(self.data) - start)]
+        )
+
+    def test_parse_idx(self):
+        lines = [
+            f"{msg['number']}:{msg['offset']}:d=2022093012:APCP:surface:"
+            + (
+                f"0-{msg['hour']} hour acc fcst:prob >{msg['upper_limit']:g}:"
+                "prob fcst 255/255"
+                if msg["upper_limit"] is not None
+                else "0-24 hour acc fcst:10% level"
+            )
+            for msg in self.messages
+        ]
+        messages = grib_inventory.parse_idx("\n".join(lines), len(self.data))
+        self.assertEqual(messages, self.messages)
+
+    def test_forecast_hours(self):
+        hours = {msg["hour"] for msg in grib_inventory.select(self.messages)}
+        self.assertEqual(hours, {6, 24})
+
+    def test_not_grib(self):
+        with self.assertRaises(ValueError):
+            grib_inventory.parse_header(b"x" * 64)
+
+
+class TestMessageIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.grb_fpath = shutil.copy(GRB_FPATH, self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_bands(self):
+        bands = grib_inventory.MessageIndex.for_file(self.grb_fpath).bands()
+        self.assertEqual(len(bands), 12)
+        self.assertEqual(bands[0.2], 9)
+        self.assertEqual(bands[4.0], 16)
+        self.assertEqual(bands[16.0], 20)
+
+    def test_stored_once(self):
+        index = grib_inventory.MessageIndex.for_file(self.grb_fpath)
+        index_fpath = grib_inventory.MessageIndex.path(self.grb_fpath)
+        mtime = os.stat(index_fpath).st_mtime_ns
+        stored = grib_inventory.MessageIndex.for_file(self.grb_fpath)
+        self.assertEqual(os.stat(index_fpath).st_mtime_ns, mtime)
+        self.assertEqual(stored.messages, index.messages)
+        # A changed file is indexed again
+        with open(self.grb_fpath, "ab") as wf:
+            wf.write(read_grb()[: index.messages[0]["length"]])
+        rebuilt = grib_inventory.MessageIndex.for_file(self.grb_fpath)
+        self.assertEqual(len(rebuilt.messages), 21)
+
+    def test_extract(self):
+        index = grib_inventory.MessageIndex.for_file(self.grb_fpath)
+        out_fpath = os.path.join(self.tmp_dir.name, "extract.grb")
+        extracted = index.extract(self.grb_fpath, out_fpath, index.select([4.0, 1.0]))
+        self.assertEqual(extracted.bands(), {1.0: 1, 4.0: 2})
+        rebuilt = grib_inventory.MessageIndex.build(out_fpath)
+        self.assertEqual(rebuilt.messages, extracted.messages)
+
+    def test_table(self):
+        table = grib_inventory.MessageIndex.build(self.grb_fpath).table()
+        self.assertEqual(len(table.splitlines()), 21)
+        self.assertIn("16 in", table.splitlines()[-1])
+
+
+@unittest.skipIf(ThreadedFTPServer is None, "pyftpdlib is not installed")
+class TestGribRangeFetcher(unittest.TestCase):
+    def setUp(self):
+        self.remote_dir = tempfile.mkdtemp()
+        self.local_dir = tempfile.mkdtemp()
+        shutil.copy(GRB_FPATH, self.remote_dir)
+        self.data = read_grb()
+        self.dest_path = os.path.join(self.local_dir, GRB_NAME)
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_anonymous(self.remote_dir)
+        handler = type("Handler", (FTPHandler,), {"authorizer": authorizer})
+        self.server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+        self.port = self.server.socket.getsockname()[1]
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while not self.stop.is_set():
+            self.server.serve_forever(timeout=0.05, blocking=False)
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join(timeout=5)
+        self.server.close_all()
+        shutil.rmtree(self.remote_dir)
+        shutil.rmtree(self.local_dir)
+
+    def fetcher(self, thresholds):
+        downloader = FTPDownloader(
+            "127.0.0.1", "/", max_workers=2, retries=1, backoff=0, port=self.port
+        )
+        return grib_inventory.GribRangeFetcher(downloader, self.local_dir, thresholds)
+
+    def local_upper_limits(self):
+        with open(self.dest_path, "rb") as rf:
+            data = rf.read()
+        messages = grib_inventory.scan(
+            lambda offset, nbytes: data[offset : offset + nbytes], len(data)
+        )
+        return [msg["upper_limit"] for msg in messages]
+
+    def test_threshold_messages(self):
+        results = self.fetcher([1.0, 4.0]).download([GRB_NAME])
+        self.assertEqual(results, {GRB_NAME: True})
+        self.assertEqual(self.local_upper_limits(), [25.4, 101.6])
+        self.assertTrue(grib_inventory.covers(self.dest_path, [4.0]))
+        self.assertFalse(grib_inventory.covers(self.dest_path, [2.5]))
+        self.assertFalse(grib_inventory.covers(self.dest_path))
+
+    def test_missing_messages_are_appended(self):
+        self.fetcher([1.0]).download([GRB_NAME])
+        self.fetcher([1.0, 2.5]).download([GRB_NAME])
+        self.assertEqual(self.local_upper_limits(), [25.4, 63.5])
+        sidecar = grib_inventory.load_sidecar(self.dest_path)
+        self.assertEqual(sidecar["local"], [11, 14])
+        self.assertEqual(sidecar["size"], len(self.data))
+
+    def test_published_idx(self):
+        messages = grib_inventory.scan(
+            lambda offset, nbytes: self.data[offset : offset + nbytes], len(self.data)
+        )
+        # Message 20 relabeled: only the published inventory can locate 999 mm
+        idx = "\n".join(
+            f"{msg['number']}:{msg['offset']}:d=2022093012:APCP:surface:acc fcst:"
+            + (f"prob >{msg['upper_limit']:g}:" if msg["upper_limit"] else "")
+            for msg in messages[:-1]
+        )
+        idx += f"\n20:{messages[-1]['offset']}:d=2022093012:APCP:surface:prob >999:"
+        with open(os.path.join(self.remote_dir, GRB_NAME + ".idx"), "w") as wf:
+            wf.write(idx)
+        threshold = grib_inventory.threshold_inches(999)
+        results = self.fetcher([threshold]).download([GRB_NAME])
+        self.assertEqual(results, {GRB_NAME: True})
+        self.assertEqual(self.local_upper_limits(), [406.4])
+        sidecar = grib_inventory.load_sidecar(self.dest_path)
+        self.assertEqual(sidecar["messages"][-1]["length"], messages[-1]["length"])
+
+    def test_full_file_fallback(self):
+        # No probability message of a 0.3 in threshold: download the whole file
+        self.assertEqual(self.fetcher([0.3]).download([GRB_NAME]), {GRB_NAME: True})
+        with open(self.dest_path, "rb") as rf:
+            self.assertEqual(rf.read(), self.data)
+        self.assertFalse(os.path.exists(grib_inventory.sidecar_path(self.dest_path)))
+        self.assertTrue(grib_inventory.covers(self.dest_path, [0.3]))
+
+    def test_all_probability_messages(self):
+        self.fetcher(None).download([GRB_NAME])
+        with open(grib_inventory.sidecar_path(self.dest_path), "r") as rf:
+            self.assertEqual(len(json.load(rf)["local"]), 12)
+        self.assertEqual(self.local_upper_limits(), UPPER_LIMITS)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the cached lease to grid-cell index.
+
+Usage:
+    python -m pytest test_grid_index.py -v
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import geopandas as gpd
+import numpy as np
+from affine import Affine
+from pyproj import CRS, Transformer
+from shapely.geometry import Point
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import grid_index  # noqa: E402
+
+# 4 x 5 grid of 0.1 degree cells, upper-left corner at (-80, 36)
+TRANSFORM = Affine(0.1, 0.0, -80.0, 0.0, -0.1, 36.0)
+SHAPE = (4, 5)
+# Lambert conformal 2.5 km grid like the native PQPF (NDFD CONUS) grid, as the WKT
+# GDAL reports for a decoded cube, here over Florida
+NATIVE_CRS = CRS.from_proj4(
+    "+proj=lcc +lat_0=25 +lon_0=-95 +lat_1=25 +lat_2=25 +R=6371200 +units=m +no_defs"
+).to_wkt()
+NATIVE_TRANSFORM = Affine(2539.703, 0.0, 1000000.0, 0.0, -2539.703, 900000.0)
+NATIVE_SHAPE = (300, 400)
+
+
+class TestLeaseGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shp_path = os.path.join(self.tmp_dir.name, "leases.shp")
+        # The last two leases are east of and north of the grid
+        self.write_layer(
+            [(-79.95, 35.95), (-79.55, 35.65), (-79.2, 35.8), (-79.9, 36.1)]
+        )
+        self.lease_index = grid_index.LeaseGridIndex(self.shp_path, "cmu_name")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_layer(self, points):
+        gpd.GeoDataFrame(
+            {
+                "cmu_name": ["U1", "U2", "U1", "U3", "U2"][: len(points)],
+                "geometry": [Point(x, y) for x, y in points],
+            },
+            crs="EPSG:4326",
+        ).to_file(self.shp_path)
+
+    def meta_mtime(self, transform=TRANSFORM, shape=SHAPE, crs=None):
+        index_dir = self.lease_index.index_dir(transform, shape, crs)
+        return os.stat(os.path.join(index_dir, grid_index.META_FNAME)).st_mtime_ns
+
+    def test_index(self):
+        index = self.lease_index.load(TRANSFORM, SHAPE)
+        self.assertEqual(list(index.rows[:2]), [0, 3])
+        self.assertEqual(list(index.cols[:2]), [0, 4])
+        self.assertEqual(list(index.inside), [True, True, False, False])
+        self.assertEqual(index.groups, ["U1", "U2", "U3"])
+        self.assertEqual(list(index.codes), [0, 1, 0, 2])
+        band = np.arange(20, dtype="float64").reshape(SHAPE)
+        values = index.sample(band)
+        self.assertEqual(list(values[:2]), [0.0, 19.0])
+        self.assertTrue(np.isnan(values[2:]).all())
+
+    def test_cache_hit(self):
+        self.lease_index.load(TRANSFORM, SHAPE)
+        mtime = self.meta_mtime()
+        self.lease_index.load(TRANSFORM, SHAPE)
+        self.assertEqual(self.meta_mtime(), mtime)
+        # Touched but unchanged shapefile: the contents hash still matches
+        os.utime(self.shp_path, ns=(mtime + 10**9, mtime + 10**9))
+        index = self.lease_index.load(TRANSFORM, SHAPE)
+        self.assertEqual(list(index.inside), [True, True, False, False])
+        # and the new size/mtime is recorded
+        index_dir = self.lease_index.index_dir(TRANSFORM, SHAPE)
+        with open(os.path.join(index_dir, grid_index.META_FNAME)) as rf:
+            self.assertIn(str(mtime + 10**9), rf.read())
+
+    def test_rebuild_after_shapefile_change(self):
+        self.lease_index.load(TRANSFORM, SHAPE)
+        self.write_layer([(-79.65, 35.75), (-79.55, 35.65)])
+        index = self.lease_index.load(TRANSFORM, SHAPE)
+        self.assertEqual(list(index.rows), [2, 3])
+        self.assertEqual(list(index.cols), [3, 4])
+        self.assertEqual(index.groups, ["U1", "U2"])
+
+    def test_separate_grids(self):
+        self.lease_index.load(TRANSFORM, SHAPE)
+        mtime = self.meta_mtime()
+        shifted = TRANSFORM * Affine.translation(1, 0)
+        grids = [(shifted, SHAPE, None), (TRANSFORM, (4, 9), None)]
+        grids.append((TRANSFORM, SHAPE, "EPSG:4269"))
+        index_dirs = {self.lease_index.index_dir(TRANSFORM, SHAPE)}
+        for transform, shape, crs in grids:
+            index_dirs.add(self.lease_index.index_dir(transform, shape, crs))
+            self.lease_index.load(transform, shape, crs)
+        self.assertEqual(len(index_dirs), 4)
+        self.assertEqual(
+            sorted(os.listdir(self.lease_index.cache_dir)),
+            sorted(os.path.basename(index_dir) for index_dir in index_dirs),
+        )
+        # The first grid's index was not rebuilt
+        self.lease_index.load(TRANSFORM, SHAPE)
+        self.assertEqual(self.meta_mtime(), mtime)
+        # Shifted one cell east: the first lease falls off the grid
+        self.assertFalse(self.lease_index.load(shifted, SHAPE).inside[0])
+        self.assertTrue(self.lease_index.load(TRANSFORM, (4, 9)).inside[2])
+
+    def test_native_grid(self):
+        # Lon/lat of known native cells: centers and points near cell corners
+        cells = [(10, 20), (150, 37), (299, 399), (0, 0)]
+        offsets = [(0.5, 0.5), (0.02, 0.97), (0.98, 0.03), (0.97, 0.98)]
+        to_lonlat = Transformer.from_crs(NATIVE_CRS, "EPSG:4326", always_xy=True)
+        points = []
+        for (row, col), (dy, dx) in zip(cells, offsets):
+            x, y = NATIVE_TRANSFORM * (col + dx, row + dy)
+            points.append(to_lonlat.transform(x, y))
+        points.append((-80.0, 45.0))  # north of the grid
+        self.write_layer(points)
+        index = grid_index.LeaseGridIndex(self.shp_path).load(
+            NATIVE_TRANSFORM, NATIVE_SHAPE, crs=NATIVE_CRS
+        )
+        self.assertEqual(list(index.rows[:4]), [row for row, _ in cells])
+        self.assertEqual(list(index.cols[:4]), [col for _, col in cells])
+        self.assertEqual(list(index.inside), [True] * 4 + [False])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
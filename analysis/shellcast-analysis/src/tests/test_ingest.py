@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the pipelined PQPF download and decode.
+
+Usage:
+    python -m pytest test_ingest.py -v
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import ingest  # noqa: E402
+
+NAMES = ["f030.grb", "f054.grb", "f078.grb"]
+
+
+def decode_grid(path):
+    # Picklable stand-in for subset_and_decode: a small cube derived from the name
+    seed = sum(os.path.basename(path).encode("utf-8"))
+    return np.random.default_rng(seed).random((3, 4, 5)).cumsum(axis=0)
+
+
+def decode_or_fail(path):
+    if path.endswith("f054.grb"):
+        raise ValueError(f"{path} --- decoding failed")
+    return decode_grid(path)
+
+
+class TestPipelined(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def log(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def fetch(self, name):
+        # Later forecast hours take longer to download
+        time.sleep(0.05 * (NAMES.index(name) + 1))
+        self.log(("fetched", name))
+        return f"/raw/{name}"
+
+    def decode(self, path):
+        self.log(("decoded", os.path.basename(path)))
+        return path.upper()
+
+    def test_decode_overlaps_download(self):
+        results = ingest.pipelined(NAMES, self.fetch, self.decode, fetch_workers=3)
+        self.assertEqual(list(results), NAMES)
+        self.assertEqual(results["f054.grb"], "/RAW/F054.GRB")
+        # The first file is decoded before the last transfer completes
+        self.assertLess(
+            self.events.index(("decoded", "f030.grb")),
+            self.events.index(("fetched", "f078.grb")),
+        )
+
+    def test_failed_and_skipped_files(self):
+        def fetch(name):
+            return None if name == "f054.grb" else self.fetch(name)
+
+        results = ingest.pipelined(
+            NAMES, fetch, self.decode, keep=lambda name: name != "f078.grb"
+        )
+        self.assertEqual(list(results), ["f030.grb"])
+
+    def test_bounded_queue(self):
+        # One slow decoder: a download waits for a queue slot before the next one
+        def decode(path):
+            time.sleep(0.1)
+            return self.decode(path)
+
+        names = [f"f{hour:03d}.grb" for hour in range(0, 120, 24)]
+        in_flight = []
+
+        def fetch(name):
+            with self.lock:
+                fetched = sum(event[0] == "fetched" for event in self.events)
+                decoded = sum(event[0] == "decoded" for event in self.events)
+                in_flight.append(fetched - decoded)
+                self.events.append(("fetched", name))
+            return name
+
+        ingest.pipelined(names, fetch, decode, fetch_workers=1, queue_size=1)
+        # At most one file queued and one being decoded
+        self.assertLessEqual(max(in_flight), 2)
+
+    def test_process_pool(self):
+        results = ingest.pipelined(
+            NAMES, lambda name: f"/raw/{name}", os.path.basename, decode_workers=2
+        )
+        self.assertEqual(results, {name: name for name in NAMES})
+
+    def test_process_pool_matches_serial(self):
+        serial = ingest.pipelined(NAMES, lambda name: f"/raw/{name}", decode_grid)
+        pooled = ingest.pipelined(
+            NAMES, lambda name: f"/raw/{name}", decode_grid, decode_workers=3
+        )
+        self.assertEqual(list(pooled), NAMES)
+        for name in NAMES:
+            np.testing.assert_array_equal(pooled[name], serial[name])
+
+    def test_process_pool_decode_error(self):
+        with self.assertRaisesRegex(ValueError, "f054.grb --- decoding failed"):
+            ingest.pipelined(
+                NAMES, lambda name: f"/raw/{name}", decode_or_fail, decode_workers=2
+            )
+
+    def test_decode_error(self):
+        def decode(path):
+            raise ValueError(path)
+
+        with self.assertRaises(ValueError):
+            ingest.pipelined(NAMES, lambda name: name, decode, queue_size=1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
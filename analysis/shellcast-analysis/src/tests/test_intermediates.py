@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the intermediate file storage.
+
+Usage:
+    python -m pytest test_intermediates.py -v
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import intermediates  # noqa: E402
+
+
+class TestScratch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, scratch, fname):
+        with open(scratch.path(fname), "w") as wf:
+            wf.write(fname)
+        return scratch.path(fname)
+
+    def test_removed_on_close(self):
+        with intermediates.Scratch("subsets") as scratch:
+            fpath = self.write(scratch, "sbs_f030.grb")
+            self.assertTrue(fpath.startswith(intermediates.ram_dir()))
+            self.assertTrue(os.path.exists(fpath))
+        self.assertFalse(os.path.exists(os.path.dirname(fpath)))
+        with self.assertRaises(RuntimeError):
+            scratch.path("sbs_f054.grb")
+
+    def test_removed_on_error(self):
+        with self.assertRaises(ValueError):
+            with intermediates.Scratch("subsets") as scratch:
+                directory = scratch.dir
+                raise ValueError
+        self.assertFalse(os.path.exists(directory))
+
+    def test_spill(self):
+        spill_dir = os.path.join(self.tmp_dir, "subsets")
+        os.makedirs(spill_dir)
+        self.write(intermediates.Scratch("old", spill_dir).open(), "stale.grb")
+        with intermediates.Scratch("subsets", spill_dir) as scratch:
+            self.assertTrue(scratch.spilled)
+            fpath = self.write(scratch, "sbs_f030.grb")
+        # Kept for debugging; the previous run's files are cleared
+        self.assertEqual(os.listdir(spill_dir), ["sbs_f030.grb"])
+        self.assertEqual(os.path.dirname(fpath), spill_dir)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
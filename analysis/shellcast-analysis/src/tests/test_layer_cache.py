@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the GeoParquet input layer cache.
+
+Usage:
+    python -m pytest test_layer_cache.py -v
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import layer_cache  # noqa: E402
+
+
+@unittest.skipIf(layer_cache.pyarrow is None, "pyarrow is not installed")
+class TestLayerCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.shp_path = os.path.join(self.tmp_dir.name, "leases.shp")
+        self.write_layer([1.0, 0.3, 2.5])
+        self.cache = layer_cache.LayerCache(self.shp_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_layer(self, rain_in):
+        gpd.GeoDataFrame(
+            {
+                "lease_id": [f"L{i}" for i in range(len(rain_in))],
+                "cmu_name": ["U001", "U002", "U001"][: len(rain_in)],
+                "days": [1, 2, 3][: len(rain_in)],
+                "rain_in": rain_in,
+                "geometry": [Point(i, i) for i in range(len(rain_in))],
+            },
+            crs="EPSG:4326",
+        ).to_file(self.shp_path)
+
+    def test_build_once(self):
+        gdf = self.cache.load()
+        self.assertTrue(os.path.exists(self.cache.parquet_path))
+        mtime = os.stat(self.cache.parquet_path).st_mtime_ns
+        self.cache.load()
+        self.assertEqual(os.stat(self.cache.parquet_path).st_mtime_ns, mtime)
+        self.assertEqual(gdf["lease_id"].tolist(), ["L0", "L1", "L2"])
+        self.assertEqual(gdf.crs.to_epsg(), 4326)
+
+    def test_columns(self):
+        gdf = self.cache.load(["cmu_name", "geometry"])
+        self.assertIsInstance(gdf, gpd.GeoDataFrame)
+        self.assertEqual(list(gdf.columns), ["cmu_name", "geometry"])
+        df = self.cache.load(["rain_in"])
+        self.assertNotIsInstance(df, gpd.GeoDataFrame)
+        self.assertEqual(df["rain_in"].tolist(), [1.0, 0.3, 2.5])
+
+    def test_compact_dtypes(self):
+        gdf = self.cache.load()
+        self.assertIsInstance(gdf["cmu_name"].dtype, pd.CategoricalDtype)
+        self.assertEqual(gdf["days"].dtype, "int8")
+        # 0.3 is not exact in float32
+        self.assertEqual(gdf["rain_in"].dtype, "float64")
+        df = layer_cache.compact_dtypes(pd.DataFrame({"rain_in": [0.5, 1.0, 4.0]}))
+        self.assertEqual(df["rain_in"].dtype, "float32")
+
+    def test_rebuild_on_change(self):
+        self.cache.load()
+        self.write_layer([1.0, 2.0])
+        df = self.cache.load(["rain_in"])
+        self.assertEqual(df["rain_in"].tolist(), [1.0, 2.0])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the multi-state PQPF run (requires the GDAL Python bindings).
+
+Usage:
+    python -m pytest test_multi_state.py -v
+"""
+
+import configparser
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    import multi_state
+except ImportError:
+    multi_state = None
+
+
+def settings():
+    config = configparser.ConfigParser()
+    config.read_dict(
+        {
+            "NC": {"LON_WE": "-79:-75", "LAT_SN": "33:37"},
+            "SC": {"LON_WE": "-81:-78", "LAT_SN": "32:34"},
+            "FL": {"LON_WE": "-80:-88", "LAT_SN": "31:24.5"},
+        }
+    )
+    return config
+
+
+@unittest.skipIf(multi_state is None, "GDAL Python bindings are not installed")
+class TestMultiState(unittest.TestCase):
+    def test_parse_range(self):
+        self.assertEqual(multi_state.parse_range("-79:-75"), (-79.0, -75.0))
+        self.assertEqual(multi_state.parse_range("31:24.5"), (24.5, 31.0))
+
+    def test_union_bbox(self):
+        config = settings()
+        self.assertEqual(
+            multi_state.union_bbox(config, ["NC", "SC"]), ("-81:-75", "32:37")
+        )
+        self.assertEqual(
+            multi_state.union_bbox(config, ["NC", "SC", "FL"]), ("-88:-75", "24.5:37")
+        )
+        self.assertEqual(multi_state.union_bbox(config, ["SC"]), ("-81:-78", "32:34"))
+
+    def test_shared_decoder(self):
+        procs = SimpleNamespace(config=settings(), wgrib2="wgrib2", grb_raw_dir="raw")
+        decoder = multi_state.SharedPQPF(procs, ["NC", "SC"], jobs=2).decoder()
+        self.assertEqual(decoder.args, ("wgrib2",))
+        self.assertEqual(decoder.keywords["lon_we"], "-81:-75")
+        self.assertEqual(decoder.keywords["lat_sn"], "32:37")
+        # All thresholds on the native grid: each state selects its own
+        self.assertIsNone(decoder.keywords["thresholds"])
+        self.assertIsNone(decoder.keywords["dst_srs"])
+
+    def test_run_states(self):
+        ran = []
+        # Every task waits for the others: the states run concurrently
+        barrier = threading.Barrier(3, timeout=5)
+
+        def task(state, error=None):
+            def run():
+                barrier.wait()
+                ran.append(state)
+                if error:
+                    raise error
+
+            return run
+
+        results = multi_state.run_states(
+            {
+                "NC": task("NC"),
+                "SC": task("SC", ValueError("SC failed")),
+                "FL": task("FL", SystemExit(1)),  # utils.error_process exits
+            }
+        )
+        self.assertEqual(results, {"NC": True, "SC": False, "FL": False})
+        self.assertEqual(sorted(ran), ["FL", "NC", "SC"])
+        self.assertEqual(multi_state.run_states({}), {})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the checkpointed analysis stages.
+
+Usage:
+    python -m pytest test_pipeline.py -v
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from pipeline import Pipeline, digest, shapefile_files  # noqa: E402
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.run_dir = os.path.join(self.tmp_dir, "runs", "2024-01-14")
+        self.input_path = os.path.join(self.tmp_dir, "input.txt")
+        self.output_path = os.path.join(self.tmp_dir, "output.txt")
+        with open(self.input_path, "w") as wf:
+            wf.write("1,2,3")
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_output(self):
+        self.calls.append("aggregate")
+        with open(self.output_path, "w") as wf:
+            wf.write("done")
+        return self.output_path
+
+    def _run(self, pipe):
+        pipe.stage(
+            "aggregate",
+            self._write_output,
+            params={"threshold": 1.0},
+            files=[self.input_path],
+            outputs=[self.output_path],
+        )
+        pipe.stage("persist", lambda: self.calls.append("persist"), deps=["aggregate"])
+
+    def test_rerun_skips_finished_stages(self):
+        self._run(Pipeline(self.run_dir))
+        self._run(Pipeline(self.run_dir))
+        self.assertEqual(self.calls, ["aggregate", "persist"])
+
+    def test_checkpointed_result_is_returned(self):
+        cubes = {"24h": np.arange(6.0).reshape(2, 3)}
+        Pipeline(self.run_dir).stage("decode", lambda: cubes)
+        result = Pipeline(self.run_dir).stage("decode", lambda: None)
+        np.testing.assert_array_equal(result["24h"], cubes["24h"])
+
+    def test_changed_input_reruns_dependants(self):
+        self._run(Pipeline(self.run_dir))
+        with open(self.input_path, "w") as wf:
+            wf.write("4,5,6")
+        self._run(Pipeline(self.run_dir))
+        self.assertEqual(self.calls, ["aggregate", "persist"] * 2)
+
+    def test_missing_output_reruns_stage(self):
+        self._run(Pipeline(self.run_dir))
+        os.remove(self.output_path)
+        self._run(Pipeline(self.run_dir))
+        # Same output content, so the insert is not repeated
+        self.assertEqual(self.calls, ["aggregate", "persist", "aggregate"])
+
+    def test_failed_stage_is_not_recorded(self):
+        pipe = Pipeline(self.run_dir)
+
+        def fail():
+            raise RuntimeError("SMTP down")
+
+        with self.assertRaises(RuntimeError):
+            pipe.stage("notify", fail)
+        self.assertIsNone(Pipeline(self.run_dir).stage_key("notify"))
+
+    def test_checkpoint_if(self):
+        Pipeline(self.run_dir).stage("download", lambda: False, checkpoint_if=bool)
+        self.assertTrue(
+            Pipeline(self.run_dir).stage("download", lambda: True, checkpoint_if=bool)
+        )
+
+    def test_old_runs_are_pruned(self):
+        runs_root = os.path.dirname(self.run_dir)
+        for day in range(1, 10):
+            os.makedirs(os.path.join(runs_root, f"2024-01-0{day}"))
+        Pipeline(self.run_dir, keep_runs=3)
+        self.assertEqual(
+            sorted(os.listdir(runs_root)), ["2024-01-08", "2024-01-09", "2024-01-14"]
+        )
+
+    def test_digest(self):
+        a = {"x": np.zeros(3), "t": (1.0, 2.0)}
+        self.assertEqual(digest(a), digest({"t": (1.0, 2.0), "x": np.zeros(3)}))
+        self.assertNotEqual(digest(a), digest({"x": np.ones(3), "t": (1.0, 2.0)}))
+
+    def test_shapefile_files(self):
+        stem = os.path.join(self.tmp_dir, "leases")
+        for ext in ("shp", "shx", "dbf"):
+            open(f"{stem}.{ext}", "w").close()
+        self.assertEqual(len(shapefile_files(f"{stem}.shp")), 3)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
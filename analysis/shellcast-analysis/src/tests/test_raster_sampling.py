@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Unit tests for vectorized lease-to-pixel sampling.
+
+Usage:
+    python -m pytest test_raster_sampling.py -v
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+from affine import Affine
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import raster_sampling  # noqa: E402
+
+
+class TestRasterSampling(unittest.TestCase):
+    def setUp(self):
+        # 3 x 4 grid with 10 m pixels, upper-left corner at (100, 200)
+        self.transform = Affine(10.0, 0.0, 100.0, 0.0, -10.0, 200.0)
+        self.stack = np.arange(2 * 3 * 4, dtype="float32").reshape(2, 3, 4)
+
+    def test_rowcol_index(self):
+        rows, cols, inside = raster_sampling.rowcol_index(
+            self.transform, (3, 4), [105, 139.9, 99], [195, 170.1, 195]
+        )
+        self.assertEqual(list(rows[:2]), [0, 2])
+        self.assertEqual(list(cols[:2]), [0, 3])
+        self.assertEqual(list(inside), [True, True, False])
+
+    def test_band_lookup(self):
+        idx = raster_sampling.band_lookup([1.0, 2.5, 4.0], [4.0, 1.0, 3.0, 2.5])
+        self.assertEqual(list(idx), [2, 0, -1, 1])
+        self.assertEqual(list(raster_sampling.band_lookup([], [1.0])), [-1])
+
+    def test_gather(self):
+        rows, cols, inside = raster_sampling.rowcol_index(
+            self.transform, (3, 4), [105, 125, 99, 135], [195, 185, 195, 175]
+        )
+        band_idx = np.array([0, 1, 0, -1])
+        values = raster_sampling.gather(self.stack, band_idx, rows, cols, inside)
+        self.assertEqual(values[0], self.stack[0, 0, 0])
+        self.assertEqual(values[1], self.stack[1, 1, 2])
+        self.assertTrue(np.isnan(values[2]))
+        self.assertTrue(np.isnan(values[3]))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the run telemetry.
+
+Usage:
+    python -m pytest test_telemetry.py -v
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import telemetry  # noqa: E402
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        telemetry._records.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        telemetry._records.clear()
+
+    def test_nested_records(self):
+        with telemetry.record("NC.decode"):
+            with telemetry.record("PQPFProcs.grb_to_cubes"):
+                sum(range(10000))
+        stages = [r["stage"] for r in telemetry.records()]
+        self.assertEqual(stages, ["NC.decode/PQPFProcs.grb_to_cubes", "NC.decode"])
+        outer = telemetry.records()[1]
+        self.assertTrue(outer["ok"])
+        self.assertGreaterEqual(outer["wall_s"], 0)
+        self.assertGreater(outer["peak_rss_mb"], 0)
+
+    def test_failed_stage(self):
+        with self.assertRaises(SystemExit):
+            with telemetry.record("persist"):
+                sys.exit(1)
+        self.assertFalse(telemetry.records()[0]["ok"])
+
+    def test_subprocess_cpu(self):
+        with telemetry.record("wgrib2"):
+            subprocess.run(
+                [sys.executable, "-c", "sum(i * i for i in range(2000000))"],
+                check=True,
+            )
+        self.assertGreater(telemetry.records()[0]["subprocess_cpu_s"], 0)
+
+    def test_timed_decorator(self):
+        class Procs:
+            @telemetry.timed()
+            def grb_to_cubes(self, value):
+                return value * 2
+
+        self.assertEqual(Procs().grb_to_cubes(2), 4)
+        self.assertTrue(telemetry.records()[0]["stage"].endswith("Procs.grb_to_cubes"))
+
+    def test_write_report(self):
+        with telemetry.record("download"):
+            with open(os.path.join(self.tmp_dir, "data.bin"), "wb") as wf:
+                wf.write(os.urandom(1024))
+        fpath = os.path.join(self.tmp_dir, "reports", "run_nc.json")
+        telemetry.write_report(fpath)
+        with open(fpath, "r") as rf:
+            report = json.load(rf)
+        self.assertEqual(report["stages"][0]["stage"], "download")
+        self.assertIn("write_bytes", report["stages"][0])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
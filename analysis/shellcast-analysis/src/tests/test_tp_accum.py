@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the FL rolling total precipitation accumulation store.
+
+Usage:
+    python -m pytest test_tp_accum.py -v
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from fl_pqpf.tp_accum import (  # noqa: E402
+    TPAccumulationStore,
+    day_key,
+    read_accumulation_tiffs,
+    write_accumulation_tiffs,
+)
+
+try:
+    from fl_pqpf.tp_xmrg import TPXMRG
+except ImportError:
+    TPXMRG = None
+
+TRANSFORM = Affine(0.5, 0.0, -88.0, 0.0, -0.5, 31.0)
+
+
+def read_rain(fpath):
+    # Test hourly files hold the rain of every cell in inches
+    with open(fpath, "r") as rf:
+        value = float(rf.read())
+    return np.full((2, 3), value), TRANSFORM, "EPSG:4326"
+
+
+class TestTPAccumulationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.raw_dir = os.path.join(self.tmp_dir, "raw")
+        os.makedirs(self.raw_dir)
+        self.reads = []
+        # Three days of hourly files, most recent day first; each hour of day d rains d inches
+        self.days = []
+        for day in range(1, 4):
+            hours = []
+            for hour in range(24):
+                fpath = os.path.join(
+                    self.raw_dir, f"xmrg01{10 - day:02d}2024{hour:02d}z.grb"
+                )
+                with open(fpath, "w") as wf:
+                    wf.write(str(day))
+                hours.append(fpath)
+            self.days.append(hours)
+        self.store = TPAccumulationStore(
+            os.path.join(self.tmp_dir, "daily"), self.read_hour
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_hour(self, fpath):
+        self.reads.append(fpath)
+        return read_rain(fpath)
+
+    def test_accumulations(self):
+        # Running sums from the oldest day
+        accums = self.store.accumulations(self.days)
+        self.assertEqual(sorted(accums), [24, 48, 72])
+        self.assertTrue(np.allclose(accums[24][0], 24 * 3))
+        self.assertTrue(np.allclose(accums[48][0], 24 * (3 + 2)))
+        self.assertTrue(np.allclose(accums[72][0], 24 * (3 + 2 + 1)))
+        self.assertEqual(accums[72][1], TRANSFORM)
+
+    def test_trailing_accumulations(self):
+        accums = self.store.accumulations(self.days, trailing=True)
+        self.assertTrue(np.allclose(accums[24][0], 24 * 1))
+        self.assertTrue(np.allclose(accums[48][0], 24 * (1 + 2)))
+        self.assertTrue(np.allclose(accums[72][0], 24 * (1 + 2 + 3)))
+
+    def test_only_new_hours_are_read(self):
+        self.store.accumulations(self.days[1:])
+        self.assertEqual(len(self.reads), 48)
+        self.reads.clear()
+        self.store.accumulations(self.days)
+        self.assertEqual(sorted(self.reads), sorted(self.days[0]))
+
+    def test_changed_hour_invalidates_day(self):
+        self.store.accumulations(self.days)
+        with open(self.days[2][0], "w") as wf:
+            wf.write("10")
+        self.reads.clear()
+        accums = self.store.accumulations(self.days)
+        self.assertEqual(sorted(self.reads), sorted(self.days[2]))
+        self.assertTrue(np.allclose(accums[72][0], 24 * 6 + 7))
+
+    def test_prune(self):
+        self.store.accumulations(self.days)
+        self.store.prune(self.days[:2])
+        stems = {f.split(".")[0] for f in os.listdir(self.store.store_dir)}
+        self.assertEqual(stems, {day_key(self.days[0]), day_key(self.days[1])})
+
+    def test_write_accumulation_tiffs(self):
+        out_dir = os.path.join(self.tmp_dir, "outputs")
+        os.makedirs(out_dir)
+        open(os.path.join(out_dir, "tp_144h.tif"), "w").close()  # stale output
+        tiffs = write_accumulation_tiffs(
+            self.store.accumulations(self.days[:2]), out_dir
+        )
+        self.assertEqual(sorted(os.listdir(out_dir)), ["tp_24h.tif", "tp_48h.tif"])
+        with rasterio.open(tiffs[1]) as src:
+            self.assertEqual(src.transform, TRANSFORM)
+            self.assertTrue(np.allclose(src.read(1), 72))
+
+    def test_read_accumulation_tiffs(self):
+        out_dir = os.path.join(self.tmp_dir, "outputs")
+        write_accumulation_tiffs(self.store.accumulations(self.days[:2]), out_dir)
+        hours, stack, transform = read_accumulation_tiffs(out_dir)
+        self.assertEqual(hours, [24, 48])
+        self.assertEqual(stack.shape[0], 2)
+        self.assertEqual(transform, TRANSFORM)
+        self.assertTrue(np.allclose(stack[1], 72))
+        self.assertEqual(read_accumulation_tiffs(self.tmp_dir)[:2], ([], None))
+
+
+def window_names(run_date, hour_from=7, days=6):
+    # Hourly file names of the window before hour_from on the run date, oldest first
+    end = datetime.combine(run_date, time(hour_from))
+    return [
+        f"xmrg{(end - timedelta(hours=hours)).strftime('%m%d%Y%H')}z.grb"
+        for hours in range(days * 24, 0, -1)
+    ]
+
+
+def write_window(raw_dir, names):
+    # 1 in/hour over the last day, 5 in/hour over the first day
+    for idx, name in enumerate(names):
+        rain = 1 if idx >= len(names) - 24 else 5 if idx < 24 else 0
+        with open(os.path.join(raw_dir, name), "w") as wf:
+            wf.write(str(rain))
+
+
+class TestAccumulationWindow(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = TPAccumulationStore(os.path.join(self.tmp_dir, "daily"), read_rain)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_oldest_first_window(self):
+        # tp_{N}h keeps the meaning of xmrg_proc.sh: timcumsum over the oldest-first
+        # series, so tp_24h is the day that ended 5 days before 7:00 AM
+        names = window_names(date(2024, 1, 14))
+        self.assertEqual(names[0], "xmrg0108202407z.grb")
+        self.assertEqual(names[-1], "xmrg0114202406z.grb")
+        write_window(self.tmp_dir, names)
+        fpaths = [os.path.join(self.tmp_dir, name) for name in names]
+        # Days as TPXMRG passes them: 24-hour chunks, most recent day first
+        days = [fpaths[end - 24 : end] for end in range(len(fpaths), 0, -24)]
+        accums = self.store.accumulations(days)
+        self.assertEqual(sorted(accums), [24, 48, 72, 96, 120, 144])
+        self.assertTrue(np.allclose(accums[24][0], 5 * 24))
+        self.assertTrue(np.allclose(accums[120][0], 5 * 24))
+        self.assertTrue(np.allclose(accums[144][0], 5 * 24 + 24))
+        # Only the newest day differs from the next day's window
+        self.assertEqual(day_key(days[0]), "xmrg0113202407z-xmrg0114202406z")
+
+
+@unittest.skipIf(TPXMRG is None, "GDAL Python bindings are not installed")
+class TestTPXMRGWindow(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.outputs_dir = os.path.join(self.tmp_dir, "outputs")
+        os.makedirs(self.outputs_dir)
+        self.tp = TPXMRG(
+            "FL",
+            7,
+            run_date=date(2024, 1, 14),
+            archive_dir=os.path.join(self.tmp_dir, "raw"),
+            outputs_dir=self.outputs_dir,
+            store_dir=os.path.join(self.tmp_dir, "daily"),
+        )
+        self.tp.store.read_hour = read_rain
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_oldest_first_window(self):
+        names = self.tp.list_required_tp_data()
+        self.assertEqual(names, window_names(date(2024, 1, 14)))
+        write_window(self.tp.tp_raw_dir, names)
+        self.tp.main()
+        hours, stack, _ = read_accumulation_tiffs(self.outputs_dir)
+        self.assertEqual(hours, [24, 48, 72, 96, 120, 144])
+        self.assertTrue(np.allclose(stack[0], 5 * 24))
+        self.assertTrue(np.allclose(stack[4], 5 * 24))
+        self.assertTrue(np.allclose(stack[5], 5 * 24 + 24))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
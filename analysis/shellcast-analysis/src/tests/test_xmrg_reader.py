@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the native XMRG reader (requires the GDAL Python bindings).
+
+Usage:
+    python -m pytest test_xmrg_reader.py -v
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    from fl_pqpf.xmrg_reader import XMRGReader, apply_warp_index
+    from osgeo import gdal, osr
+except ImportError:
+    gdal = None
+
+# HRAP-like polar stereographic grid over Florida
+POLAR_STEREO = (
+    "+proj=stere +lat_0=90 +lat_ts=60 +lon_0=-105 +k=1 +x_0=0 +y_0=0 "
+    "+a=6371200 +b=6371200 +units=m +no_defs"
+)
+BOUNDS = (-88, 24, -80, 31)
+
+
+@unittest.skipIf(gdal is None, "GDAL Python bindings are not installed")
+class TestXMRGReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.tmp_dir, "xmrg0114202406z.tif")
+        srs = osr.SpatialReference()
+        srs.ImportFromProj4(POLAR_STEREO)
+        ds = gdal.GetDriverByName("GTiff").Create(
+            self.fpath, 320, 320, 1, gdal.GDT_Float32
+        )
+        ds.SetGeoTransform((1800000.0, 4762.5, 0.0, -5950000.0, 0.0, -4762.5))
+        ds.SetProjection(srs.ExportToWkt())
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(-9999)
+        data = np.arange(320 * 320, dtype="float32").reshape(320, 320) % 97
+        data[150:160, 150:160] = -9999
+        band.WriteArray(data)
+        ds = None
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_matches_gdal_warp(self):
+        reader = XMRGReader(self.tmp_dir, "EPSG:4326", BOUNDS, 1.0)
+        data, transform, _ = reader.read(self.fpath)
+        warp_options = gdal.WarpOptions(
+            format="MEM",
+            dstSRS="EPSG:4326",
+            outputBounds=BOUNDS,
+            resampleAlg="near",
+            outputType=gdal.GDT_Float64,
+            dstNodata=np.nan,
+        )
+        expected = gdal.Warp("", self.fpath, options=warp_options)
+        self.assertEqual(transform.to_gdal(), expected.GetGeoTransform())
+        np.testing.assert_array_equal(data, expected.GetRasterBand(1).ReadAsArray())
+
+    def test_index_is_cached(self):
+        XMRGReader(self.tmp_dir, "EPSG:4326", BOUNDS, 1.0).read(self.fpath)
+        cached = [f for f in os.listdir(self.tmp_dir) if f.endswith(".npy")]
+        self.assertEqual(len(cached), 1)
+        reader = XMRGReader(self.tmp_dir, "EPSG:4326", BOUNDS, 1.0)
+        reader._build_index = None  # a rebuild would fail
+        reader.read(self.fpath)
+
+    def test_incomplete_index_is_rebuilt(self):
+        expected, _, _ = XMRGReader(self.tmp_dir, "EPSG:4326", BOUNDS, 1.0).read(
+            self.fpath
+        )
+        self.assertFalse([f for f in os.listdir(self.tmp_dir) if f.endswith(".tmp")])
+        # An index without its metadata was not completely written
+        for fname in os.listdir(self.tmp_dir):
+            if fname.endswith(".json"):
+                os.remove(os.path.join(self.tmp_dir, fname))
+            elif fname.endswith(".npy"):
+                with open(os.path.join(self.tmp_dir, fname), "r+b") as wf:
+                    wf.truncate(64)
+        data, _, _ = XMRGReader(self.tmp_dir, "EPSG:4326", BOUNDS, 1.0).read(self.fpath)
+        np.testing.assert_array_equal(data, expected)
+
+    def test_apply_warp_index(self):
+        data = np.array([[1.0, 2.0], [-9999.0, 4.0]])
+        index = np.array([[3, 0], [2, -1]])
+        out = apply_warp_index(data, index, nodata=-9999.0)
+        self.assertEqual(out[0, 0], 4.0)
+        self.assertEqual(out[0, 1], 1.0)
+        self.assertTrue(np.isnan(out[1, 0]))
+        self.assertTrue(np.isnan(out[1, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
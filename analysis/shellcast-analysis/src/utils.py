@@ -10,13 +10,15 @@ import subprocess
 import sys
 from decimal import ROUND_HALF_DOWN, ROUND_HALF_UP, Decimal, localcontext
 from email.message import EmailMessage
-from ftplib import FTP, error_perm
 from typing import List
 
 import constants as ct
-import geopandas as gpd
-import pandas as pd
+import db_load
+import grib_inventory
+import layer_cache
 from cryptography.fernet import Fernet
+from ftp_download import FTPDownloader
+from grib_inventory import GribRangeFetcher
 from google.cloud import storage
 from osgeo import gdal
 from sqlalchemy import create_engine, text
@@ -224,13 +226,15 @@ def regex_find(regex: str, string: str):
 
 def list_grbs_not_today(file_dir: str) -> List[str]:
     """
-    Finds dated GRB and other than GRB files.
+    Finds dated GRB and other than GRB files. Today's partial downloads are kept so
+    they can be resumed, and today's GRIB inventories and message indexes so they
+    are built once.
     Args:
         file_dir (srt): File directory
     """
     files = []
     for f in os.listdir(file_dir):
-        if f.endswith("grb"):
+        if f.endswith(("grb", ".part", *grib_inventory.SUFFIXES)):
             match = regex_find(ct.REG_PATTERN_TODAY, f)
             if match is None:  # GRB not today's data
                 files.append(f)
@@ -340,39 +344,43 @@ def round_half_down(num):
         return n.to_integral_value()
 
 
-def download_grbs(grb_raw_dir, files, ftp_url, ftp_cwd) -> None:
+def grb_fetcher(grb_raw_dir, ftp_url, ftp_cwd, thresholds=None):
     """
-    Download PQPF GRB files from FTP.
+    Per-file PQPF GRB download. With ct.GRB_BYTE_RANGES only the probability
+    messages of the thresholds are downloaded (see grib_inventory). Each
+    downloaded file is indexed once for every consumer.
     Args:
         grb_raw_dir (str): Path to GRIB raw files
-        files (List[str]): List of GRB files
         ftp_url (str): FTP URL
         ftp_cwd (str): FTP current working directory
+        thresholds (List[float]): Rainfall thresholds (in) decoded by the run, all
+            thresholds when None
+    Returns (tuple[FTPDownloader, callable]): Downloader (close it when done) and
+        fetch(file name) -> local path, None when the download failed
     """
-    logger.info("[Download GRIBs from FTP]")
-    try:
-        if files:
-            ftp = FTP(ftp_url)
-            ftp.login()
-            ftp.encoding = "utf-8"
-            ftp.cwd(ftp_cwd)
-            for fname in files:
-                grb_path = os.path.join(grb_raw_dir, fname)
-                try:
-                    with open(grb_path, "wb") as f:
-                        ftp.retrbinary("RETR " + fname, f.write)
-                    logger.info(f"{fname} downloaded.")
-
-                except error_perm:
-                    print("ERR", fname)
-                    os.unlink(grb_path)
-            ftp.quit()
+    downloader = FTPDownloader(
+        ftp_url,
+        ftp_cwd,
+        max_workers=ct.FTP_MAX_WORKERS,
+        retries=ct.FTP_RETRIES,
+    )
+    ranges = GribRangeFetcher(downloader, grb_raw_dir, thresholds)
+
+    def fetch(fname):
+        fpath = os.path.join(grb_raw_dir, fname)
+        if ct.GRB_BYTE_RANGES:
+            ok = ranges.fetch(fname)
         else:
-            logger.info("Skip download")
-        logger.info(done_str)
-    except Exception as e:
-        msg = "GRB file download failed."
-        error_process(msg, e)
+            # Full files replace message subsets of earlier runs
+            if os.path.exists(grib_inventory.sidecar_path(fpath)):
+                os.remove(grib_inventory.sidecar_path(fpath))
+            ok = downloader.fetch(fname, fpath)
+        if not ok:
+            return None
+        grib_inventory.MessageIndex.for_file(fpath)
+        return fpath
+
+    return downloader, fetch
 
 
 def get_thresholds(lease_shp, thresholds_col_name):
@@ -386,7 +394,7 @@ def get_thresholds(lease_shp, thresholds_col_name):
     """
     logger.info("[Get unique rainfall thresholds]")
     try:
-        gdf = gpd.read_file(lease_shp)
+        gdf = layer_cache.read_layer(lease_shp, [thresholds_col_name])
         thresholds = sorted(
             gdf[thresholds_col_name].unique()
         )  # Returns list of class numpy.float64
@@ -422,27 +430,48 @@ def db_connection_test(connect_str):
         error_process(msg, e)
 
 
-def save_to_db(connect_str, csv_path) -> None:
+def save_df_to_db(connect_str, df, created=None) -> None:
     """
     Saves the data to DB.
     Args:
         connect_str (str): DB connection string
-        csv_path (str): CMU probabilities CSV file path
+        df (pd.DataFrame): CMU probabilities (unit column and prob_*_perc columns)
+        created (datetime): Run time stored with the rows, defaults to the DB server
+            time (its date is the forecast date)
     """
     logger.info("[Save to DB]")
     try:
         engine = create_engine(connect_str)
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path, index_col=False)
-            if len(df.index) > 0:
+        if df is not None and len(df.index) > 0:
+            with engine.connect() as conn:
+                upsert = db_load.has_forecast_date(conn)
+            if upsert:
+                counts = db_load.upsert_probabilities(
+                    engine, df, created=created, chunk_size=ct.DB_CHUNK_SIZE
+                )
+                logger.info(f"{counts['upserted']} rows affected in DB.")
+            elif created is not None:
+                # Past days can only be keyed by forecast date
+                raise ValueError(
+                    "cmu_probabilities has no forecast_date column to store "
+                    f"{created.date()} (see cmu_probabilities_forecast_date.sql)"
+                )
+            else:
+                # Table without the (unit, forecast_date) key: see
+                # db_scripts/cmu_probabilities_forecast_date.sql
+                logger.warning("cmu_probabilities has no forecast_date column")
                 with engine.begin() as conn:
                     conn.execute(text("CALL DeleteCmuProbsToday()"))
                     df.to_sql(
-                        "cmu_probabilities", con=conn, if_exists="append", index=False
+                        "cmu_probabilities",
+                        con=conn,
+                        if_exists="append",
+                        index=False,
+                        method="multi",
+                        chunksize=ct.DB_CHUNK_SIZE,
                     )
-                    queryset = conn.execute(text("CALL SelectCmuProbsToday()"))
-                    if queryset.rowcount == len(df.index):
-                        logger.info(f"{queryset.rowcount} rows added to DB.")
+                logger.info(f"{len(df.index)} rows added to DB.")
+        engine.dispose()
         logger.info(done_str)
     except Exception as e:
         msg = "Save to DB failed."